@@ -4,3 +4,8 @@
 class LoginException(Exception):
     """Exception raised when logging into a site fails."""
     pass
+
+
+class ParserException(Exception):
+    """Exception raised when a worker process fails to parse a page."""
+    pass
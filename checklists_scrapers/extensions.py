@@ -25,6 +25,11 @@ class SpiderStatusReport(object):
 
     If the LOG_LEVEL is set to 'DEBUG' then the status report is also written
     to the directory where the checklists are downloaded to.
+
+    The report also lists the crawler stats recorded by the extensions and
+    middleware in this project, i.e. the stats where the name starts with
+    'checklists/', for example the number of hits and misses for the cache
+    of API responses.
     """
 
     template = """Scraper: %(spider)s
@@ -46,11 +51,21 @@ Time: %(time)s
 ------------
 %(warnings)s
 
+--------------
+  Statistics
+--------------
+%(statistics)s
+
 """
 
+    stats_prefix = 'checklists/'
+
+    def __init__(self, stats):
+        self.stats = stats
+
     @classmethod
     def from_crawler(cls, crawler):
-        extension = cls()
+        extension = cls(crawler.stats)
         crawler.signals.connect(extension.spider_closed,
                                 signal=signals.spider_closed)
         return extension
@@ -67,6 +82,7 @@ Time: %(time)s
             'checklists': 'No checklists downloaded',
             'errors': 'No errors reported',
             'warnings': 'No warnings reported',
+            'statistics': 'No statistics recorded',
         }
 
         checklists = getattr(spider, 'checklists', [])
@@ -123,6 +139,17 @@ Time: %(time)s
 
             context['warnings'] = '\n'.join(summary).encode('utf-8')
 
+        stats = self.stats.get_stats(spider=spider)
+        names = sorted(name for name in stats
+                       if name.startswith(self.stats_prefix))
+
+        if names:
+            summary = []
+            for name in names:
+                summary.append("%s: %s" % (
+                    name[len(self.stats_prefix):], stats[name]))
+            context['statistics'] = '\n'.join(summary)
+
         report = self.template % context
 
         if spider.settings['LOG_LEVEL'] == 'DEBUG':
@@ -0,0 +1,223 @@
+"""Merge checklists from the eBird API with saved checklist web pages.
+
+The eBird spider merges each checklist with its web page as the pages are
+downloaded. For backfills the pages can be downloaded first and saved to a
+local directory, one file per checklist named <identifier>.html, and then
+merged offline with the checklists from the API. The pages are parsed and
+merged in a pool of worker processes so months of checklists can be
+reprocessed using all the available cores without touching the network.
+
+To merge the checklists run the module as follows:
+
+    python -m checklists_scrapers.merge <checklists> <pages> <output> \
+        [<processes>]
+
+where,
+
+    <checklists> is either a directory containing the checklists from the
+    API, one checklist per JSON file, or a JSON Lines file with one checklist
+    per line. Use - to read the JSON Lines from stdin.
+
+    <pages> is the directory containing the saved checklist web pages.
+
+    <output> is the directory where the merged checklists are written.
+
+    <processes> is the number of worker processes, the default is the number
+    of cores.
+
+Checklists without a saved web page are written using only the data from the
+API, the same as the spider does when a page cannot be downloaded.
+"""
+
+import json
+import os
+import sys
+import traceback
+
+from itertools import imap
+from multiprocessing import Pool
+
+from scrapy.crawler import Crawler
+from scrapy.http import HtmlResponse
+from scrapy.settings import CrawlerSettings
+
+from checklists_scrapers import settings
+from checklists_scrapers.spiders.ebird_spider import EBirdSpider
+from checklists_scrapers.spiders.writers import get_writer
+from checklists_scrapers.utils import list_files, open_file, \
+    read_json_lines
+
+
+# The spider used to merge the checklists in each process. It is created
+# the first time a checklist is merged since the crawler cannot be passed
+# to the worker processes.
+_spider = None
+
+
+def get_spider():
+    """Get the spider used to merge the checklists.
+
+    Returns:
+        EBirdSpider: a spider configured from the project settings.
+    """
+    global _spider
+    if _spider is None:
+        crawler = Crawler(CrawlerSettings(settings))
+        # The checklists are written as they are returned by the worker
+        # processes. The background writer threads need the reactor, which
+        # is not running, so they are disabled.
+        crawler.settings.overrides['DOWNLOAD_WRITER_THREADS'] = 0
+        crawler.configure()
+        _spider = EBirdSpider('merge')
+        _spider.set_crawler(crawler)
+    return _spider
+
+
+def read_checklists(source):
+    """Read the checklists extracted from the eBird API.
+
+    Args:
+        source (str): the path to a directory containing one checklist per
+            JSON file or the path to a JSON Lines file with one checklist per
+            line. If the path is - then the JSON Lines are read from stdin.
+            Files compressed with gzip or bz2 are decompressed as they are
+            read.
+
+    Returns:
+        generator: the checklists, one at a time, so only the checklists
+            being merged are held in memory.
+    """
+    if os.path.isdir(source):
+        for path in sorted(list_files(source, '.json')):
+            with open_file(path) as fp:
+                yield json.load(fp)
+    else:
+        fp = sys.stdin if source == '-' else open_file(source)
+        try:
+            for checklist in read_json_lines(fp):
+                yield checklist
+        finally:
+            if fp is not sys.stdin:
+                fp.close()
+
+
+def get_page_path(directory, identifier):
+    """Get the path to the saved web page for a checklist.
+
+    Args:
+        directory (str): the directory containing the web pages.
+        identifier (str): the identifier for the checklist.
+
+    Returns:
+        str: the path to the file containing the web page.
+    """
+    return os.path.join(directory, '%s.html' % identifier)
+
+
+def merge_checklist(args):
+    """Merge a checklist with its saved web page in a worker process.
+
+    Args:
+        args (tuple): the checklist from the API and the path to the web page.
+            A single argument is used so the function can be passed to
+            Pool.imap_unordered().
+
+    Returns:
+        tuple: the checklist, merged with the web page if it was found, and
+            the list of warnings generated. Exceptions are not raised since
+            they might not be picklable, instead the checklist from the API is
+            returned with the traceback as the warning.
+    """
+    original, path = args
+    spider = get_spider()
+    identifier = original['identifier']
+    url = spider.checklist_url % identifier
+
+    if not os.path.exists(path):
+        original['source']['url'] = url
+        return original, ["Checklist web page was not found: %s" % path]
+
+    try:
+        with open(path, 'rb') as fp:
+            response = HtmlResponse(url=url, body=fp.read())
+        update = spider.html_parser(response).get_checklist()
+        del spider.warnings[:]
+        checklist = spider.merge_checklists(original, update)
+        checklist['source']['url'] = url
+        warnings = [message for item, messages in spider.warnings
+                    for message in messages]
+        return checklist, warnings
+    except Exception:
+        original['source']['url'] = url
+        return original, [traceback.format_exc()]
+
+
+def merge_checklists(source, pages, directory, processes=None):
+    """Merge the checklists from the API with the saved web pages.
+
+    Args:
+        source (str): the directory or JSON Lines file containing the
+            checklists from the API. See read_checklists().
+        pages (str): the directory containing the saved web pages.
+        directory (str): the directory where the merged checklists are
+            written.
+
+    Kwargs:
+        processes (int): the number of worker processes. The default, None,
+            uses one process per core. If it is 1 then the checklists are
+            merged in the current process.
+
+    Returns:
+        list(tuple): the checklists that generated warnings, along with the
+            list of warnings for each.
+
+    The merged checklists are written in the same way as the eBird spider,
+    using the DOWNLOAD_OUTPUT setting, so the output can be loaded in exactly
+    the same way.
+    """
+    tasks = ((checklist, get_page_path(pages, checklist['identifier']))
+             for checklist in read_checklists(source))
+
+    if processes == 1:
+        pool = None
+        results = imap(merge_checklist, tasks)
+    else:
+        pool = Pool(processes)
+        results = pool.imap_unordered(merge_checklist, tasks, 16)
+
+    writer = get_writer(get_spider().settings, directory, 'ebird')
+    warnings = []
+
+    try:
+        for checklist, messages in results:
+            writer.write(checklist['source']['name'], checklist)
+            if messages:
+                warnings.append((checklist, messages))
+    finally:
+        writer.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return warnings
+
+
+def main(argv):
+    if len(argv) not in (4, 5):
+        print __doc__
+        return 1
+
+    processes = int(argv[4]) if len(argv) > 4 else None
+
+    if not os.path.exists(argv[3]):
+        os.makedirs(argv[3])
+
+    for checklist, messages in merge_checklists(argv[1], argv[2], argv[3],
+                                                processes):
+        print "%s: %s" % (checklist['identifier'], ' '.join(messages))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
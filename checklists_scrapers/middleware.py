@@ -0,0 +1,149 @@
+"""Downloader middleware for customizing scrapy."""
+
+import hashlib
+import json
+import os
+import time
+
+from scrapy import log
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import TextResponse
+
+
+class APICacheMiddleware(object):
+    """Cache the responses from calls to an API on the local disk.
+
+    Only requests where the metadata contains the key 'cache' set to True
+    are cached. That allows the spiders to cache the calls to an API, which
+    are repeated when a spider is run again after a failure or for
+    debugging, without caching the web pages that are scraped.
+
+    Each response is saved in a file named using the SHA-1 digest of the
+    URL. The following settings control the cache:
+
+    API_CACHE_ENABLED: whether the cache is used.
+
+    API_CACHE_DIR: the directory where responses are saved. If not set the
+    directory 'cache' in DOWNLOAD_DIR is used.
+
+    API_CACHE_EXPIRATION: the number of seconds a response remains valid.
+
+    API_CACHE_SIZE: the maximum size of the cache in MB. When the limit is
+    exceeded the least recently used responses are removed.
+
+    The number of hits and misses are recorded in the crawler stats.
+    """
+
+    def __init__(self, directory, expiration, size, stats):
+        self.directory = directory
+        self.expiration = expiration
+        self.size = size
+        self.stats = stats
+        self.files = {}
+        self.total = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings['API_CACHE_ENABLED']:
+            raise NotConfigured
+        directory = settings['API_CACHE_DIR'] or \
+            os.path.join(settings['DOWNLOAD_DIR'], 'cache')
+        middleware = cls(directory, int(settings['API_CACHE_EXPIRATION']),
+                         int(settings['API_CACHE_SIZE']) * 1024 * 1024,
+                         crawler.stats)
+        crawler.signals.connect(middleware.spider_opened,
+                                signal=signals.spider_opened)
+        return middleware
+
+    def spider_opened(self, spider):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            if filename.endswith('.tmp'):
+                os.remove(path)
+                continue
+            self.files[path] = os.path.getsize(path)
+        self.total = sum(self.files.values())
+        spider.log("Caching API responses in %s" % self.directory, log.INFO)
+
+    def get_path(self, url):
+        """Get the path to the file where the response for a URL is saved."""
+        return os.path.join(self.directory, hashlib.sha1(url).hexdigest())
+
+    def process_request(self, request, spider):
+        if not request.meta.get('cache'):
+            return None
+
+        path = self.get_path(request.url)
+        response = None
+
+        if path in self.files:
+            with open(path, 'rb') as fp:
+                header = json.loads(fp.readline())
+                body = fp.read()
+            if time.time() - header['time'] < self.expiration:
+                os.utime(path, None)
+                response = TextResponse(
+                    url=request.url, status=header['status'], body=body,
+                    encoding=header['encoding'], flags=['cached'])
+            else:
+                self.remove(path)
+
+        if response is None:
+            self.stats.inc_value('checklists/cache/misses', spider=spider)
+        else:
+            self.stats.inc_value('checklists/cache/hits', spider=spider)
+        return response
+
+    def process_response(self, request, response, spider):
+        if request.meta.get('cache') and response.status == 200 \
+                and 'cached' not in response.flags:
+            self.store(request.url, response)
+        return response
+
+    def store(self, url, response):
+        """Save a response to the cache.
+
+        Args:
+            url (str): the URL from the request.
+            response (Response): the response to save.
+
+        The response is written to a temporary file which is then renamed so
+        an incomplete response is never read from the cache.
+        """
+        path = self.get_path(url)
+        header = {
+            'url': url,
+            'time': time.time(),
+            'status': response.status,
+            'encoding': getattr(response, 'encoding', 'utf-8'),
+        }
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as fp:
+            fp.write(json.dumps(header) + '\n')
+            fp.write(response.body)
+        os.rename(tmp, path)
+
+        self.total -= self.files.get(path, 0)
+        self.files[path] = os.path.getsize(path)
+        self.total += self.files[path]
+        self.evict()
+
+    def remove(self, path):
+        """Remove a response from the cache."""
+        if os.path.exists(path):
+            os.remove(path)
+        self.total -= self.files.pop(path, 0)
+
+    def evict(self):
+        """Remove the least recently used responses until the cache fits."""
+        if self.total <= self.size:
+            return
+        paths = sorted(self.files, key=os.path.getmtime)
+        for path in paths:
+            if self.total <= self.size:
+                break
+            self.remove(path)
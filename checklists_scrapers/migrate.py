@@ -0,0 +1,156 @@
+"""Move the checklists in a download directory to a different layout.
+
+The setting DOWNLOAD_LAYOUT controls where in DOWNLOAD_DIR the file for each
+checklist is written. When the layout is changed the files already
+downloaded are not moved automatically. Run this module to move them:
+
+    python -m checklists_scrapers.migrate <directory> <layout>
+
+where,
+
+    <directory> is the download directory, i.e. DOWNLOAD_DIR.
+
+    <layout> is the new layout: flat, date or hash.
+
+Files may be moved from any layout to any other, including back to flat.
+Only the files for individual checklists are moved; JSON Lines segments are
+left where they are. Any directories left empty are removed. If a checklist
+was downloaded again after the layout was changed, so there is already a
+file where it would be moved to, the file modified most recently is kept and
+the other one is deleted.
+"""
+
+import json
+import os
+import sys
+
+from checklists_scrapers.utils import COMPRESSION, LAYOUTS, get_shard, \
+    list_files, open_file
+
+
+def get_name(filename):
+    """Get the source and identifier from the name of a checklist file.
+
+    Args:
+        filename (str): the name of the file, e.g. eBird-S0000001.json.gz.
+
+    Returns:
+        tuple(str, str): the name of the source and the identifier for the
+            checklist.
+    """
+    for suffix in COMPRESSION.values():
+        if suffix and filename.endswith(suffix):
+            filename = filename[:-len(suffix)]
+    source, separator, identifier = filename[:-len('.json')].rpartition('-')
+    return source, identifier
+
+
+def get_date(path):
+    """Get the date of the checklist in a file.
+
+    Args:
+        path (str): the path to the file.
+
+    Returns:
+        str: the date of the checklist in the format YYYY-MM-DD.
+    """
+    with open_file(path) as fp:
+        return json.load(fp)['date']
+
+
+def remove_empty_directories(root_dir, directories):
+    """Remove the directories left empty once the files were moved.
+
+    Args:
+        root_dir (str): the path to the root directory, which is not removed.
+        directories (set): the directories the files were moved from. The
+            parents of each directory are also removed if they are empty.
+    """
+    root_dir = os.path.normpath(root_dir)
+    for directory in sorted(directories, reverse=True):
+        directory = os.path.normpath(directory)
+        while directory != root_dir and os.path.isdir(directory) and \
+                not os.listdir(directory):
+            os.rmdir(directory)
+            directory = os.path.dirname(directory)
+
+
+def migrate(root_dir, layout, duplicates=None):
+    """Move the checklist files in a directory tree to a new layout.
+
+    Args:
+        root_dir (str): the path to the download directory.
+        layout (str): the new layout, either 'flat', 'date' or 'hash'.
+
+    Kwargs:
+        duplicates (list): where the paths of the files deleted because a
+            newer copy of the checklist was already in the new layout are
+            recorded.
+
+    Returns:
+        int: the number of files moved.
+
+    Raises:
+        ValueError: if the layout is not one of LAYOUTS.
+
+    The checklist is only read to get the date when moving to the 'date'
+    layout. For the others the identifier in the file name is enough.
+
+    If the target file already exists the one with the latest modification
+    time is kept. Otherwise os.rename() would silently replace a checklist
+    downloaded after the layout was changed with the stale copy.
+    """
+    if layout not in LAYOUTS:
+        raise ValueError("Unknown directory layout: %s" % layout)
+
+    moved = 0
+    emptied = set()
+
+    for path in list_files(root_dir, '.json'):
+        filename = os.path.basename(path)
+        source, identifier = get_name(filename)
+        date = get_date(path) if layout == 'date' else ''
+        directory = os.path.join(
+            root_dir, get_shard(layout, source, identifier, date))
+        target = os.path.join(directory, filename)
+
+        if os.path.normpath(target) == os.path.normpath(path):
+            continue
+
+        if os.path.exists(target) and \
+                os.path.getmtime(target) >= os.path.getmtime(path):
+            os.remove(path)
+            emptied.add(os.path.dirname(path))
+            if duplicates is not None:
+                duplicates.append(path)
+            continue
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        os.rename(path, target)
+        emptied.add(os.path.dirname(path))
+        moved += 1
+
+    remove_empty_directories(root_dir, emptied)
+
+    return moved
+
+
+def main(argv):
+    if len(argv) != 3 or argv[2] not in LAYOUTS:
+        print __doc__
+        return 1
+
+    duplicates = []
+    print "Moved %d files" % migrate(argv[1], argv[2], duplicates)
+    if duplicates:
+        print "Deleted %d files with a newer copy in the new layout:" % \
+            len(duplicates)
+        for path in duplicates:
+            print "    %s" % path
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
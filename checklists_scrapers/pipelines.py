@@ -0,0 +1,24 @@
+"""Item pipelines for customizing scrapy."""
+
+
+class WriterPipeline(object):
+    """Close the writer used by a spider to save the checklists.
+
+    The spiders save the checklists themselves rather than returning them
+    as items. However Scrapy closes the item pipelines before the
+    spider_closed signal is sent so closing the writer here guarantees every
+    checklist is written, and the writer's stats are complete, before the
+    SpiderStatusReport extension generates the status report. That matters
+    when DOWNLOAD_WRITER_THREADS is set and checklists may still be waiting
+    for the background threads when the crawl finishes. In that case the
+    writer returns a Deferred and Scrapy waits for it to fire before sending
+    the spider_closed signal.
+    """
+
+    def process_item(self, item, spider):
+        return item
+
+    def close_spider(self, spider):
+        writer = getattr(spider, 'writer', None)
+        if writer is not None:
+            return writer.close()
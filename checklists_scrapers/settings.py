@@ -44,6 +44,27 @@ EXTENSIONS = {
 }
 
 
+#
+# Scrapy item pipelines
+#
+
+ITEM_PIPELINES = [
+    'checklists_scrapers.pipelines.WriterPipeline',
+]
+
+
+#
+# Scrapy downloader middleware
+#
+
+# The API cache must come before HttpCompressionMiddleware (800) so the
+# responses are saved after they have been decompressed. Only the body is
+# saved so the cached responses have no Content-Encoding header.
+DOWNLOADER_MIDDLEWARES = {
+    'checklists_scrapers.middleware.APICacheMiddleware': 780,
+}
+
+
 #
 # Logging
 #
@@ -85,6 +106,59 @@ REPORT_RECIPIENTS = get_env_variable('REPORT_RECIPIENTS', '')
 # overwrite each other.
 DOWNLOAD_DIR = get_env_variable('DOWNLOAD_DIR', '.')
 
+# How the checklists are written to DOWNLOAD_DIR. With the default, 'files',
+# each checklist is written to a separate JSON file. With 'segments' the
+# checklists are appended, one per line, to JSON Lines files which are
+# rotated once they reach DOWNLOAD_SEGMENT_SIZE MB. With 'sqlite' the
+# checklists are written to tables in the SQLite database DOWNLOAD_DATABASE,
+# which defaults to checklists.sqlite3 in DOWNLOAD_DIR, and committed every
+# DOWNLOAD_DATABASE_BATCH checklists.
+DOWNLOAD_OUTPUT = get_env_variable('DOWNLOAD_OUTPUT', 'files')
+DOWNLOAD_SEGMENT_SIZE = int(get_env_variable('DOWNLOAD_SEGMENT_SIZE', '64'))
+DOWNLOAD_DATABASE = get_env_variable('DOWNLOAD_DATABASE', '')
+DOWNLOAD_DATABASE_BATCH = int(
+    get_env_variable('DOWNLOAD_DATABASE_BATCH', '1000'))
+
+# Compress the checklists written to DOWNLOAD_DIR using either 'gzip' or
+# 'bz2'. The extension, .gz or .bz2, is added to the name of each file. With
+# the default, '', the files are not compressed.
+DOWNLOAD_COMPRESSION = get_env_variable('DOWNLOAD_COMPRESSION', '')
+
+# Each checklist is written to a temporary file which is flushed to disk
+# (with fsync) and then renamed once it is complete. The directories, which
+# make the renames durable, are flushed in batches of DOWNLOAD_SYNC_FILES
+# files or after DOWNLOAD_SYNC_SECONDS seconds, whichever comes first,
+# rather than once for each checklist. Set DOWNLOAD_SYNC_FILES to 0 to leave
+# it to the operating system to decide when the files are written to disk.
+DOWNLOAD_SYNC_FILES = int(get_env_variable('DOWNLOAD_SYNC_FILES', '100'))
+DOWNLOAD_SYNC_SECONDS = float(get_env_variable('DOWNLOAD_SYNC_SECONDS', '5'))
+
+# Whether the file for a checklist is written again when it already contains
+# exactly the same data (False) or left untouched (True) so the modification
+# time only changes when the checklist changes. Only the files written when
+# DOWNLOAD_OUTPUT is 'files' are checked. The number of checklists skipped is
+# listed in the status report.
+DOWNLOAD_SKIP_UNCHANGED = bool(int(
+    get_env_variable('DOWNLOAD_SKIP_UNCHANGED', '0')))
+
+# Where the file for each checklist is written in DOWNLOAD_DIR. With 'flat',
+# the default, all the files are written to DOWNLOAD_DIR. With 'date' the
+# files are written to <source>/<yyyy>/<mm>/<dd> and with 'hash' the files
+# are spread across <source>/<xx>/<yy> using a hash of the identifier so no
+# directory grows too large. Use checklists_scrapers.migrate to move any
+# existing files when the layout is changed.
+DOWNLOAD_LAYOUT = get_env_variable('DOWNLOAD_LAYOUT', 'flat')
+
+# The number of background threads used to write the checklists. With 0,
+# the default, each checklist is written as soon as it is parsed. Otherwise
+# the checklists are written by the threads so the crawl is not held up by
+# the disk. No more than DOWNLOAD_WRITER_QUEUE checklists wait to be written
+# at a time. The spider callbacks return a Deferred which fires once their
+# checklists are written so Scrapy stops scheduling new work when the
+# threads fall behind.
+DOWNLOAD_WRITER_THREADS = int(get_env_variable('DOWNLOAD_WRITER_THREADS', '0'))
+DOWNLOAD_WRITER_QUEUE = int(get_env_variable('DOWNLOAD_WRITER_QUEUE', '100'))
+
 # Download checklists from the last <n> days. A value of 7 (one week) offers
 # a reasonable trade-off between only fetching recent data while still
 # catching checklists that are added late.
@@ -94,18 +168,40 @@ DURATION = int(get_env_variable('DURATION', '7'))
 # checks so the redirect middleware needs to be enabled.
 REDIRECT_ENABLED = True
 
+# Responses from calls to an API, e.g. the eBird API, can be cached on the
+# local disk so they are not downloaded again if the spider is run again,
+# for example after a failure. The responses remain valid for
+# API_CACHE_EXPIRATION seconds and the least recently used responses are
+# removed when the size of the cache exceeds API_CACHE_SIZE MB. If
+# API_CACHE_DIR is not set the responses are saved in the directory 'cache'
+# in DOWNLOAD_DIR.
+API_CACHE_ENABLED = bool(int(get_env_variable('API_CACHE_ENABLED', '0')))
+API_CACHE_DIR = get_env_variable('API_CACHE_DIR', '')
+API_CACHE_EXPIRATION = int(get_env_variable('API_CACHE_EXPIRATION', '3600'))
+API_CACHE_SIZE = int(get_env_variable('API_CACHE_SIZE', '100'))
+
 # Cookies are required for sites where the spider needs a user account.
 COOKIES_ENABLED = True
 
 # The maximum number of simultaneous requests that will be performed by the
 # Scrapy downloader.
 #
-# IMPORTANT: Do not change this value, otherwise the Requests and Responses
-# when parsing the eBird checklist web pages get mixed up. Since each eBird
-# spider processes the checklists for one region and the number of checklists
-# to be downloaded is low (typically a few dozen) then this restriction does
-# not adversely affect performance.
-CONCURRENT_REQUESTS = 1
+# The eBird spider identifies the checklist displayed on each web page from
+# the URL of the page that was returned rather than the request so checklists
+# are not mixed up when the security checks on eBird redirect the requests.
+# The script checklists_scrapers/tests/benchmarks/stress_ebird_checklists.py
+# can be used to check the spider with higher values.
+CONCURRENT_REQUESTS = int(get_env_variable('CONCURRENT_REQUESTS', '8'))
+
+# The number of worker processes used to parse the checklist web pages. With
+# the default, 0, the pages are parsed by the spider on the reactor thread
+# which delays the other requests in progress while a large page is parsed.
+PARSER_POOL_SIZE = int(get_env_variable('PARSER_POOL_SIZE', '0'))
+
+# The number of seconds to wait for a worker process to parse a page. If no
+# result is received, for example because the worker was killed, the page is
+# reported as an error rather than the spider waiting for it forever.
+PARSER_POOL_TIMEOUT = int(get_env_variable('PARSER_POOL_TIMEOUT', '60'))
 
 
 #
@@ -115,3 +211,25 @@ CONCURRENT_REQUESTS = 1
 # Whether the checklist web page is also parsed to extract data (True) or
 # only the data from the API is used (False).
 EBIRD_INCLUDE_HTML = bool(get_env_variable('EBIRD_INCLUDE_HTML', '1'))
+
+# Whether the observations returned by the API are decoded one at a time as
+# the checklists are created (True) or all at once (False). Decoding the
+# records incrementally limits the memory used for large regions.
+EBIRD_INCREMENTAL_PARSING = bool(int(
+    get_env_variable('EBIRD_INCREMENTAL_PARSING', '0')))
+
+# The number of locations for which the recent observations are fetched in
+# a single call to the eBird API. The API accepts up to 10 locations per call.
+EBIRD_LOCATIONS_PER_REQUEST = int(
+    get_env_variable('EBIRD_LOCATIONS_PER_REQUEST', '10'))
+
+# The number of checklists, waiting for the web page to be downloaded, that
+# are held in memory by the eBird spider. Any more are saved in a temporary
+# SQLite database in DOWNLOAD_DIR. Set to 0 to hold all of them in memory.
+EBIRD_PENDING_LIMIT = int(get_env_variable('EBIRD_PENDING_LIMIT', '0'))
+
+# Whether checklists that have not changed since the spider was last run are
+# skipped (True) or downloaded again (False). A fingerprint of each checklist
+# is recorded in the file ebird_state.sqlite3 in DOWNLOAD_DIR. Delete the
+# file to download all the checklists again.
+EBIRD_SKIP_UNCHANGED = bool(int(get_env_variable('EBIRD_SKIP_UNCHANGED', '0')))
@@ -1,22 +1,94 @@
 """A scraper for downloading checklists from eBird.
 
-This scraper creates checklists for recent observations for a given region
-using the eBird API. Additional information for each checklist is also
-scraped from the checklist web page.
+This scraper creates checklists for recent observations for one or more
+regions using the eBird API. Additional information for each checklist is
+also scraped from the checklist web page.
 """
 
-import json
+import datetime
+import functools
 import os
 import re
+import urlparse
 
 from scrapy import log
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
 from scrapy.http import Request
 from scrapy.selector import HtmlXPathSelector
 from scrapy.spider import BaseSpider
+from twisted.internet import defer
 
+from checklists_scrapers.exceptions import ParserException
 from checklists_scrapers.spiders import DOWNLOAD_FORMAT, DOWNLOAD_LANGUAGE
-from checklists_scrapers.spiders.utils import remove_whitespace, select_keys, dedup, \
-    save_json_data
+from checklists_scrapers.spiders.pool import ParserPool
+from checklists_scrapers.spiders.state import CrawlState, get_fingerprint
+from checklists_scrapers.spiders.store import ChecklistStore
+from checklists_scrapers.spiders.utils import remove_whitespace, \
+    select_unique, iter_json_array, compile_xpath, extract_cells
+from checklists_scrapers.spiders.writers import get_writer
+
+
+class Observation(object):
+
+    """A compact record for an observation returned by the eBird API.
+
+    Only the fields used to create the checklists, locations and entries are
+    kept and they are stored in slots rather than a dict. The get(), [] and
+    'in' operations behave the same as for a dict so the JSONParser methods
+    accept either an Observation or the original record.
+    """
+
+    fields = (
+        'subID',
+        'obsID',
+        'obsDt',
+        'firstName',
+        'lastName',
+        'locID',
+        'locName',
+        'subnational1Name',
+        'subnational2Name',
+        'countryName',
+        'lat',
+        'lng',
+        'comName',
+        'sciName',
+        'howMany',
+    )
+
+    __slots__ = fields
+
+    def __init__(self, record):
+        """Initialize the observation from the record decoded from JSON.
+
+        Args:
+            record (dict): the observation record.
+
+        Fields missing from the record are left unset so they are reported
+        as missing, the same as for the record.
+        """
+        for key in self.fields:
+            if key in record:
+                setattr(self, key, record[key])
+
+    def __contains__(self, key):
+        return key in self.fields and hasattr(self, key)
+
+    def __getitem__(self, key):
+        if key not in self.fields:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        """Get the value of a field or the default if it is not set."""
+        try:
+            return self[key]
+        except KeyError:
+            return default
 
 
 class JSONParser(object):
@@ -40,28 +112,164 @@ class JSONParser(object):
         'subID',
     ] + location_keys
 
-    def __init__(self, response):
+    record_type = Observation
+
+    subid_pattern = re.compile(r'"subID"\s*:\s*"([^"]*)"')
+
+    def __init__(self, response, incremental=False):
         """Initialize the parser with a JSON encoded response.
 
         Args:
             response (str): an encoded string containing the JSON data returned
                 by a call to the eBird API.
 
+        Kwargs:
+            incremental (bool): decode the records one at a time as the
+                checklists and locations are generated rather than decoding
+                all of them up front.
+
         Returns:
             JSONParser: a JSONParser object with the records decided from
             the JSON data.
         """
-        self.records = json.loads(response.body_as_unicode())
+        self.response = response
+        self.incremental = incremental
+        if incremental:
+            self.records = None
+        else:
+            self.records = list(self.decode())
+
+    def decode(self):
+        """Decode the observations from the response.
+
+        Returns:
+            generator: yields an Observation for each record in the JSON data.
+
+        The records are decoded directly from the body of the response,
+        avoiding the copy created by body_as_unicode() when the response is
+        encoded in UTF-8. Each record is converted to an Observation as it is
+        decoded so the full dict for every record is never held in memory.
+        """
+        if self.response.encoding.lower() in ('utf-8', 'utf8', 'ascii'):
+            content = self.response.body
+        else:
+            content = self.response.body_as_unicode()
+        for record in iter_json_array(content):
+            yield self.record_type(record)
+
+    def get_records(self):
+        """Get the observations from the response.
+
+        Returns:
+            iterator: the Observations decoded from the JSON data. In
+            incremental mode the records are decoded each time this method
+            is called.
+        """
+        if self.records is None:
+            return self.decode()
+        return iter(self.records)
 
     def get_checklists(self):
-        """Get the set of checklists from the observations."""
-        filtered = dedup(select_keys(self.records, self.checklist_keys))
+        """Get the set of checklists from the observations.
+
+        Returns:
+            list(dict): a list of dicts containing the fields for a checklist,
+            including the entries for each of the observations. In incremental
+            mode a generator is returned instead.
+
+        The observations are grouped by checklist identifier in a single pass
+        over the records so the time taken grows linearly with the number of
+        observations rather than with the product of the number of
+        checklists and observations.
+        """
+        if self.incremental:
+            return self.iter_checklists()
+        return self.group_checklists(self.records)
+
+    def group_checklists(self, records):
+        """Group a list of observations by checklist.
+
+        Args:
+            records (list): the observations.
+
+        Returns:
+            list(dict): a list of dicts containing the fields for a checklist,
+            including the entries for each of the observations.
+        """
+        groups = {}
+        for record in records:
+            groups.setdefault(record['subID'].strip(), []).append(record)
+
+        filtered = select_unique(records, self.checklist_keys)
         checklists = [self.get_checklist(record) for record in filtered]
         for checklist in checklists:
-            checklist['entries'] = [self.get_entry(r) for r in self.records
-                                    if r['subID'] == checklist['identifier']]
+            checklist['entries'] = [self.get_entry(record) for record
+                                    in groups[checklist['identifier']]]
         return checklists
 
+    def is_grouped(self):
+        """Check whether the observations for each checklist are together.
+
+        Returns:
+            bool: True if all the observations for each checklist follow one
+            another in the response.
+
+        The identifiers are found by scanning the body of the response with
+        a regular expression rather than decoding the JSON so the check is
+        cheap compared with decoding the observations.
+        """
+        seen = set()
+        previous = None
+        for match in self.subid_pattern.finditer(self.response.body):
+            identifier = match.group(1).strip()
+            if identifier != previous:
+                if identifier in seen:
+                    return False
+                seen.add(identifier)
+                previous = identifier
+        return True
+
+    def iter_checklists(self):
+        """Generate the checklists as the observations are decoded.
+
+        Returns:
+            generator: yields a dict containing the fields for each checklist,
+            including the entries.
+
+        The eBird API usually returns the observations for a checklist
+        together so each checklist is yielded as soon as the first
+        observation for the next checklist is decoded. That way only the
+        observations for one checklist are held in memory at any time.
+
+        The API does not guarantee the order, however. If the observations
+        for any checklist are split up then a warning is logged and all the
+        observations are decoded and grouped, as when not parsing
+        incrementally, so no checklist is generated without all its entries.
+        """
+        if not self.is_grouped():
+            log.msg("Observations for checklists are not grouped together,"
+                    " decoding all the records from %s" % self.response.url,
+                    level=log.WARNING)
+            for checklist in self.group_checklists(list(self.decode())):
+                yield checklist
+            return
+
+        checklist = None
+
+        for record in self.get_records():
+            identifier = record['subID'].strip()
+
+            if checklist is None or checklist['identifier'] != identifier:
+                if checklist is not None:
+                    yield checklist
+                checklist = self.get_checklist(record)
+                checklist['entries'] = []
+
+            checklist['entries'].append(self.get_entry(record))
+
+        if checklist is not None:
+            yield checklist
+
     def get_checklist(self, record):
         """Get the fields for a checklist from an observation.
 
@@ -145,9 +353,20 @@ class JSONParser(object):
         Returns:
             list(dict): a list of dicts containing the fields for a location.
         """
-        filtered = dedup(select_keys(self.records, self.location_keys))
+        if self.incremental:
+            return self.iter_locations()
+        filtered = select_unique(self.records, self.location_keys)
         return [self.get_location(record) for record in filtered]
 
+    def iter_locations(self):
+        """Generate the set of locations as the observations are decoded.
+
+        Returns:
+            generator: yields a dict containing the fields for each location.
+        """
+        for record in select_unique(self.get_records(), self.location_keys):
+            yield self.get_location(record)
+
     def get_location(self, record):
         """Get the fields for a location from an observation.
 
@@ -215,6 +434,31 @@ class HTMLParser(object):
 
     default_activity = 'Birding'
 
+    # The XPath expressions and regular expressions are compiled once and
+    # shared by all the pages parsed.
+    terms_xpath = compile_xpath('//dl/dt')
+    definitions_xpath = compile_xpath('//dl/dd')
+    text_xpath = compile_xpath('text()')
+    strong_text_xpath = compile_xpath('strong/text()')
+    entries_xpath = compile_xpath('//tr[@class="spp-entry"]')
+    name_xpath = compile_xpath('.//h5[@class="se-name"]/text()')
+    count_xpath = compile_xpath('.//h5[@class="se-count"]/text()')
+    comment_xpath = compile_xpath('.//p[@class="obs-comments"]/text()')
+    details_xpath = compile_xpath('.//div[@class="sd-data-age-sex"]//tr')
+
+    # The checklist web page is cut down to the section containing the
+    # checklist before it is parsed. The section starts with this marker and
+    # ends with the table containing the species. The page is only parsed in
+    # full if the markers cannot be found.
+    fragment_start = '<div class="report-section"'
+    fragment_markers = ['<dt', 'class="spp-entry"']
+    table_regex = re.compile(r'<(/?)table\b[^>]*>', re.IGNORECASE)
+
+    hours_regex = re.compile(r'(\d+) h')
+    minutes_regex = re.compile(r'(\d+) m')
+    kilometers_regex = re.compile(r'([\.\d]+) k')
+    miles_regex = re.compile(r'([\.\d]+) m')
+
     def __init__(self, response):
         """Initialize the parser with an HTML encoded response.
 
@@ -226,9 +470,76 @@ class HTMLParser(object):
                 checklist web page and a dict containing the main checklist
                 attributes.
         """
+        fragment = self.get_fragment(response.body)
+        if fragment is not response.body:
+            response = response.replace(body=fragment)
         self.docroot = HtmlXPathSelector(response)
         self.attributes = self.get_attributes(self.docroot)
 
+    def get_fragment(self, body):
+        """Get the section of the page containing the checklist.
+
+        Args:
+            body (str): the contents of the checklist web page.
+
+        Returns:
+            str: the section of the page from the start marker to the end of
+                the table containing the species or the original body if the
+                section could not be found.
+
+        Most of the page is navigation, scripts and the markup for the map
+        so parsing only the section containing the checklist attributes and
+        the species reduces the size of the tree that lxml builds. If any of
+        the attributes or species are outside the section then the whole page
+        is used.
+        """
+        start = body.find(self.fragment_start)
+        if start == -1:
+            return body
+
+        last = body.rfind(self.fragment_markers[1])
+        if last == -1:
+            end = body.rfind('</dl>')
+            if end != -1:
+                end += len('</dl>')
+        else:
+            end = self.get_table_end(body, last)
+
+        if end == -1 or end <= start:
+            return body
+
+        fragment = body[start:end]
+
+        for marker in self.fragment_markers:
+            if fragment.count(marker) != body.count(marker):
+                return body
+
+        return fragment
+
+    def get_table_end(self, body, position):
+        """Find the end of the table containing a given position.
+
+        Args:
+            body (str): the contents of the checklist web page.
+            position (int): a position inside the table.
+
+        Returns:
+            int: the position following the closing tag of the table or -1
+                if the end of the table could not be found.
+
+        The rows for the species contain tables with the breakdown of the
+        count by age and sex so the nested tables are skipped.
+        """
+        depth = 0
+        for match in self.table_regex.finditer(body, position):
+            if match.group(1):
+                depth -= 1
+                if depth < 0:
+                    return match.end()
+            else:
+                depth += 1
+        return -1
+
     def get_attributes(self, node):
         """Get the checklist attributes.
 
@@ -237,26 +548,30 @@ class HTMLParser(object):
 
         Returns:
             dict: a dictionary containing the fields and values of a checklist.
+
+        The terms and definitions are each selected once and paired in
+        document order so the time taken grows linearly with the number of
+        attributes on the page.
         """
         attr = {}
-        for idx, item in enumerate(node.select('//dl/dt/text()')):
-            key = item.extract().strip()
+        terms = self.terms_xpath.select(node)
+        definitions = self.definitions_xpath.select(node)
+        for term, definition in zip(terms, definitions):
+            keys = self.text_xpath.extract(term)
+            if not keys:
+                continue
+            key = keys[0].strip()
             if key == 'Observers:':
                 names = []
-                values = node.select('//dl/dd')[idx].select('text()').extract()
-                for value in values:
-                    name = value.replace(',', '').strip()
-                    if name:
-                        names.append(name)
-                values = node.select('//dl/dd')[idx]\
-                    .select('strong/text()').extract()
+                values = self.text_xpath.extract(definition) + \
+                    self.strong_text_xpath.extract(definition)
                 for value in values:
                     name = value.replace(',', '').strip()
                     if name:
                         names.append(name)
                 attr[key] = ','.join(names)
             else:
-                value = node.select('//dl/dd')[idx].select('text()').extract()
+                value = self.text_xpath.extract(definition)
                 attr[key] = value[0].strip()
         return attr
 
@@ -291,23 +606,23 @@ class HTMLParser(object):
 
         duration_str = self.attributes.get('Duration:', '')
         if 'hour' in duration_str:
-            duration_hours = int(re.search(
-                r'(\d+) h', duration_str).group(1))
+            duration_hours = int(
+                self.hours_regex.search(duration_str).group(1))
         else:
             duration_hours = 0
         if 'min' in duration_str:
-            duration_minutes = int(re.search(
-                r'(\d+) m', duration_str).group(1))
+            duration_minutes = int(
+                self.minutes_regex.search(duration_str).group(1))
         else:
             duration_minutes = 0
 
         distance_str = self.attributes.get('Distance:', '0 kilometer(s)')
         if 'kilometer' in distance_str:
-            distance = int(float(re.search(
-                r'([\.\d]+) k', distance_str).group(1)) * 1000)
+            distance = int(float(
+                self.kilometers_regex.search(distance_str).group(1)) * 1000)
         else:
-            distance = int(float(re.search(
-                r'([\.\d]+) m', distance_str).group(1)) * 1609)
+            distance = int(float(
+                self.miles_regex.search(distance_str).group(1)) * 1609)
 
         return {
             'name': protocol_name,
@@ -365,11 +680,9 @@ class HTMLParser(object):
                 sex.
         """
         entries = []
-        for selector in self.docroot.select('//tr[@class="spp-entry"]'):
-            name = selector.select(
-                './/h5[@class="se-name"]/text()').extract()[0].strip()
-            count = selector.select(
-                './/h5[@class="se-count"]/text()').extract()[0].strip()
+        for selector in self.entries_xpath.select(self.docroot):
+            name = self.name_xpath.extract(selector)[0].strip()
+            count = self.count_xpath.extract(selector)[0].strip()
 
             species = {
                 'name': name,
@@ -399,8 +712,7 @@ class HTMLParser(object):
             str: any comment associated with a checklist entry.
         """
         comment = ''
-        selection = node.select('.//p[@class="obs-comments"]/text()')\
-            .extract()
+        selection = self.comment_xpath.extract(node)
         if selection:
             comment = selection[0].strip()
         return comment
@@ -415,62 +727,112 @@ class HTMLParser(object):
         Returns:
             list(dict): a list of dicts containing the fields that describe
                 the breakdown of the checklist entry count by age and sex.
+
+        The table is extracted as a grid, with a row for each sex and a
+        column for each age, in a single pass over the rows rather than
+        evaluating an XPath expression for each cell.
         """
         details = []
 
-        xpath = './/div[@class="sd-data-age-sex"]//tr'
-        names = node.select(xpath).select('./th/text()').extract()
+        rows = self.details_xpath.select(node)
+        names = [name for headings in extract_cells(rows, 'th')
+                 for name in headings if name]
+        grid = [cells for cells in extract_cells(rows, 'td') if cells]
         cols = len(names)
-        row = 0
-
-        for selector in node.select(xpath):
-            ages = selector.select('./td')
 
-            if not ages:
-                continue
-
-            sex = ages[0].select('./text()').extract()[0]
-
-            for col, age in zip(range(1, cols + 1), names):
-                values = ages[col].select('./text()').extract()
-                if values:
+        for row, cells in enumerate(grid):
+            sex = cells[0]
+            for col, age in enumerate(names, 1):
+                value = cells[col]
+                if value:
                     details.append({
                         'identifier': 'DET%02d' % (row * cols + col),
                         'age': age,
                         'sex': sex,
-                        'count': int(values[0])
+                        'count': int(value)
                     })
-            row += 1
         return details
 
 
 class EBirdSpider(BaseSpider):
     """Extract checklists recently added to eBird.
 
-    The spider starts by using the API to return the observations for the
-    last <n> days for the selected region. The recent observations for a region
-    only contain the simple results fields so additional requests are generated
-    for the recent observations for each location which contain the full result
-    fields. Not all the useful information for a checklist is available through
-    the API so the checklist web page from eBird.org is also parsed to extract
-    information such as the type of protocol used, breakdowns by age and sex of
-    the counts for each species, etc. The completed checklist is then written
-    in JSON format to a file.
+    The spider starts by using the API to return the observations for the last
+    <n> days for each of the selected regions. The recent observations for a
+    region only contain the simple results fields so additional requests are
+    generated for the recent observations for each location which contain the
+    full result fields. Several locations are included in each request to
+    reduce the number of calls to the API and locations shared by more than one
+    region are only fetched once. Not all the useful information for a
+    checklist is available through the API so the checklist web page from
+    eBird.org is also parsed to extract information such as the type of
+    protocol used, breakdowns by age and sex of the counts for each species,
+    etc. The completed checklist is then written in JSON format to a file.
 
     Details on the eBird API and the different sets of fields returned can be
     found at https://confluence.cornell.edu/display/CLOISAPI/eBird+API+1.1
 
-    Three settings control the behaviour of the spider:
+    The following settings control the behaviour of the spider:
 
     DOWNLOAD_DIR: the directory where the downloaded checklists
     will be written in JSON format. The directory will be created if it does
     not exist.
 
+    DOWNLOAD_OUTPUT: set to 'segments' to append the checklists to
+    rotating JSON Lines files rather than writing each one to a separate
+    JSON file. DOWNLOAD_SEGMENT_SIZE sets the size, in MB, of each segment.
+    Set it to 'sqlite' to write the checklists to tables in the SQLite
+    database DOWNLOAD_DATABASE, committing every DOWNLOAD_DATABASE_BATCH
+    checklists.
+
+    DOWNLOAD_COMPRESSION: set to 'gzip' or 'bz2' to compress the checklists
+    written to DOWNLOAD_DIR.
+
+    DOWNLOAD_SYNC_FILES, DOWNLOAD_SYNC_SECONDS: each checklist is flushed
+    to disk before it is renamed and the directory is flushed in batches of
+    this many files or after this many seconds.
+
+    DOWNLOAD_SKIP_UNCHANGED: do not write the file for a checklist again if
+    it already contains the same data.
+
+    DOWNLOAD_LAYOUT: set to 'date' or 'hash' to write the files to
+    sub-directories of DOWNLOAD_DIR rather than directly to it.
+
+    DOWNLOAD_WRITER_THREADS: the number of background threads used to write
+    the checklists, and DOWNLOAD_WRITER_QUEUE, the maximum number waiting to
+    be written.
+
     DURATION: the number of days to fetch observations for. The eBird
     API allows access to observations up to 30 days old.
 
     EBIRD_INCLUDE_HTML: include data from the checklist web page.
 
+    EBIRD_INCREMENTAL_PARSING: decode the observations returned by the API
+    one at a time rather than all at once. This limits the memory used when
+    processing the responses for large regions.
+
+    EBIRD_LOCATIONS_PER_REQUEST: the number of locations included in each
+    request for the recent observations at a location. The API accepts up
+    to 10 locations per request.
+
+    EBIRD_PENDING_LIMIT: the number of checklists, waiting for the web page
+    to be downloaded, that are held in memory. Any more are saved in a
+    temporary database in DOWNLOAD_DIR. A value of 0 means there is no limit.
+
+    PARSER_POOL_SIZE: the number of worker processes used to parse the
+    checklist web pages. If set to 0 the pages are parsed by the spider.
+
+    PARSER_POOL_TIMEOUT: the number of seconds to wait for a worker process
+    to parse a page before it is reported as an error.
+
+    EBIRD_SKIP_UNCHANGED: record a fingerprint of each checklist in a SQLite
+    database in DOWNLOAD_DIR and skip checklists which have not changed since
+    the spider was last run.
+
+    The requests to the API are marked so the responses can be saved by
+    the APICacheMiddleware, if enabled, and replayed when the spider is run
+    again.
+
     The spider keeps a list of checklists downloaded and save along with any
     errors raised. These are used to create a status report by the extension,
     SpiderStatusReport which is emailed out when the spider finishes.
@@ -487,34 +849,104 @@ class EBirdSpider(BaseSpider):
                    "r=%s&detail=full&back=%d&includeProvisional=true&fmt=json"
     checklist_url = "http://ebird.org/ebird/view/checklist?subID=%s"
 
-    def __init__(self, region, **kwargs):
+    # The maximum number of locations the API accepts in a single request.
+    max_locations_per_request = 10
+
+    # The name of the file, in DOWNLOAD_DIR, where the fingerprints of the
+    # checklists downloaded are recorded when EBIRD_SKIP_UNCHANGED is set.
+    state_filename = 'ebird_state.sqlite3'
+
+    # The number of times the web page for a checklist is requested before
+    # giving up and saving only the data from the API.
+    max_checklist_requests = 3
+
+    def __init__(self, region=None, region_file=None, **kwargs):
         """Initialize the spider.
 
-        Args:
+        Kwargs:
             region (str): the code identifying the eBird region to fetch
-                observations for.
+                observations for. Several regions may be given as a comma-
+                separated list, e.g. PT-11,PT-15.
+            region_file (str): the path to a file containing the codes for
+                the regions to fetch observations for, one per line. Blank
+                lines and lines starting with '#' are ignored.
 
         Returns:
             EBirdSpider: a Scrapy crawler object.
         """
         super(EBirdSpider, self).__init__(**kwargs)
-        if not region:
+
+        codes = []
+        if region:
+            codes.extend(region.split(','))
+        if region_file:
+            codes.extend(self.read_regions(region_file))
+
+        self.regions = []
+        for code in codes:
+            code = code.strip()
+            if code and code not in self.regions:
+                self.regions.append(code)
+
+        if not self.regions:
             raise ValueError("You must specify an eBird region")
-        self.region = region
-        self.log("Downloading checklists for region: %s" % self.region,
-                 log.INFO)
+        self.log("Downloading checklists for regions: %s" %
+                 ', '.join(self.regions), log.INFO)
+
+        # The locations requested so far. Regions may overlap so this is
+        # used to avoid fetching the observations for a location twice.
+        self.locations = set()
 
         self.checklists = []
         self.errors = []
         self.warnings = []
 
+        # The checklists extracted from the API, waiting for the web page to
+        # be downloaded, and the number of times each page was requested.
+        self.pending = ChecklistStore()
+        self.attempts = {}
+
+        # The worker processes used to parse the web pages, if any.
+        self.pool = None
+
+        # The writer used to save the checklists, created when the first
+        # checklist is saved.
+        self.writer = None
+
+    def read_regions(self, path):
+        """Read the codes for the regions from a file.
+
+        Args:
+            path (str): the path to the file.
+
+        Returns:
+            list(str): the region codes.
+        """
+        with open(path, 'rb') as fp:
+            lines = [line.strip() for line in fp]
+        return [line for line in lines if line and not line.startswith('#')]
+
+    def set_crawler(self, crawler):
+        """Connect the signals used to retry the checklist web pages and
+        report on the progress of the spider.
+
+        Args:
+            crawler (Crawler): the crawler running the spider.
+        """
+        super(EBirdSpider, self).set_crawler(crawler)
+        crawler.signals.connect(self.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(self.spider_closed,
+                                signal=signals.spider_closed)
+
     def start_requests(self):
         """Configure the spider and issue the first request to the eBird API.
 
         Returns:
-            Request: yields a single request for the recent observations for
-                an eBird region.
+            list(Request): a request for the recent observations for each of
+                the eBird regions.
         """
+        self.started = datetime.datetime.now()
+
         self.duration = int(self.settings['DURATION'])
         self.log("Fetching observations for the past %d days" % self.duration,
                  log.INFO)
@@ -530,8 +962,40 @@ class EBirdSpider(BaseSpider):
         else:
             self.log("Downloading checklists from API only", log.INFO)
 
-        url = self.region_url % (self.region, self.duration)
-        return [Request(url, callback=self.parse_region)]
+        self.incremental = self.settings['EBIRD_INCREMENTAL_PARSING']
+        if self.incremental:
+            self.log("Decoding API responses incrementally", log.INFO)
+
+        self.pending.limit = int(self.settings['EBIRD_PENDING_LIMIT'])
+        self.pending.directory = self.directory or None
+        if self.include_html and self.pending.limit:
+            self.log("Holding up to %d pending checklists in memory" %
+                     self.pending.limit, log.INFO)
+
+        pool_size = int(self.settings['PARSER_POOL_SIZE'])
+        if self.include_html and pool_size:
+            self.pool = ParserPool(
+                pool_size, int(self.settings['PARSER_POOL_TIMEOUT']))
+            self.log("Parsing web pages with %d worker processes" % pool_size,
+                     log.INFO)
+
+        self.state = None
+        self.unchanged = 0
+        if self.settings['EBIRD_SKIP_UNCHANGED'] and self.directory:
+            path = os.path.join(self.directory, self.state_filename)
+            self.state = CrawlState(path)
+            self.log("Skipping unchanged checklists recorded in %s" % path,
+                     log.INFO)
+
+        self.locations_per_request = max(1, min(
+            int(self.settings['EBIRD_LOCATIONS_PER_REQUEST']),
+            self.max_locations_per_request))
+        self.log("Fetching observations for up to %d locations per request"
+                 % self.locations_per_request, log.INFO)
+
+        return [Request(self.region_url % (region, self.duration),
+                        callback=self.parse_region, meta={'cache': True})
+                for region in self.regions]
 
     def parse_region(self, response):
         """Request the recent observations for each location.
@@ -544,10 +1008,37 @@ class EBirdSpider(BaseSpider):
             Request: yields a series of requests to the eBird API to get the
                 recent observations for each location extracted from the
                 recent observations for the region.
+
+        Locations that were already requested for another region are skipped.
         """
-        for location in self.api_parser(response).get_locations():
-            url = self.location_url % (location['identifier'], self.duration)
-            yield Request(url, callback=self.parse_locations)
+        parser = self.api_parser(response, incremental=self.incremental)
+        batch = []
+
+        for location in parser.get_locations():
+            if location['identifier'] in self.locations:
+                continue
+            self.locations.add(location['identifier'])
+            batch.append(location['identifier'])
+            if len(batch) == self.locations_per_request:
+                yield self.get_locations_request(batch)
+                batch = []
+
+        if batch:
+            yield self.get_locations_request(batch)
+
+    def get_locations_request(self, identifiers):
+        """Create the request for the recent observations for locations.
+
+        Args:
+            identifiers (list(str)): the identifiers for the locations.
+
+        Returns:
+            Request: a request to the eBird API to get the recent observations
+                for all the locations in a single call.
+        """
+        url = self.location_url % ('&r='.join(identifiers), self.duration)
+        return Request(url, callback=self.parse_locations,
+                       meta={'cache': True})
 
     def parse_locations(self, response):
         """Create the checklists from the observations.
@@ -557,24 +1048,108 @@ class EBirdSpider(BaseSpider):
                 recent observations for a location.
 
         Returns:
-            Request: (when the attribute include_html is True) yields a series
-                of requests to the eBird website to get web page used to
-                display the details of a checklist.
+            list(Request): (when the attribute include_html is True) the
+                requests to the eBird website to get web page used to
+                display the details of a checklist. If the checklists are
+                written by background threads a Deferred is returned which
+                fires with the requests once the checklists are written, so
+                Scrapy holds back the crawl while the writer catches up.
 
         Even with the full results fields there is still useful information
         missing so additional requests are generated for the checklist web
         page. Whether the spider continues and processes the checklist web
         page is controlled by the EBIRD_INCLUDE_HTML setting.
+
+        If EBIRD_SKIP_UNCHANGED is set then checklists where the data from the
+        API has not changed since the last time the spider was run, and where
+        the web page was merged, if required, are skipped. When the web page
+        is not needed the fingerprint is only recorded once the checklist has
+        been saved so a checklist which could not be written is downloaded
+        again on the next run.
+
+        The response may contain the observations for several locations.
+        The API URL recorded in the source of each checklist is the one for
+        the checklist's location so it can still be used to report problems
+        with individual checklists.
         """
-        checklists = self.api_parser(response).get_checklists()
+        parser = self.api_parser(response, incremental=self.incremental)
+        checklists = parser.get_checklists()
+        requests = []
+        saved = []
+
         for checklist in checklists:
-            checklist['source']['api'] = response.url
+            identifier = checklist['identifier']
+            checklist['source']['api'] = self.location_url % (
+                checklist['location']['identifier'], self.duration)
+            record = None
+
+            if self.state is not None:
+                fingerprint = get_fingerprint(checklist)
+                if self.state.is_current(identifier, fingerprint,
+                                         self.include_html):
+                    self.unchanged += 1
+                    continue
+                record = functools.partial(
+                    self.state.update, identifier, fingerprint)
+
             if self.include_html:
-                url = self.checklist_url % checklist['identifier']
-                yield Request(url, callback=self.parse_checklist,
-                              dont_filter=True, meta={'checklist': checklist})
+                # The checklist is not skipped on the next run until the
+                # web page is marked as merged, which only happens once the
+                # checklist is saved, so the fingerprint is recorded now.
+                if record is not None:
+                    record()
+                self.pending[identifier] = checklist
+                requests.append(self.get_checklist_request(identifier))
             else:
-                self.save_checklist(checklist)
+                deferred = self.save_checklist(checklist, record)
+                if deferred is not None:
+                    saved.append(deferred)
+
+        if saved:
+            return defer.DeferredList(saved).addCallback(lambda _: requests)
+        return requests
+
+    def get_checklist_request(self, identifier):
+        """Create the request for the checklist web page.
+
+        Args:
+            identifier (str): the identifier for the checklist.
+
+        Returns:
+            Request: a request for the checklist web page.
+
+        Only the identifier is passed in the metadata. The checklist
+        extracted from the API is held in the pending table until the web
+        page is parsed.
+        """
+        self.attempts[identifier] = self.attempts.get(identifier, 0) + 1
+        url = self.checklist_url % identifier
+        return Request(url, callback=self.parse_checklist, dont_filter=True,
+                       meta={'identifier': identifier})
+
+    def get_identifier(self, response):
+        """Get the identifier for the checklist displayed in a web page.
+
+        Args:
+            response (Response): the checklist web page.
+
+        Returns:
+            str: the identifier for the checklist.
+
+        eBird redirects requests for the checklist web page to perform some
+        security checks and the page returned is not always the one that was
+        requested. The identifier is taken from the URL of the page that was
+        returned. If that is a shared URL, without the subID parameter, then
+        the URLs from the redirects are checked, most recent first, before
+        falling back to the identifier from the original request.
+        """
+        urls = [response.url]
+        urls.extend(reversed(response.meta.get('redirect_urls', [])))
+        for url in urls:
+            query = urlparse.parse_qs(urlparse.urlparse(url).query)
+            if 'subID' in query:
+                return query['subID'][0]
+        return response.meta.get('identifier')
 
     def parse_checklist(self, response):
         """Parse the missing checklist data from the web page.
@@ -582,32 +1157,148 @@ class EBirdSpider(BaseSpider):
         Args:
             response (str): the contents of the checklist web page.
 
-        The checklist first extracted from the call the eBird API is passed
-        through the parse_region() and parse_locations() methods using the
-        metadata attribute on the Request and Response objects. It is then
-        merged with the data has been extracted from the web page and written
-        to a file in the directory specified when the spider was created.
-
-        ISSUE: If the setting CONCURRENT_REQUEST != 1 then the checklist data
-        in the response sometimes does not match the checklist in the request
-        metadata. The problem appears to be intermittent, but for a given run
-        of the spider it usually happens after the 4th or 5th response. The
-        cause is not known. If the problem occurs then an error is logged and
-        the checklist is discarded.
-        """
-        if not response.url.endswith(response.meta['checklist']['identifier']):
-            self.log("Checklists in response and request don't match."
-                     "Identifiers: %s != %s" % (
-                         response.url[-9:],
-                         response.meta['checklist']['identifier']
-                     ), log.ERROR)
+        The checklist first extracted from the call the eBird API is held in
+        the pending table, keyed by the checklist identifier. The identifier
+        for the checklist actually displayed on the page is used to find the
+        checklist so the web page is always merged with the matching data
+        from the API, even if more than one request is in progress and eBird
+        redirects them. The merged checklist is written to a file in the
+        directory specified when the spider was created.
+
+        If the page is for a checklist that has already been processed then
+        it is ignored. Any checklists that are still waiting for their web
+        page when the spider becomes idle are requested again.
+
+        If the PARSER_POOL_SIZE setting is set then the page is parsed in one
+        of the worker processes and a Deferred is returned which fires once
+        the checklist has been saved. If the page could not be parsed, or no
+        result was received in time, the checklist is returned to the pending
+        table so the web page is requested again when the spider is idle and,
+        after max_checklist_requests attempts, the checklist is saved using
+        only the data from the API.
+        """
+        identifier = self.get_identifier(response)
+        original = self.pending.pop(identifier, None)
+
+        if original is None:
+            self.log("No checklist waiting for web page: %s" % response.url,
+                     log.DEBUG)
             return
 
-        update = self.html_parser(response).get_checklist()
-        original = response.meta['checklist']
+        if identifier != response.meta.get('identifier'):
+            self.log("Web page for checklist %s received for request for %s"
+                     % (identifier, response.meta.get('identifier')),
+                     log.DEBUG)
+
+        if self.pool is None:
+            update = self.html_parser(response).get_checklist()
+            return self.complete_checklist(identifier, original, update)
+        else:
+            deferred = self.pool.parse(self.html_parser, response)
+            deferred.addCallbacks(
+                lambda update: self.complete_checklist(
+                    identifier, original, update),
+                self.parse_failed, errbackArgs=(identifier, original))
+            return deferred
+
+    def parse_failed(self, failure, identifier, original):
+        """Return a checklist to the pending table if its page was not parsed.
+
+        Args:
+            failure (Failure): the ParserException raised by the pool.
+            identifier (str): the identifier for the checklist.
+            original (dict): the checklist extracted from the API.
+        """
+        failure.trap(ParserException)
+        self.pending[identifier] = original
+        self.log("Could not parse web page for checklist %s: %s" % (
+            identifier, failure.getErrorMessage()), log.WARNING)
+
+    def complete_checklist(self, identifier, original, update):
+        """Merge the data from the web page and save the checklist.
+
+        Args:
+            identifier (str): the identifier for the checklist.
+            original (dict): the checklist extracted from the API.
+            update (dict): the checklist extracted from the web page.
+
+        Returns:
+            Deferred: the result from save_checklist(), if the checklist is
+                written in a background thread, otherwise None.
+        """
         checklist = self.merge_checklists(original, update)
-        checklist['source']['url'] = response.url
-        self.save_checklist(checklist)
+        checklist['source']['url'] = self.checklist_url % identifier
+
+        if self.state is None:
+            return self.save_checklist(checklist)
+        return self.save_checklist(
+            checklist, functools.partial(self.state.set_merged, identifier))
+
+    def spider_idle(self, spider):
+        """Request the web pages again for any checklists still pending.
+
+        Args:
+            spider (BaseSpider): the spider that is idle.
+
+        Raises:
+            DontCloseSpider: if any requests were issued.
+
+        A checklist is requested up to max_checklist_requests times. After
+        that the checklist is saved using only the data from the API and a
+        warning is added to the status report.
+        """
+        if spider is not self or not self.pending:
+            return
+
+        requests = []
+
+        for identifier in sorted(self.pending):
+            if self.attempts.get(identifier, 0) < self.max_checklist_requests:
+                requests.append(self.get_checklist_request(identifier))
+            else:
+                checklist = self.pending.pop(identifier)
+                checklist['source']['url'] = self.checklist_url % identifier
+                message = "Checklist web page could not be downloaded after" \
+                          " %d attempts." % self.attempts[identifier]
+                self.log("%s %s" % (message, identifier), log.WARNING)
+                self.warnings.append((checklist, [message]))
+                self.save_checklist(checklist)
+
+        if requests:
+            self.log("Requesting web pages again for %d checklists" %
+                     len(requests), log.INFO)
+            for request in requests:
+                self.crawler.engine.crawl(request, self)
+            raise DontCloseSpider
+
+    def spider_closed(self, spider):
+        """Save the crawl state and log the rate the regions were processed.
+
+        Args:
+            spider (BaseSpider): the spider that was closed.
+        """
+        if spider is not self or not hasattr(self, 'started'):
+            return
+
+        self.pending.close()
+
+        if self.pool is not None:
+            self.pool.close()
+
+        if self.writer is not None:
+            self.writer.close()
+
+        if self.state is not None:
+            self.state.close()
+            self.log("Skipped %d unchanged checklists" % self.unchanged,
+                     log.INFO)
+
+        elapsed = datetime.datetime.now() - self.started
+        minutes = max(elapsed.total_seconds(), 1) / 60.0
+        self.log("Downloaded checklists for %d regions in %.1f minutes"
+                 " (%.1f regions/minute)" % (
+                     len(self.regions), minutes, len(self.regions) / minutes),
+                 log.INFO)
 
     def merge_checklists(self, original, update):
         """Merge two checklists together.
@@ -664,21 +1355,47 @@ class EBirdSpider(BaseSpider):
            dict: a dictionary containing all the names reported as observers
            on the two checklists along with a total count of the number of
            observers present.
-        """
-        names = set(originals['names'])
-        names.update(set(updates['names']))
 
-        total = originals['count'] + updates['count']
+        Names are compared ignoring case and whitespace. The names from the
+        API are listed first followed by any new names from the web page, in
+        the order they appear, so the same checklists always give the same
+        list of observers.
+        """
+        names = []
+        seen = set()
 
         for name in originals['names']:
-            if name in updates['names']:
-                total -= 1
+            key = self.get_observer_key(name)
+            if key not in seen:
+                seen.add(key)
+                names.append(name)
+
+        # The observers listed on both checklists are only counted once.
+        overlap = len(seen.intersection(
+            [self.get_observer_key(name) for name in updates['names']]))
+
+        for name in updates['names']:
+            key = self.get_observer_key(name)
+            if key not in seen:
+                seen.add(key)
+                names.append(name)
 
         return {
-            'names': list(names),
-            'count': total,
+            'names': names,
+            'count': originals['count'] + updates['count'] - overlap,
         }
 
+    def get_observer_key(self, name):
+        """Get the key used to match the names of observers.
+
+        Args:
+            name (str): the name of an observer.
+
+        Returns:
+            str: the name in lower case with the whitespace normalized.
+        """
+        return ' '.join(name.split()).lower()
+
     def merge_entries(self, originals, updates):
         """Merge two lists of entries together.
 
@@ -687,9 +1404,12 @@ class EBirdSpider(BaseSpider):
            updates (list): the entries extracted from the web page.
 
         Returns:
-           tuple(list, list): a tuple containing the complete (deep) copy of
-               the entries merged together and a list of any warnings generated
-               when merging the lists together.
+           tuple(list, list): a tuple containing the entries merged together
+               and a list of any warnings generated when merging the lists
+               together.
+
+        The merged entries are new dicts but the species and details are
+        shared with the entries from the two lists rather than being copied.
 
         IMPORTANT: The records from the API contain only the species name.
         The subspecies name is discarded. That means if there are two records
@@ -698,106 +1418,142 @@ class EBirdSpider(BaseSpider):
         records will not be merged and only the records from the API will be
         included in the merged list.
         """
-
         merged = []
         warnings = []
 
+        # The merged entries, keyed by the species name, without any
+        # subspecies, and the count.
+        index = {}
+
         for entry in originals:
-            merged.append({
+            target = {
                 'identifier': entry['identifier'],
-                'species': entry['species'].copy(),
+                'species': entry['species'],
                 'count': entry['count'],
-            })
+            }
+            merged.append(target)
+            key = (self.get_species_key(entry['species']), entry['count'])
+            index.setdefault(key, []).append(target)
 
-        index = {}
+        ambiguous = set()
+        debug = self.settings['LOG_LEVEL'] == 'DEBUG'
 
-        for entry in merged:
-            key = entry['species']['name'].split('(')[0].strip()
-            count = entry['count']
-            if key in index:
-                if count in index[key]:
-                    index[key][count].append(entry)
-                else:
-                    index[key][count] = [entry]
-            else:
-                index[key] = {count: [entry]}
+        for entry in updates:
+            key = (self.get_species_key(entry['species']), entry['count'])
+            targets = index.get(key)
 
-        for name, counts in index.items():
-            for count, entries in counts.items():
-                if len(entries) > 1:
+            if targets is None:
+                target = {}
+                merged.append(target)
+                message = "Web page contains record missing from API:" \
+                          " species=%s; count=%d." \
+                          % (entry['species']['name'], entry['count'])
+                if debug:
+                    warnings.append(message)
+                self.log(message)
+            elif len(targets) == 1:
+                target = targets[0]
+            else:
+                target = None
+                if key not in ambiguous:
+                    ambiguous.add(key)
                     message = "Could not update record from API. There are" \
                               " %s records that match: species=%s; count=%d." \
-                              % (len(entries), name, count)
+                              % (len(targets), key[0], key[1])
                     warnings.append(message)
                     self.log(message)
 
-        for entry in updates:
-            key = entry['species']['name'].split('(')[0].strip()
-            count = entry['count']
-            target = None
-            added = False
-
-            if key in index:
-                if count in index[key]:
-                    hits = len(index[key][count])
-                else:
-                    hits = 0
-
-                if hits == 0:
-                    target = {}
-                    merged.append(target)
-                    added = True
-                elif hits == 1:
-                    target = index[key][count][0]
-            else:
-                target = {}
-                merged.append(target)
-                added = True
-
             if target is not None:
-                target['species'] = entry['species'].copy()
+                target['species'] = entry['species']
                 target['count'] = entry['count']
 
                 if 'comment' in entry:
                     target['comment'] = entry['comment']
 
                 if 'details' in entry:
-                    target['details'] = []
-                    for detail in entry['details']:
-                        target['details'].append(detail.copy())
-
-            if added:
-                message = "Web page contains record missing from API:" \
-                          " species=%s; count=%d." \
-                          % (entry['species']['name'], entry['count'])
-                if self.settings['LOG_LEVEL'] == 'DEBUG':
-                    warnings.append(message)
-                self.log(message)
+                    target['details'] = entry['details']
 
         return merged, warnings
 
-    def save_checklist(self, checklist):
+    def get_species_key(self, species):
+        """Get the key used to match the species in two lists of entries.
+
+        Args:
+            species (dict): the species for a checklist entry.
+
+        Returns:
+            str: the species name with any subspecies removed.
+        """
+        return species['name'].partition('(')[0].strip()
+
+    def save_checklist(self, checklist, saved=None):
         """Save the checklist in JSON format.
 
         Args:
         checklist (dict); the checklist.
 
+        Kwargs:
+            saved (callable): called, with no arguments, once the checklist
+                has been saved. It is used to update the crawl state so a
+                checklist is only skipped on the next run if it was written.
+
         The filename using the source, in this case 'ebird' and the checklist
         identifier so that the data is always written to the same file. The
         directory where the files are written is defined by the setting
-        DOWNLOAD_DIR. If the directory attribute is set to None then the
-        checklist is not saved (used for testing).
-
-        The saved checklist is added to the list of checklists downloaded so
-        far so it can be used to generate a status report once the spider has
-        finished.
-        """
-        if self.directory:
-            path = os.path.join(self.directory, "%s-%s.json" % (
-                checklist['source']['name'], checklist['identifier']))
-            save_json_data(path, checklist)
-            self.checklists.append(checklist)
-
-            self.log("Wrote %s: %s %s (%s)" % (
-                path, checklist['date'], checklist['location']['name'],
-                checklist['source']['submitted_by']), log.DEBUG)
+        DOWNLOAD_DIR, in the sub-directory set by DOWNLOAD_LAYOUT, if any.
+        If the directory attribute is set to None then the checklist is not
+        saved (used for testing). If DOWNLOAD_OUTPUT is set to 'segments'
+        then the checklist is appended to a JSON Lines file instead and if
+        it is set to 'sqlite' it is written to a SQLite database.
+
+        Once the checklist is saved it is added to the list of checklists
+        downloaded so far so it can be used to generate a status report once
+        the spider has finished.
+
+        Returns:
+            Deferred: if DOWNLOAD_WRITER_THREADS is set, fires with None once
+                the checklist has been written. Any error is added to the
+                list of errors in the status report. Otherwise None is
+                returned once the checklist is saved.
+        """
+        if not self.directory:
+            return None
+
+        if self.writer is None:
+            self.writer = get_writer(self.settings, self.directory,
+                                     self.name, self.crawler.stats, self)
+        result = self.writer.write(checklist['source']['name'], checklist)
+
+        if isinstance(result, defer.Deferred):
+            return result.addCallbacks(
+                self.checklist_saved, self.checklist_failed,
+                callbackArgs=(checklist, saved), errbackArgs=(checklist,))
+        return self.checklist_saved(result, checklist, saved)
+
+    def checklist_saved(self, result, checklist, saved):
+        """Record a checklist once it has been saved.
+
+        Args:
+            result: the value returned by the writer, ignored.
+            checklist (dict): the checklist.
+            saved (callable): called to update the crawl state, if not None.
+        """
+        if saved is not None:
+            saved()
+        self.checklists.append(checklist)
+        self.log("Saved %s: %s %s (%s)" % (
+            checklist['identifier'], checklist['date'],
+            checklist['location']['name'],
+            checklist['source']['submitted_by']), log.DEBUG)
+
+    def checklist_failed(self, failure, checklist):
+        """Record an error raised while writing a checklist in a thread.
+
+        Args:
+            failure (Failure): the error.
+            checklist (dict): the checklist.
+        """
+        url = checklist['source'].get('url', checklist['source'].get('api'))
+        self.errors.append((url, failure))
+        self.log("Could not save checklist %s: %s" % (
+            checklist['identifier'], failure.getErrorMessage()), log.ERROR)
@@ -0,0 +1,205 @@
+"""A pool of worker processes for parsing web pages off the reactor thread."""
+
+import cPickle as pickle
+import signal
+import traceback
+
+from multiprocessing import Pool
+
+from scrapy.http import Request
+from twisted.internet import defer, reactor
+
+from checklists_scrapers.exceptions import ParserException
+
+
+def init_worker():
+    """Restore the default signal handlers in a worker process.
+
+    The workers are forked from the crawler process so they inherit the
+    handlers installed by Scrapy and Twisted, which shut down the reactor
+    rather than exiting. Without this terminating the pool would leave the
+    workers running. SIGINT is ignored so pressing Ctrl-C only stops the
+    crawler, which then closes the pool.
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def parse_page(parser_class, response_class, url, body, encoding, meta):
+    """Parse a web page in a worker process.
+
+    Args:
+        parser_class (class): the parser used to extract the checklist.
+        response_class (class): the class of the original response.
+        url (str): the URL of the page.
+        body (str): the contents of the page.
+        encoding (str): the character encoding of the page.
+        meta (dict): the metadata from the request for the page.
+
+    Returns:
+        tuple: True and the checklist returned by the get_checklist() method
+            of the parser or False and the traceback if an exception was
+            raised. Exceptions are not raised since they might not be
+            picklable.
+    """
+    try:
+        request = Request(url=url, meta=meta)
+        response = response_class(url=url, body=body, encoding=encoding,
+                                  request=request)
+        return True, parser_class(response).get_checklist()
+    except Exception:
+        return False, traceback.format_exc()
+
+
+def run_task(task):
+    """Run a task sent to a worker process.
+
+    Args:
+        task (str): the pickled arguments for parse_page().
+
+    Returns:
+        str: the pickled value returned by parse_page(). The result is
+            pickled here rather than by the pool so a checklist which cannot
+            be pickled is reported as an error. If the pool fails to send the
+            result back it never calls the callback for the task.
+    """
+    try:
+        return pickle.dumps(parse_page(*pickle.loads(task)),
+                            pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return pickle.dumps((False, traceback.format_exc()),
+                            pickle.HIGHEST_PROTOCOL)
+
+
+class ParserPool(object):
+
+    """Parse web pages in a pool of worker processes.
+
+    Parsing a large page can take long enough to delay the responses for
+    all the other requests in progress since the spider callbacks run on
+    the reactor thread. The pool sends the contents of each page to a worker
+    process where the parser is run and the checklist it returns is
+    delivered back to the reactor thread using a Deferred.
+
+    A spider callback can return the Deferred, with a callback added to
+    process the checklist, and Scrapy will wait for the result before
+    processing any items or requests it returns. The Deferred always fires:
+    if the arguments cannot be pickled, the parser fails or no result is
+    received within timeout seconds, for example because the worker process
+    was killed, it fails with ParserException.
+
+    The pages sent to the workers are tracked until their results are
+    received. When the pool is closed any that are still outstanding, for
+    example a page which timed out because the parser hung, would stop the
+    pool from ever finishing, so in that case the worker processes are
+    terminated rather than waiting for them.
+    """
+
+    def __init__(self, processes, timeout=60):
+        """Start the worker processes.
+
+        Args:
+            processes (int): the number of worker processes.
+
+        Kwargs:
+            timeout (int): the number of seconds to wait for a page to be
+                parsed.
+
+        Returns:
+            ParserPool: a pool for parsing web pages.
+        """
+        self.processes = processes
+        self.timeout = timeout
+        self.pool = Pool(processes, init_worker)
+        self.outstanding = set()
+        self.closed = False
+
+    def parse(self, parser_class, response):
+        """Parse a web page in one of the worker processes.
+
+        Args:
+            parser_class (class): the parser used to extract the checklist.
+                It must accept a response when initialized and have a
+                get_checklist() method.
+            response (Response): the response containing the web page.
+
+        Returns:
+            Deferred: fires with the checklist returned by the parser or
+                fails with ParserException if the page could not be parsed.
+        """
+        try:
+            task = pickle.dumps(
+                (parser_class, response.__class__, response.url,
+                 response.body, response.encoding, response.meta),
+                pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return defer.fail(ParserException(traceback.format_exc()))
+
+        deferred = defer.Deferred()
+        timeout = reactor.callLater(self.timeout, self.expire, deferred,
+                                    response.url)
+
+        def cancel_timeout(result):
+            if timeout.active():
+                timeout.cancel()
+            return result
+
+        deferred.addBoth(cancel_timeout)
+        self.outstanding.add(deferred)
+        self.pool.apply_async(
+            run_task, (task,),
+            callback=lambda result: reactor.callFromThread(
+                self.deliver, deferred, result))
+        return deferred
+
+    def deliver(self, deferred, result):
+        """Fire the Deferred for a page with the result from the worker.
+
+        Args:
+            deferred (Deferred): the Deferred returned by parse().
+            result (str): the pickled value returned by parse_page().
+
+        Results which arrive after the Deferred timed out are ignored.
+        """
+        self.outstanding.discard(deferred)
+        if deferred.called:
+            return
+        succeeded, value = pickle.loads(result)
+        if succeeded:
+            deferred.callback(value)
+        else:
+            deferred.errback(ParserException(value))
+
+    def expire(self, deferred, url):
+        """Fail the Deferred for a page if no result was received in time.
+
+        Args:
+            deferred (Deferred): the Deferred returned by parse().
+            url (str): the URL of the page.
+        """
+        if not deferred.called:
+            deferred.errback(ParserException(
+                "No result after %d seconds parsing %s" % (self.timeout, url)))
+
+    def close(self):
+        """Stop the worker processes.
+
+        If no pages are waiting for a result the workers finish normally,
+        otherwise they are terminated and the Deferred for any page which
+        has not already fired fails with ParserException.
+        """
+        if self.closed:
+            return
+        self.closed = True
+
+        if self.outstanding:
+            self.pool.terminate()
+        else:
+            self.pool.close()
+        self.pool.join()
+
+        for deferred in self.outstanding:
+            if not deferred.called:
+                deferred.errback(ParserException(
+                    "The pool was closed before the page was parsed"))
+        self.outstanding.clear()
@@ -0,0 +1,122 @@
+"""Persistent state used to skip checklists downloaded in previous runs."""
+
+import datetime
+import hashlib
+import json
+import sqlite3
+
+
+def get_fingerprint(checklist):
+    """Get a fingerprint for the contents of a checklist.
+
+    Args:
+        checklist (dict): the checklist.
+
+    Returns:
+        str: the SHA-1 digest of the checklist encoded as JSON with the keys
+            sorted so the same checklist always gives the same fingerprint.
+    """
+    content = json.dumps(checklist, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+class CrawlState(object):
+
+    """Record the checklists processed by a spider in a SQLite database.
+
+    For each checklist the fingerprint of the data from the API is recorded
+    along with whether the data from the checklist web page was merged. On
+    the next run checklists where the fingerprint is unchanged do not need
+    to be downloaded or saved again.
+
+    Changes are committed in batches, every commit_every updates, and when
+    the state is closed.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS checklists (
+            identifier TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            merged INTEGER NOT NULL DEFAULT 0,
+            updated TEXT NOT NULL
+        )
+    """
+
+    def __init__(self, path, commit_every=100):
+        """Open (or create) the database containing the state.
+
+        Args:
+            path (str): the path to the SQLite database file.
+
+        Kwargs:
+            commit_every (int): the number of updates between commits.
+
+        Returns:
+            CrawlState: an object for querying and updating the state.
+        """
+        self.path = path
+        self.commit_every = commit_every
+        self.updates = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(self.schema)
+        self.connection.commit()
+
+    def is_current(self, identifier, fingerprint, merged):
+        """Check whether a checklist was already processed.
+
+        Args:
+            identifier (str): the identifier for the checklist.
+            fingerprint (str): the fingerprint of the data from the API.
+            merged (bool): whether the checklist web page must also have been
+                merged with the data from the API.
+
+        Returns:
+            bool: True if the checklist was processed and has not changed.
+        """
+        row = self.connection.execute(
+            "SELECT fingerprint, merged FROM checklists WHERE identifier = ?",
+            (identifier,)).fetchone()
+        if row is None or row[0] != fingerprint:
+            return False
+        return bool(row[1]) or not merged
+
+    def update(self, identifier, fingerprint, merged=False):
+        """Record the fingerprint for a checklist.
+
+        Args:
+            identifier (str): the identifier for the checklist.
+            fingerprint (str): the fingerprint of the data from the API.
+
+        Kwargs:
+            merged (bool): whether the checklist web page was merged.
+        """
+        self.connection.execute(
+            "INSERT OR REPLACE INTO checklists"
+            " (identifier, fingerprint, merged, updated) VALUES (?, ?, ?, ?)",
+            (identifier, fingerprint, int(merged),
+             datetime.datetime.now().isoformat()))
+        self.changed()
+
+    def set_merged(self, identifier):
+        """Record that the checklist web page was merged.
+
+        Args:
+            identifier (str): the identifier for the checklist.
+        """
+        self.connection.execute(
+            "UPDATE checklists SET merged = 1, updated = ?"
+            " WHERE identifier = ?",
+            (datetime.datetime.now().isoformat(), identifier))
+        self.changed()
+
+    def changed(self):
+        """Commit the changes once enough updates have been made."""
+        self.updates += 1
+        if self.updates >= self.commit_every:
+            self.connection.commit()
+            self.updates = 0
+
+    def close(self):
+        """Commit any outstanding changes and close the database."""
+        self.connection.commit()
+        self.connection.close()
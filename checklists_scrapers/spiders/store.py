@@ -0,0 +1,129 @@
+"""A store for the checklists waiting to be completed by a spider."""
+
+import json
+import os
+import sqlite3
+import tempfile
+
+
+class ChecklistStore(object):
+
+    """Hold checklists, keyed by identifier, spilling them to disk if needed.
+
+    Spiders that need to make further requests before a checklist is
+    complete hold the checklist here rather than passing it in the metadata
+    of each request, so the requests queued by the scheduler only carry the
+    identifier. Up to limit checklists are held in memory. Any more are
+    encoded in JSON and saved in a temporary SQLite database which is
+    deleted when the store is closed. A limit of 0 holds all the checklists
+    in memory.
+
+    The store supports the dict operations used by the spiders: [], 'in',
+    len(), iteration over the identifiers, keys() and pop().
+    """
+
+    def __init__(self, limit=0, directory=None):
+        """Initialize the store.
+
+        Kwargs:
+            limit (int): the maximum number of checklists held in memory.
+            directory (str): the directory where the temporary database is
+                created. If not set the system default is used.
+
+        Returns:
+            ChecklistStore: an empty store.
+        """
+        self.limit = limit
+        self.directory = directory
+        self.memory = {}
+        self.spilled = set()
+        self.path = None
+        self.connection = None
+
+    def __len__(self):
+        return len(self.memory) + len(self.spilled)
+
+    def __contains__(self, identifier):
+        return identifier in self.memory or identifier in self.spilled
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __getitem__(self, identifier):
+        if identifier in self.memory:
+            return self.memory[identifier]
+        if identifier in self.spilled:
+            row = self.connection.execute(
+                "SELECT checklist FROM checklists WHERE identifier = ?",
+                (identifier,)).fetchone()
+            return json.loads(row[0])
+        raise KeyError(identifier)
+
+    def __setitem__(self, identifier, checklist):
+        if identifier in self.spilled or \
+                (self.limit and len(self.memory) >= self.limit and
+                 identifier not in self.memory):
+            self.spill(identifier, checklist)
+        else:
+            self.memory[identifier] = checklist
+
+    def keys(self):
+        """Get the identifiers of the checklists in the store."""
+        return list(self.memory) + list(self.spilled)
+
+    def pop(self, identifier, *default):
+        """Remove a checklist from the store and return it.
+
+        Args:
+            identifier (str): the identifier for the checklist.
+            default: returned if the checklist is not in the store.
+
+        Raises:
+            KeyError: if the checklist is not in the store and no default
+                was given.
+        """
+        if identifier in self.memory:
+            return self.memory.pop(identifier)
+        if identifier in self.spilled:
+            checklist = self[identifier]
+            self.connection.execute(
+                "DELETE FROM checklists WHERE identifier = ?", (identifier,))
+            self.spilled.remove(identifier)
+            return checklist
+        if default:
+            return default[0]
+        raise KeyError(identifier)
+
+    def spill(self, identifier, checklist):
+        """Save a checklist in the temporary database.
+
+        Args:
+            identifier (str): the identifier for the checklist.
+            checklist (dict): the checklist.
+        """
+        if self.connection is None:
+            fd, self.path = tempfile.mkstemp(
+                suffix='.sqlite3', prefix='checklists-', dir=self.directory)
+            os.close(fd)
+            self.connection = sqlite3.connect(self.path)
+            # The database is deleted when the spider finishes so there is
+            # no need to protect it against crashes.
+            self.connection.execute("PRAGMA journal_mode = OFF")
+            self.connection.execute("PRAGMA synchronous = OFF")
+            self.connection.execute(
+                "CREATE TABLE checklists"
+                " (identifier TEXT PRIMARY KEY, checklist TEXT NOT NULL)")
+        self.connection.execute(
+            "INSERT OR REPLACE INTO checklists (identifier, checklist)"
+            " VALUES (?, ?)", (identifier, json.dumps(checklist)))
+        self.spilled.add(identifier)
+
+    def close(self):
+        """Close and delete the temporary database, if one was created."""
+        if self.connection is not None:
+            self.connection.close()
+            os.remove(self.path)
+            self.connection = None
+            self.path = None
+        self.memory.clear()
+        self.spilled.clear()
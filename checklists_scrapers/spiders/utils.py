@@ -1,7 +1,136 @@
 """Utility functions used by the scrapers to parse content."""
 
+import hashlib
 import json
+import os
 import re
+import uuid
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+from scrapy.selector import XPathSelectorList
+
+from checklists_scrapers.utils import COMPRESSION, open_file
+
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+# Used in place of the value for a key that is missing from a record.
+MISSING = object()
+
+# The XPath expressions compiled so far, keyed by the expression.
+XPATHS = {}
+
+
+class XPath(object):
+
+    """An XPath expression compiled once and evaluated on any selector.
+
+    Passing a string to the select() method of a selector means the
+    expression is compiled every time it is used. The parsers define the
+    expressions they use as class attributes, created with compile_xpath(),
+    so each one is compiled once and shared by all the responses parsed.
+
+    The compiled expression is evaluated directly on the lxml element held
+    by the selector. If lxml is not available or the selector does not use
+    the lxml backend then select() is called with the expression instead so
+    the results are the same either way.
+    """
+
+    def __init__(self, expression):
+        """Compile the expression.
+
+        Args:
+            expression (str): the XPath expression.
+
+        Returns:
+            XPath: an object for evaluating the expression.
+        """
+        self.expression = expression
+        self.compiled = etree.XPath(expression) if etree else None
+
+    def select(self, node):
+        """Evaluate the expression.
+
+        Args:
+            node (XPathSelector): the node, or a list of nodes, in the tree
+                where the expression is evaluated.
+
+        Returns:
+            XPathSelectorList: the selectors for the nodes matched.
+        """
+        if isinstance(node, list):
+            return XPathSelectorList(
+                [item for child in node for item in self.select(child)])
+
+        root = getattr(node, '_root', None)
+        if self.compiled is None or not isinstance(root, etree._Element):
+            return node.select(self.expression)
+
+        result = self.compiled(root)
+        if not isinstance(result, list):
+            result = [result]
+        return XPathSelectorList([
+            node.__class__(_root=item, _expr=self.expression,
+                           namespaces=node.namespaces)
+            for item in result])
+
+    def extract(self, node):
+        """Evaluate the expression and extract the results as strings.
+
+        Args:
+            node (XPathSelector): the node, or a list of nodes, in the tree
+                where the expression is evaluated.
+
+        Returns:
+            list(unicode): the contents of the nodes matched.
+        """
+        return self.select(node).extract()
+
+
+def compile_xpath(expression):
+    """Get the compiled version of an XPath expression.
+
+    Args:
+        expression (str): the XPath expression.
+
+    Returns:
+        XPath: the compiled expression. Expressions are only compiled once
+            so parsers using the same expression share the same object.
+    """
+    if expression not in XPATHS:
+        XPATHS[expression] = XPath(expression)
+    return XPATHS[expression]
+
+
+def extract_cells(rows, tag):
+    """Extract the text from the cells in each row of a table.
+
+    Args:
+        rows (XPathSelectorList): the rows of the table.
+        tag (str): the type of cell, either 'th' or 'td'.
+
+    Returns:
+        list(list): for each row, the text from each of the cells or None if
+            the cell is empty.
+
+    If the rows are held in lxml elements then the cells are read directly
+    from the element rather than evaluating an XPath expression for each
+    cell so a table can be extracted in a single pass.
+    """
+    table = []
+    for row in rows:
+        root = getattr(row, '_root', None)
+        if etree is not None and isinstance(root, etree._Element):
+            cells = [cell.text for cell in root if cell.tag == tag]
+        else:
+            cells = [(cell.select('text()').extract() or [None])[0]
+                     for cell in row.select(tag)]
+        table.append(cells)
+    return table
 
 
 def remove_whitespace(strings):
@@ -22,52 +151,148 @@ def remove_whitespace(strings):
     return filter(None, cleaned)
 
 
-def select_keys(records, keys):
-    """Filter the records extracting only the selected fields.
+def select_unique(records, keys):
+    """Select the records with a unique set of values for the given keys.
 
     Args:
-        records (list(dict)): the list of dicts to be filtered.
-        keys (list(str)): the keys to select from the records.
+        records (iterable): the records to be filtered. Each record must
+            support the dict get() method.
+        keys (list(str)): the keys used to compare the records.
 
     Returns:
-        list(dict): the list of records containing only the specified keys.
+        generator: yields the first record seen for each combination of values.
 
-    The returned list is in the same order as the original records.
+    The original records are returned rather than copies containing only
+    the selected keys. The values are compared in the order given by keys so
+    there is no need to sort the items or create a new dict for each record.
     """
-    filtered = []
+    seen = set()
     for record in records:
-        filtered.append({key: record[key] for key in keys if key in record})
-    return filtered
+        key = tuple([record.get(name, MISSING) for name in keys])
+        if key not in seen:
+            seen.add(key)
+            yield record
 
 
-def dedup(records):
-    """Remove any identical records from the list.
+def iter_json_array(content):
+    """Decode the items in a JSON encoded array one at a time.
 
     Args:
-        records (list(dict)): the list of dicts to be filtered.
+        content (str): the JSON encoded array.
 
     Returns:
-        list(dict): the list of records with any duplicates removed.
+        generator: yields each of the decoded items in the array.
 
-    The list returned contains records in the same order as the original list.
+    Raises:
+        ValueError: if the content is not a valid JSON encoded array.
+
+    Only the item currently being decoded is held in memory, as opposed to
+    json.loads() which creates the entire list before any of the items can
+    be processed.
     """
-    seen = set()
-    filtered = []
-    for record in records:
-        key = tuple(sorted(record.items()))
-        if key not in seen:
-            seen.add(key)
-            filtered.append(record)
-    return filtered
+    decoder = json.JSONDecoder()
+    idx = WHITESPACE.match(content, 0).end()
+
+    if content[idx:idx + 1] != '[':
+        raise ValueError("Expected a JSON array at position %d" % idx)
+
+    idx = WHITESPACE.match(content, idx + 1).end()
+
+    if content[idx:idx + 1] == ']':
+        return
+
+    while True:
+        item, idx = decoder.raw_decode(content, idx)
+        yield item
+        idx = WHITESPACE.match(content, idx).end()
+        separator = content[idx:idx + 1]
+        if separator == ']':
+            return
+        elif separator != ',':
+            raise ValueError("Expected ',' or ']' at position %d" % idx)
+        idx = WHITESPACE.match(content, idx + 1).end()
+
 
+def get_file_digest(path):
+    """Get the digest of the contents of a file.
 
-def save_json_data(path, data):
+    Args:
+        path (str): the path to the file. Compressed files are decompressed
+            so the digest is for the original contents.
+
+    Returns:
+        str: the SHA-1 digest of the contents or None if the file does not
+            exist.
+    """
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha1()
+    with open_file(path) as fp:
+        for chunk in iter(lambda: fp.read(65536), ''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def fsync(path):
+    """Flush a file or directory to disk.
+
+    Args:
+        path (str): the path to the file or directory.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def save_json_data(path, data, compression='', skip_unchanged=False,
+                   sync=False):
     """Write the data in JSON format to a file.
 
     Args:
         path (str): the path where the checklists will be saved.
         checklist (dict): a dict that will be encoded in JSON format and
             written to a file.
+
+    Kwargs:
+        compression (str): the codec used to compress the file, either
+            'gzip' or 'bz2'. The default, '', writes an uncompressed file.
+        skip_unchanged (bool): if the file already exists and contains the
+            same data then it is not written again.
+        sync (bool): flush the temporary file to disk before it is renamed so
+            the file never has a partial contents after a crash. Flushing
+            the directory, so the rename itself is durable, is left to the
+            caller.
+
+    Returns:
+        tuple(str, bool): the path to the file, with the extension for the
+            codec, if any, added and whether the file was written.
+
+    The keys are sorted so the same data always gives the same file. The
+    data is written to a hidden, temporary file in the same directory which
+    is then renamed so anything reading the directory never sees a partially
+    written file.
     """
-    with open(path, 'wb') as fp:
-        json.dump(data, fp, indent=4)
+    path += COMPRESSION[compression]
+    content = json.dumps(data, indent=4, sort_keys=True)
+
+    if skip_unchanged and \
+            get_file_digest(path) == hashlib.sha1(content).digest():
+        return path, False
+
+    directory, filename = os.path.split(path)
+    temp = os.path.join(directory, '.%s.%s' % (uuid.uuid4().hex, filename))
+    try:
+        with open_file(temp, 'wb') as fp:
+            fp.write(content)
+        # The file is flushed once it is closed since compressed files are
+        # only complete once the trailer is written.
+        if sync:
+            fsync(temp)
+        os.rename(temp, path)
+    except Exception:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+    return path, True
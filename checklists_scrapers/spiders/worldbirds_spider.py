@@ -11,18 +11,37 @@ from datetime import datetime, timedelta
 
 from scrapy.http import Request, FormRequest
 from scrapy import log
+from scrapy import signals
 from scrapy.spider import BaseSpider
 from scrapy.selector import HtmlXPathSelector
+from twisted.internet import defer
 
 from checklists_scrapers.spiders import DOWNLOAD_FORMAT, DOWNLOAD_LANGUAGE
 from checklists_scrapers.exceptions import LoginException
-from checklists_scrapers.spiders.utils import save_json_data
+from checklists_scrapers.spiders.pool import ParserPool
+from checklists_scrapers.spiders.utils import compile_xpath
+from checklists_scrapers.spiders.writers import get_writer
 
 
 class VisitParser(object):
 
     """Parser for the Visit Highlights on the Latest News page."""
 
+    checklists_xpath = compile_xpath(
+        '(//table[@class="StandardTable"])[1]/tr/td/'
+        'a[starts-with(@onclick, "doHighlights")]/@onclick')
+    locations_xpath = compile_xpath(
+        '(//table[@class="StandardTable"])[1]/tr/td/'
+        'a[starts-with(@onclick, "doLocation")]/@onclick')
+    observers_xpath = compile_xpath(
+        '(//table[@class="StandardTable"])[1]/tr/td/'
+        'a[starts-with(@onclick, "doObserver")]/@onclick')
+    dates_xpath = compile_xpath(
+        '(//table[@class="StandardTable"])[1]/tr/td/text()')
+
+    identifier_regex = re.compile(r"\(([0-9]+)\)")
+    date_regex = re.compile(r"\d{2}/\d{2}/\d{4}")
+
     def __init__(self, response):
         """Initialize the parser the contents of the Latest News page.
 
@@ -42,10 +61,8 @@ class VisitParser(object):
             list: a list containing the identifiers for the checklists
                 extracted from the Visit Highlights table.
         """
-        xpath = '(//table[@class="StandardTable"])[1]/tr/td/' \
-                'a[starts-with(@onclick, "doHighlights")]/@onclick'
         return  [int(attr.split(',')[1].strip())
-                 for attr in self.docroot.select(xpath).extract()]
+                 for attr in self.checklists_xpath.extract(self.docroot)]
 
     def get_locations(self):
         """Get the location identifiers.
@@ -54,10 +71,8 @@ class VisitParser(object):
             list: a list containing the identifiers for the locations
                 extracted from the Visit Highlights table.
         """
-        xpath = '(//table[@class="StandardTable"])[1]/tr/td/' \
-                'a[starts-with(@onclick, "doLocation")]/@onclick'
-        return [int(re.search(r"\(([0-9]+)\)", val).group(1))
-                for val in self.docroot.select(xpath).extract()]
+        return [int(self.identifier_regex.search(val).group(1))
+                for val in self.locations_xpath.extract(self.docroot)]
 
     def get_observers(self):
         """Get the identifiers for the observers.
@@ -66,10 +81,8 @@ class VisitParser(object):
             list: a list containing the identifiers for the observers who
                 submitted the checklists in the Visit Highlights table.
         """
-        xpath = '(//table[@class="StandardTable"])[1]/tr/td/' \
-                'a[starts-with(@onclick, "doObserver")]/@onclick'
-        return [int(re.search(r"\(([0-9]+)\)", val).group(1))
-                for val in self.docroot.select(xpath).extract()]
+        return [int(self.identifier_regex.search(val).group(1))
+                for val in self.observers_xpath.extract(self.docroot)]
 
     def get_dates(self):
         """Get the checklist dates.
@@ -77,10 +90,9 @@ class VisitParser(object):
         Returns:
             list: a list containing the dates for each of the checklists.
         """
-        xpath = '(//table[@class="StandardTable"])[1]/tr/td/text()'
         values = [datetime.strptime(val, "%d/%m/%Y")
-                  for val in self.docroot.select(xpath).extract()
-                  if re.search(r"\d{2}/\d{2}/\d{4}", val)]
+                  for val in self.dates_xpath.extract(self.docroot)
+                  if self.date_regex.search(val)]
         return values
 
     def get_visits(self):
@@ -98,6 +110,14 @@ class ChecklistParser(object):
 
     """Extract the checklist from the popup containing the visit details."""
 
+    table_xpath = compile_xpath('(//table[@class="PopupTable"])[1]')
+    labels_xpath = compile_xpath('tr/td/label/text()')
+    rows_xpath = compile_xpath('tr')
+    cells_xpath = compile_xpath('td')
+    text_xpath = compile_xpath('text()')
+    entries_xpath = compile_xpath('(//table[@class="TableThin"])[1]/tr')
+    columns_xpath = compile_xpath('./td/text()')
+
     def __init__(self, response):
         """Initialize the parser with a JSON encoded response.
 
@@ -143,11 +163,12 @@ class ChecklistParser(object):
             unicode: a date in the form yyyy-mm-dd.
         """
         try:
-            root = self.docroot.select('(//table[@class="PopupTable"])[1]')
-            keys = root.select('tr/td/label/text()').extract()
+            root = self.table_xpath.select(self.docroot)
+            keys = self.labels_xpath.extract(root)
             idx = keys.index('Start date')
-            row = root.select('tr')[idx]
-            value = row.select('td')[1].select('text()').extract()[0].strip()
+            row = self.rows_xpath.select(root)[idx]
+            value = self.text_xpath.extract(
+                self.cells_xpath.select(row)[1])[0].strip()
             day, month, year = value.split('-')
             date = "%s-%s-%s" % (year, month, day)
         except IndexError:
@@ -172,11 +193,12 @@ class ChecklistParser(object):
             unicode: the comment extracted from the checklist.
         """
         try:
-            root = self.docroot.select('(//table[@class="PopupTable"])[1]')
-            keys = root.select('tr/td/label/text()').extract()
+            root = self.table_xpath.select(self.docroot)
+            keys = self.labels_xpath.extract(root)
             idx = keys.index('Other notes for the visit')
-            row = root.select('tr')[idx]
-            value = row.select('td')[1].select('text()').extract()[0].strip()
+            row = self.rows_xpath.select(root)[idx]
+            value = self.text_xpath.extract(
+                self.cells_xpath.select(row)[1])[0].strip()
         except IndexError:
             value = ''
         return value
@@ -191,11 +213,12 @@ class ChecklistParser(object):
         gives the number of observers and the second their names.
         """
         try:
-            root = self.docroot.select('(//table[@class="PopupTable"])[1]')
-            keys = root.select('tr/td/label/text()').extract()
+            root = self.table_xpath.select(self.docroot)
+            keys = self.labels_xpath.extract(root)
             idx = len(keys) - keys[::-1].index('Observers') - 1
-            row = root.select('tr')[idx]
-            value = row.select('td')[1].select('text()').extract()[0].strip()
+            row = self.rows_xpath.select(root)[idx]
+            value = self.text_xpath.extract(
+                self.cells_xpath.select(row)[1])[0].strip()
             names = [name.strip() for name in value.split(',')]
         except IndexError:
             names = []
@@ -212,11 +235,12 @@ class ChecklistParser(object):
             dict: a dictionary containing the fields for a location.
         """
         try:
-            root = self.docroot.select('(//table[@class="PopupTable"])[1]')
-            keys = root.select('tr/td/label/text()').extract()
+            root = self.table_xpath.select(self.docroot)
+            keys = self.labels_xpath.extract(root)
             idx = keys.index('Location')
-            row = root.select('tr')[idx]
-            name = row.select('td')[1].select('text()').extract()[0].strip()
+            row = self.rows_xpath.select(root)[idx]
+            name = self.text_xpath.extract(
+                self.cells_xpath.select(row)[1])[0].strip()
         except IndexError:
             name = ''
         return {
@@ -233,11 +257,12 @@ class ChecklistParser(object):
             dict: a dictionary containing the fields for a protocol.
         """
         try:
-            root = self.docroot.select('(//table[@class="PopupTable"])[1]')
-            keys = root.select('tr/td/label/text()').extract()
+            root = self.table_xpath.select(self.docroot)
+            keys = self.labels_xpath.extract(root)
             idx = keys.index('Time')
-            row = root.select('tr')[idx]
-            value = row.select('td')[1].select('text()').extract()[0].strip()
+            row = self.rows_xpath.select(root)[idx]
+            value = self.text_xpath.extract(
+                self.cells_xpath.select(row)[1])[0].strip()
         except IndexError:
             value = '00:00 - 00:00'
 
@@ -260,11 +285,12 @@ class ChecklistParser(object):
             unicode: the comment extracted from the checklist.
         """
         try:
-            root = self.docroot.select('(//table[@class="PopupTable"])[1]')
-            keys = root.select('tr/td/label/text()').extract()
+            root = self.table_xpath.select(self.docroot)
+            keys = self.labels_xpath.extract(root)
             idx = keys.index('Purpose')
-            row = root.select('tr')[idx]
-            value = row.select('td')[1].select('text()').extract()[0].strip()
+            row = self.rows_xpath.select(root)[idx]
+            value = self.text_xpath.extract(
+                self.cells_xpath.select(row)[1])[0].strip()
         except IndexError:
             value = ''
         return value
@@ -280,8 +306,7 @@ class ChecklistParser(object):
             list(dict): a list containing the dictionaries for each entry in
                 the checklist.
        """
-        xpath = '(//table[@class="TableThin"])[1]/tr'
-        rows = self.docroot.select(xpath)[1:]
+        rows = self.entries_xpath.select(self.docroot)[1:]
         prefix = self.country.upper() + str(self.identifier)
         entries = []
         for idx, row in enumerate(rows):
@@ -300,7 +325,7 @@ class ChecklistParser(object):
         Returns:
             dict: a dictionary containing the fields for a checklist entry.
         """
-        columns = row.select('./td/text()').extract()
+        columns = self.columns_xpath.extract(row)
 
         # If a species was not counted then the checklist displays an image
         # so when the text contents of the table cells are extracts no data
@@ -332,7 +357,7 @@ class ChecklistParser(object):
         that each level in the checklist data structure is handled by different
         methods. It could easily be merged into the get_entry() method.
         """
-        columns = row.select('./td/text()').extract()
+        columns = self.columns_xpath.extract(row)
         return {
             'name': columns[0].strip(),
         }
@@ -342,6 +367,9 @@ class LocationParser(object):
 
     """Extract the location from the popup containing the location details."""
 
+    rows_xpath = compile_xpath(
+        '(//table[@class="PopupTable"])[1]/tr/td/text()')
+
     def __init__(self, response):
         """Initialize the parser the contents of the popup panel.
 
@@ -363,8 +391,7 @@ class LocationParser(object):
         Returns:
             dict: the dict containing the checklist data.
         """
-        xpath = '(//table[@class="PopupTable"])[1]/tr/td/text()'
-        rows = self.docroot.select(xpath).extract()
+        rows = self.rows_xpath.extract(self.docroot)
         location = self.checklist['location']
         location['identifier'] = self.country.upper() + str(self.identifier)
         location['country'] = rows[1].strip()
@@ -378,6 +405,9 @@ class ObserverParser(object):
 
     """Extract the observer from the popup containing the observer details."""
 
+    rows_xpath = compile_xpath(
+        '(//table[@class="PopupTable"])[1]/tr/td/text()')
+
     def __init__(self, response):
         """Initialize the parser the contents of the popup panel.
 
@@ -397,8 +427,7 @@ class ObserverParser(object):
         Returns:
             dict: the dict containing the checklist data.
         """
-        xpath = '(//table[@class="PopupTable"])[1]/tr/td/text()'
-        rows = self.docroot.select(xpath).extract()
+        rows = self.rows_xpath.extract(self.docroot)
         if not 'source' in self.checklist:
             self.checklist['source'] = {}
         self.checklist['source']['submitted_by'] = rows[1].strip()
@@ -441,8 +470,39 @@ class WorldBirdsSpider(BaseSpider):
     will be written in JSON format. The directory will be created if it does
     not exist.
 
+    DOWNLOAD_OUTPUT: set to 'segments' to append the checklists to
+    rotating JSON Lines files rather than writing each one to a separate
+    JSON file. DOWNLOAD_SEGMENT_SIZE sets the size, in MB, of each segment.
+    Set it to 'sqlite' to write the checklists to tables in the SQLite
+    database DOWNLOAD_DATABASE, committing every DOWNLOAD_DATABASE_BATCH
+    checklists.
+
+    DOWNLOAD_COMPRESSION: set to 'gzip' or 'bz2' to compress the checklists
+    written to DOWNLOAD_DIR.
+
+    DOWNLOAD_SYNC_FILES, DOWNLOAD_SYNC_SECONDS: each checklist is flushed
+    to disk before it is renamed and the directory is flushed in batches of
+    this many files or after this many seconds.
+
+    DOWNLOAD_SKIP_UNCHANGED: do not write the file for a checklist again if
+    it already contains the same data.
+
+    DOWNLOAD_LAYOUT: set to 'date' or 'hash' to write the files to
+    sub-directories of DOWNLOAD_DIR rather than directly to it.
+
+    DOWNLOAD_WRITER_THREADS: the number of background threads used to write
+    the checklists, and DOWNLOAD_WRITER_QUEUE, the maximum number waiting to
+    be written.
+
     DURATION: the number of days to fetch checklists for.
 
+    PARSER_POOL_SIZE: the number of worker processes used to parse the
+    popups containing the checklist, location and observer details. If set
+    to 0 the popups are parsed by the spider.
+
+    PARSER_POOL_TIMEOUT: the number of seconds to wait for a worker process
+    to parse a popup before it is reported as an error.
+
     The spider keeps a list of checklists downloaded and save along with any
     errors raised. These are used to create a status report by the extension,
     SpiderStatusReport which is emailed out when the spider finishes.
@@ -493,6 +553,24 @@ class WorldBirdsSpider(BaseSpider):
         self.checklists = []
         self.errors = []
 
+        # The worker processes used to parse the popups, if any.
+        self.pool = None
+
+        # The writer used to save the checklists, created when the first
+        # checklist is saved.
+        self.writer = None
+
+    def set_crawler(self, crawler):
+        """Connect the signal used to stop the worker processes and close
+        the writer.
+
+        Args:
+            crawler (Crawler): the crawler running the spider.
+        """
+        super(WorldBirdsSpider, self).set_crawler(crawler)
+        crawler.signals.connect(self.spider_closed,
+                                signal=signals.spider_closed)
+
     def start_requests(self):
         """Configure the spider and get the login page for database.
 
@@ -511,8 +589,50 @@ class WorldBirdsSpider(BaseSpider):
             os.makedirs(self.directory)
         self.log("Writing checklists to %s" % self.directory, log.INFO)
 
+        pool_size = int(self.settings['PARSER_POOL_SIZE'])
+        if pool_size:
+            self.pool = ParserPool(
+                pool_size, int(self.settings['PARSER_POOL_TIMEOUT']))
+            self.log("Parsing popups with %d worker processes" % pool_size,
+                     log.INFO)
+
         return [Request(url=self.start_url, callback=self.select_language)]
 
+    def spider_closed(self, spider):
+        """Stop the worker processes used to parse the popups and close the
+        writer used to save the checklists.
+
+        Args:
+            spider (BaseSpider): the spider that was closed.
+        """
+        if spider is not self:
+            return
+
+        if self.pool is not None:
+            self.pool.close()
+
+        if self.writer is not None:
+            self.writer.close()
+
+    def parse_popup(self, parser_class, response, callback):
+        """Parse the contents of a popup and process the checklist.
+
+        Args:
+            parser_class (class): the parser used to extract the checklist.
+            response (Response): the contents of the popup.
+            callback (callable): called with the checklist extracted.
+
+        Returns:
+            list or Deferred: the value returned by the callback or, if the
+                popup is parsed in a worker process, a Deferred that fires
+                with the value.
+        """
+        if self.pool is None:
+            return callback(parser_class(response).get_checklist(), response)
+        deferred = self.pool.parse(parser_class, response)
+        deferred.addCallback(callback, response)
+        return deferred
+
     def select_language(self, response):
         """Select the language.
 
@@ -602,20 +722,33 @@ class WorldBirdsSpider(BaseSpider):
         Returns:
             Request: a request to get the details of the checklist location.
         """
-        checklist = self.checklist_parser(response).get_checklist()
+        return self.parse_popup(self.checklist_parser, response,
+                                self.get_location_request)
+
+    def get_location_request(self, checklist, response):
+        """Get the request for the location popup.
+
+        Args:
+            checklist (dict): the checklist extracted from the popup.
+            response (Response): the contents of the checklist popup.
+
+        Returns:
+            list(Request): a request to get the details of the checklist
+                location.
+        """
         ids = response.meta['identifiers']
         country = response.meta['country']
 
         url = "http://%s/worldbirds/getdata.php?a=LocationDetails&id=%s"
 
-        yield Request(
+        return [Request(
             url=url % (self.server, ids[1]),
             callback=self.parse_location,
             dont_filter=True,
             meta={'identifiers': ids,
                   'checklist': checklist,
                   'country': country}
-        )
+        )]
 
     def parse_location(self, response):
         """Parse the contents of the location popup.
@@ -627,20 +760,33 @@ class WorldBirdsSpider(BaseSpider):
         Returns:
             Request: a request to get the details of the checklist observer.
         """
-        parser = self.location_parser(response)
+        return self.parse_popup(self.location_parser, response,
+                                self.get_observer_request)
+
+    def get_observer_request(self, checklist, response):
+        """Get the request for the observer popup.
+
+        Args:
+            checklist (dict): the checklist updated with the location.
+            response (Response): the contents of the location popup.
+
+        Returns:
+            list(Request): a request to get the details of the checklist
+                observer.
+        """
         ids = response.meta['identifiers']
 
         url = "http://%s/worldbirds/getdata.php" \
               "?a=ObserverDetails&id=%s"
 
-        yield Request(
+        return [Request(
             url=url % (self.server, ids[2]),
             callback=self.parse_observer,
             dont_filter=True,
             meta={'identifiers': ids,
-                  'checklist': parser.get_checklist(),
+                  'checklist': checklist,
                   'country': self.country}
-        )
+        )]
 
     def parse_observer(self, response):
         """Parse the contents of the observer popup and save the checklist.
@@ -649,8 +795,9 @@ class WorldBirdsSpider(BaseSpider):
             response (Response): the contents of the popup used to display
                 the details of the observer who submitted the checklist.
         """
-        parser = self.observer_parser(response)
-        self.save_checklist(parser.get_checklist())
+        return self.parse_popup(
+            self.observer_parser, response,
+            lambda checklist, response: self.save_checklist(checklist))
 
     def save_checklist(self, checklist):
         """Save the checklist in JSON format.
@@ -661,20 +808,57 @@ class WorldBirdsSpider(BaseSpider):
         The filename using the source, in this case 'worldbirds' and the
         checklist identifier so that the data is always written to the same
         file. The directory where the files are written is defined by the
-        setting DOWNLOAD_DIR. If the directory attribute is set to None then
-        the checklist is not saved (used for testing).
-
-        The saved checklist is added to the list of checklists downloaded so
-        far so it can be used to generate a status report once the spider has
-        finished.
-        """
-        if self.directory:
-            source = checklist['source']['name'].replace(' ', '-').lower()
-            path = os.path.join(self.directory, "%s-%s.json" % (
-                source, checklist['identifier']))
-            save_json_data(path, checklist)
-            self.checklists.append(checklist)
-
-            self.log("Wrote %s: %s %s (%s)" % (
-                path, checklist['date'], checklist['location']['name'],
-                checklist['source']['submitted_by']), log.INFO)
+        setting DOWNLOAD_DIR, in the sub-directory set by DOWNLOAD_LAYOUT, if
+        any. If the directory attribute is set to None then the checklist is
+        not saved (used for testing). If DOWNLOAD_OUTPUT is set to 'segments'
+        then the checklist is appended to a JSON Lines file instead and if
+        it is set to 'sqlite' it is written to a SQLite database.
+
+        Once the checklist is saved it is added to the list of checklists
+        downloaded so far so it can be used to generate a status report once
+        the spider has finished.
+
+        Returns:
+            Deferred: if DOWNLOAD_WRITER_THREADS is set, fires with None once
+                the checklist has been written. Any error is added to the
+                list of errors in the status report. Otherwise None is
+                returned once the checklist is saved.
+        """
+        if not self.directory:
+            return None
+
+        source = checklist['source']['name'].replace(' ', '-').lower()
+        if self.writer is None:
+            self.writer = get_writer(self.settings, self.directory,
+                                     self.name, self.crawler.stats, self)
+        result = self.writer.write(source, checklist)
+
+        if isinstance(result, defer.Deferred):
+            return result.addCallbacks(
+                self.checklist_saved, self.checklist_failed,
+                callbackArgs=(checklist,), errbackArgs=(checklist,))
+        return self.checklist_saved(result, checklist)
+
+    def checklist_saved(self, result, checklist):
+        """Record a checklist once it has been saved.
+
+        Args:
+            result: the value returned by the writer, ignored.
+            checklist (dict): the checklist.
+        """
+        self.checklists.append(checklist)
+        self.log("Saved %s: %s %s (%s)" % (
+            checklist['identifier'], checklist['date'],
+            checklist['location']['name'],
+            checklist['source']['submitted_by']), log.INFO)
+
+    def checklist_failed(self, failure, checklist):
+        """Record an error raised while writing a checklist in a thread.
+
+        Args:
+            failure (Failure): the error.
+            checklist (dict): the checklist.
+        """
+        self.errors.append((checklist['source'].get('url'), failure))
+        self.log("Could not save checklist %s: %s" % (
+            checklist['identifier'], failure.getErrorMessage()), log.ERROR)
@@ -0,0 +1,791 @@
+"""Writers for saving the checklists downloaded by the spiders."""
+
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from twisted.internet import defer, reactor
+from twisted.python import threadable
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+
+from checklists_scrapers.spiders.utils import fsync, save_json_data
+from checklists_scrapers.utils import COMPRESSION, LAYOUTS, get_shard, \
+    open_file
+
+
+class SyncBatch(object):
+
+    """Flush the directories containing the files written in batches.
+
+    Each file is written to a temporary file which is flushed to disk before
+    it is renamed so the name never refers to a file which is incomplete.
+    The rename only becomes durable once the directory is flushed too, but
+    doing that for every checklist makes saving a large download slow.
+    Instead the files are added to a batch and once the batch contains the
+    given number of files, or the given number of seconds have passed since
+    the first file was added, each of the directories containing them is
+    flushed. While the reactor is running a timer is started with each new
+    batch so it is flushed on time even if no more files are written, for
+    example while the spider is waiting to request web pages again. Any
+    files remaining in the batch are flushed when the writer is closed.
+    After a crash a file in the last batch may be missing but it is never
+    truncated.
+    """
+
+    def __init__(self, files, seconds):
+        """Initialize the batch.
+
+        Args:
+            files (int): the number of files in a batch. If 0 then neither
+                the files nor the directories are flushed.
+            seconds (float): the batch is also flushed once the first file
+                in the batch has waited this long.
+
+        Returns:
+            SyncBatch: an empty batch.
+        """
+        self.files = files
+        self.seconds = seconds
+        self.paths = []
+        self.started = None
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def add(self, path):
+        """Add a file to the batch, flushing the batch if it is complete.
+
+        Args:
+            path (str): the path to the file.
+        """
+        if not self.files:
+            return
+        with self.lock:
+            if not self.paths:
+                self.started = time.time()
+                self.call_in_reactor(self.start_timer)
+            self.paths.append(path)
+            if len(self.paths) < self.files and \
+                    time.time() - self.started < self.seconds:
+                return
+            paths, self.paths = self.paths, []
+        self.flush(paths)
+
+    @property
+    def enabled(self):
+        """Whether the files are flushed to disk."""
+        return bool(self.files)
+
+    def sync(self):
+        """Flush the directories containing the files in the batch."""
+        with self.lock:
+            paths, self.paths = self.paths, []
+        self.call_in_reactor(self.stop_timer)
+        self.flush(paths)
+
+    def call_in_reactor(self, function):
+        """Call a function on the reactor thread, if the reactor is running.
+
+        Args:
+            function (callable): the function, called with no arguments.
+
+        The batch may be added to from the threads used by ThreadedWriter
+        but the reactor must only be used from its own thread.
+        """
+        if not self.seconds or not reactor.running:
+            return
+        if threadable.isInIOThread():
+            function()
+        else:
+            reactor.callFromThread(function)
+
+    def start_timer(self):
+        """Flush the batch once the first file has waited long enough."""
+        if self.timer is None or not self.timer.active():
+            self.timer = reactor.callLater(self.seconds, self.sync)
+
+    def stop_timer(self):
+        """Cancel the timer for the batch, if it has not already fired."""
+        if self.timer is not None and self.timer.active():
+            self.timer.cancel()
+        self.timer = None
+
+    def flush(self, paths):
+        """Flush the directories containing a list of files.
+
+        Args:
+            paths (list(str)): the paths to the files.
+        """
+        for directory in set(os.path.dirname(path) or '.' for path in paths):
+            fsync(directory)
+
+
+class WriteStats(object):
+
+    """Record the throughput of a writer in the crawler stats.
+
+    The number of checklists and bytes written are recorded along with the
+    rates, in checklists/sec and MB/sec, based on the time spent writing.
+    With the default output, one file per checklist, the number of
+    checklists per second is also the number of files per second. The stats
+    are updated as each checklist is written so the values are complete when
+    the status report is generated, whatever order the spider_closed signal
+    handlers are called in.
+    """
+
+    prefix = 'checklists/writer/'
+
+    def __init__(self, stats, spider):
+        """Initialize the stats.
+
+        Args:
+            stats (StatsCollector): the crawler stats. If None then the
+                stats are not recorded.
+            spider (BaseSpider): the spider saving the checklists.
+
+        Returns:
+            WriteStats: the recorder for the stats.
+        """
+        self.stats = stats
+        self.spider = spider
+        self.checklists = 0
+        self.skipped = 0
+        self.waits = 0
+        self.bytes = 0
+        self.elapsed = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, checklists, size, elapsed):
+        """Record the checklists written.
+
+        Args:
+            checklists (int): the number of checklists written.
+            size (int): the number of bytes written.
+            elapsed (float): the time taken, in seconds.
+        """
+        with self.lock:
+            self.checklists += checklists
+            self.bytes += size
+            self.elapsed += elapsed
+            self.update()
+
+    def update(self):
+        """Update the values in the crawler stats."""
+        if self.stats is None:
+            return
+
+        self.stats.set_value(self.prefix + 'checklists', self.checklists,
+                             spider=self.spider)
+        self.stats.set_value(self.prefix + 'bytes', self.bytes,
+                             spider=self.spider)
+        if self.elapsed:
+            self.stats.set_value(
+                self.prefix + 'checklists_per_sec',
+                round(self.checklists / self.elapsed, 1), spider=self.spider)
+            self.stats.set_value(
+                self.prefix + 'mb_per_sec',
+                round(self.bytes / self.elapsed / 1024 / 1024, 2),
+                spider=self.spider)
+
+    def skip(self):
+        """Record a checklist that was not written since it was unchanged."""
+        with self.lock:
+            self.skipped += 1
+            if self.stats is not None:
+                self.stats.set_value(self.prefix + 'skipped', self.skipped,
+                                     spider=self.spider)
+
+    def wait(self):
+        """Record a checklist that had to wait for space in the queue."""
+        with self.lock:
+            self.waits += 1
+            if self.stats is not None:
+                self.stats.set_value(self.prefix + 'waits', self.waits,
+                                     spider=self.spider)
+
+
+class FileWriter(object):
+
+    """Write each checklist to a separate JSON file.
+
+    This is the default output. The name of each file is derived from the
+    source and the identifier of the checklist so a checklist is always
+    written to the same file each time the spiders are run. The layout sets
+    whether the files are written directly to the directory or spread
+    across sub-directories, by source and date or by a hash of the
+    identifier, so no single directory holds millions of files. See
+    get_shard() for details.
+
+    If skip_unchanged is set then a checklist is only written if the file
+    does not exist or the contents have changed. The modification time of
+    the files for checklists downloaded again is then left unchanged so
+    loaders which check for new files do not import them again.
+    """
+
+    def __init__(self, directory, compression='', sync=None, stats=None,
+                 skip_unchanged=False, layout='flat'):
+        """Initialize the writer.
+
+        Args:
+            directory (str): the directory where the files are written.
+
+        Kwargs:
+            compression (str): the codec used to compress the files, either
+                'gzip' or 'bz2'. The default, '', does not compress them.
+            sync (SyncBatch): the batch used to flush the files to disk. If
+                None the files are not flushed.
+            stats (WriteStats): where the throughput is recorded.
+            skip_unchanged (bool): whether files which already contain the
+                same checklist are written again.
+            layout (str): the layout of the directory tree, either 'flat',
+                'date' or 'hash'.
+
+        Returns:
+            FileWriter: a writer for saving checklists.
+        """
+        self.directory = directory
+        self.compression = compression
+        self.sync = sync or SyncBatch(0, 0)
+        self.stats = stats or WriteStats(None, None)
+        self.skip_unchanged = skip_unchanged
+        self.layout = layout
+
+    def write(self, source, checklist):
+        """Write a checklist.
+
+        Args:
+            source (str): the name of the source used in the file name, e.g.
+                eBird.
+            checklist (dict): the checklist.
+
+        Returns:
+            str: the path to the file where the checklist was written.
+        """
+        start = time.time()
+        directory = os.path.join(self.directory, get_shard(
+            self.layout, source, checklist['identifier'], checklist['date']))
+        if not os.path.exists(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Another writer may have created it in the meantime.
+                if not os.path.isdir(directory):
+                    raise
+        path, written = save_json_data(
+            os.path.join(directory, "%s-%s.json" % (
+                source, checklist['identifier'])),
+            checklist, self.compression, self.skip_unchanged,
+            self.sync.enabled)
+        if written:
+            self.sync.add(path)
+            self.stats.record(1, os.path.getsize(path), time.time() - start)
+        else:
+            self.stats.skip()
+        return path
+
+    def close(self):
+        """Flush the directories for any files not yet synced to disk."""
+        self.sync.sync()
+
+
+class SegmentWriter(object):
+
+    """Append checklists to rotating JSON Lines segment files.
+
+    Each checklist is encoded in compact JSON, on a single line, and appended
+    to the current segment. Once a segment reaches the rotation size it is
+    closed and the next checklist starts a new one. Segments are named
+    <prefix>-<timestamp>-<number>.jsonl, using the time the writer was
+    created, so the segments from each run are kept separate and sort in the
+    order they were written. Large downloads are therefore saved in a few
+    files rather than one file per checklist. If the segments are compressed
+    the rotation size is the size of the data before it is compressed.
+
+    While a segment is being written it is hidden, with a leading '.' in the
+    name, and it is only renamed once it is closed so loaders never read a
+    partially written segment.
+
+    A checklist downloaded again on a later run is written to that run's
+    segments so loaders should process the segments in order and let the
+    later copy replace the earlier one.
+    """
+
+    def __init__(self, directory, prefix, size, compression='', sync=None,
+                 stats=None):
+        """Initialize the writer.
+
+        Args:
+            directory (str): the directory where the segments are written.
+            prefix (str): the start of the name of each segment, e.g. the
+                name of the spider.
+            size (int): the size, in bytes, at which segments are rotated.
+
+        Kwargs:
+            compression (str): the codec used to compress the segments,
+                either 'gzip' or 'bz2'. The default, '', does not compress
+                them.
+            sync (SyncBatch): the batch used to flush the segments to disk.
+                If None the segments are not flushed.
+            stats (WriteStats): where the throughput is recorded.
+
+        Returns:
+            SegmentWriter: a writer for saving checklists.
+        """
+        self.directory = directory
+        self.prefix = prefix
+        self.size = size
+        self.compression = compression
+        self.sync = sync or SyncBatch(0, 0)
+        self.stats = stats or WriteStats(None, None)
+        self.started = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+        self.segments = 0
+        self.path = None
+        self.fp = None
+        self.lock = threading.RLock()
+
+    def write(self, source, checklist):
+        """Write a checklist.
+
+        Args:
+            source (str): the name of the source used in the file names for
+                the per-file output. It is not used since the checklists are
+                appended to the current segment.
+            checklist (dict): the checklist.
+
+        Returns:
+            str: the path to the segment where the checklist was written.
+        """
+        start = time.time()
+        line = json.dumps(checklist, sort_keys=True, separators=(',', ':'))
+
+        with self.lock:
+            if self.fp is None:
+                self.segments += 1
+                self.path = os.path.join(
+                    self.directory, "%s-%s-%04d.jsonl%s" % (
+                        self.prefix, self.started, self.segments,
+                        COMPRESSION[self.compression]))
+                self.fp = open_file(self.get_temp_path(), 'wb')
+
+            self.fp.write(line)
+            self.fp.write('\n')
+
+            self.stats.record(1, 0, time.time() - start)
+
+            path = self.path
+            if self.fp.tell() >= self.size:
+                self.close()
+        return path
+
+    def get_temp_path(self):
+        """Get the path used while the current segment is being written.
+
+        Returns:
+            str: the path of the hidden file.
+        """
+        directory, filename = os.path.split(self.path)
+        return os.path.join(directory, '.' + filename)
+
+    def close(self):
+        """Close the current segment and flush the directory for any
+        segments not yet synced to disk."""
+        with self.lock:
+            if self.fp is not None:
+                start = time.time()
+                self.fp.close()
+                self.fp = None
+                if self.sync.enabled:
+                    fsync(self.get_temp_path())
+                os.rename(self.get_temp_path(), self.path)
+                self.sync.add(self.path)
+                self.stats.record(0, os.path.getsize(self.path),
+                                  time.time() - start)
+        self.sync.sync()
+
+
+class DatabaseWriter(object):
+
+    """Write the checklists to tables in a SQLite database.
+
+    Each checklist is split into rows in the tables checklists, locations,
+    observers, entries and details so the checklists can be queried, by
+    date or location for example, without loading and parsing the JSON.
+    The rows for a checklist are replaced when it is downloaded again, keyed
+    on the identifier of the checklist and the identifiers of the entries.
+    Any entries deleted from the checklist at the source are also deleted.
+    Entries without an identifier are given one using the identifier of the
+    checklist and the position of the entry in the list.
+
+    The checklists are committed in batches, every batch checklists, and
+    when the writer is closed, rather than one transaction per checklist.
+    The database uses write-ahead logging so it can be queried while a
+    spider is writing to it.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS locations (
+            source TEXT NOT NULL,
+            identifier TEXT NOT NULL,
+            name TEXT,
+            county TEXT,
+            region TEXT,
+            country TEXT,
+            lat REAL,
+            lon REAL,
+            PRIMARY KEY (source, identifier)
+        );
+        CREATE TABLE IF NOT EXISTS checklists (
+            identifier TEXT PRIMARY KEY,
+            source TEXT NOT NULL,
+            url TEXT,
+            submitted_by TEXT,
+            language TEXT,
+            date TEXT NOT NULL,
+            time TEXT,
+            location TEXT,
+            activity TEXT,
+            protocol TEXT,
+            duration_hours INTEGER,
+            duration_minutes INTEGER,
+            distance REAL,
+            area REAL,
+            observer_count INTEGER,
+            comment TEXT
+        );
+        CREATE INDEX IF NOT EXISTS checklists_date ON checklists (date);
+        CREATE INDEX IF NOT EXISTS checklists_location
+            ON checklists (source, location);
+        CREATE TABLE IF NOT EXISTS observers (
+            checklist TEXT NOT NULL,
+            name TEXT NOT NULL,
+            PRIMARY KEY (checklist, name)
+        );
+        CREATE INDEX IF NOT EXISTS observers_name ON observers (name);
+        CREATE TABLE IF NOT EXISTS entries (
+            identifier TEXT PRIMARY KEY,
+            checklist TEXT NOT NULL,
+            species TEXT NOT NULL,
+            scientific_name TEXT,
+            count INTEGER,
+            comment TEXT
+        );
+        CREATE INDEX IF NOT EXISTS entries_checklist ON entries (checklist);
+        CREATE INDEX IF NOT EXISTS entries_species ON entries (species);
+        CREATE TABLE IF NOT EXISTS details (
+            entry TEXT NOT NULL,
+            age TEXT,
+            sex TEXT,
+            count INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS details_entry ON details (entry);
+    """
+
+    def __init__(self, path, batch=1000, stats=None):
+        """Open (or create) the database.
+
+        Args:
+            path (str): the path to the SQLite database file.
+
+        Kwargs:
+            batch (int): the number of checklists written in each
+                transaction.
+            stats (WriteStats): where the throughput is recorded.
+
+        Returns:
+            DatabaseWriter: a writer for saving checklists.
+        """
+        self.path = path
+        self.batch = batch
+        self.stats = stats or WriteStats(None, None)
+        self.pending = 0
+        self.lock = threading.Lock()
+        # The connection is shared by the threads of a ThreadedWriter, the
+        # lock makes sure only one of them uses it at a time.
+        self.connection = sqlite3.connect(path, timeout=60,
+                                          check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.executescript(self.schema)
+        self.connection.commit()
+
+    def write(self, source, checklist):
+        """Write a checklist.
+
+        Args:
+            source (str): the name of the source, e.g. eBird. The name in
+                the checklist is saved rather than this one which is only
+                used in the file names for the per-file output.
+            checklist (dict): the checklist.
+
+        Returns:
+            str: the path to the database where the checklist was written.
+        """
+        start = time.time()
+        with self.lock:
+            self.save_checklist(checklist)
+            self.pending += 1
+            if self.pending >= self.batch:
+                self.commit()
+            self.stats.record(1, 0, time.time() - start)
+        return self.path
+
+    def save_checklist(self, checklist):
+        """Insert or replace the rows for a checklist.
+
+        Args:
+            checklist (dict): the checklist.
+        """
+        identifier = checklist['identifier']
+        source = checklist.get('source', {})
+        location = checklist.get('location', {})
+        protocol = checklist.get('protocol', {})
+        observers = checklist.get('observers', {})
+        location_id = location.get('identifier') or location.get('name')
+
+        if location_id:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO locations (source, identifier, name,"
+                " county, region, country, lat, lon)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (source.get('name'), location_id, location.get('name'),
+                 location.get('county'), location.get('region'),
+                 location.get('country'), location.get('lat'),
+                 location.get('lon')))
+
+        self.connection.execute(
+            "INSERT OR REPLACE INTO checklists (identifier, source, url,"
+            " submitted_by, language, date, time, location, activity,"
+            " protocol, duration_hours, duration_minutes, distance, area,"
+            " observer_count, comment)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (identifier, source.get('name'), source.get('url'),
+             source.get('submitted_by'),
+             checklist.get('meta', {}).get('language'), checklist['date'],
+             protocol.get('time'), location_id, checklist.get('activity'),
+             protocol.get('name'), protocol.get('duration_hours'),
+             protocol.get('duration_minutes'), protocol.get('distance'),
+             protocol.get('area'), observers.get('count'),
+             checklist.get('comment')))
+
+        self.connection.execute(
+            "DELETE FROM observers WHERE checklist = ?", (identifier,))
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO observers (checklist, name) VALUES (?, ?)",
+            [(identifier, name) for name in observers.get('names', [])])
+
+        self.connection.execute(
+            "DELETE FROM details WHERE entry IN"
+            " (SELECT identifier FROM entries WHERE checklist = ?)",
+            (identifier,))
+
+        entries = []
+        details = []
+        for idx, entry in enumerate(checklist.get('entries', [])):
+            entry_id = entry.get('identifier') or \
+                "%s-%03d" % (identifier, idx)
+            species = entry.get('species', {})
+            entries.append((entry_id, identifier, species.get('name'),
+                            species.get('scientific_name'),
+                            entry.get('count'), entry.get('comment')))
+            for detail in entry.get('details', []):
+                details.append((entry_id, detail.get('age'),
+                                detail.get('sex'), detail.get('count')))
+
+        current = set(row[0] for row in entries)
+        stale = [(row[0],) for row in self.connection.execute(
+            "SELECT identifier FROM entries WHERE checklist = ?",
+            (identifier,)) if row[0] not in current]
+        self.connection.executemany(
+            "DELETE FROM entries WHERE identifier = ?", stale)
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO entries (identifier, checklist, species,"
+            " scientific_name, count, comment) VALUES (?, ?, ?, ?, ?, ?)",
+            entries)
+        self.connection.executemany(
+            "INSERT INTO details (entry, age, sex, count) VALUES (?, ?, ?, ?)",
+            details)
+
+    def commit(self):
+        """Commit the checklists written since the last commit."""
+        self.connection.commit()
+        self.pending = 0
+
+    def close(self):
+        """Commit any outstanding checklists and close the database."""
+        with self.lock:
+            if self.connection is None:
+                return
+            self.commit()
+            self.connection.close()
+            self.connection = None
+
+
+class ThreadedWriter(object):
+
+    """Write checklists from a pool of background threads.
+
+    Each checklist is passed to the wrapped writer in one of the threads so
+    encoding the JSON, compressing it and writing it to disk do not block
+    the reactor thread that is crawling the pages. write() returns a
+    Deferred which fires, on the reactor thread, once the checklist has been
+    written.
+
+    At most size checklists are written or waiting for a thread at any
+    time. Any more wait, without blocking the reactor, until there is room
+    and each time that happens it is counted in the stats as
+    checklists/writer/waits. The spider callbacks return the Deferreds so
+    Scrapy holds on to the responses until their checklists are written
+    and stops downloading more pages when too many responses are waiting.
+    A slow disk therefore holds back the crawl rather than letting the
+    checklists pile up in memory.
+
+    The writer must be closed before the status report is generated so
+    every checklist is written and the stats are complete. The spiders do
+    this in the WriterPipeline which Scrapy closes, waiting for the Deferred
+    returned by close(), before the spider_closed signal is sent.
+    """
+
+    def __init__(self, writer, threads, size, stats=None):
+        """Initialize the writer.
+
+        Args:
+            writer (FileWriter, SegmentWriter or DatabaseWriter): the writer
+                used to save the checklists.
+            threads (int): the number of threads in the pool.
+            size (int): the maximum number of checklists being written or
+                waiting for a thread.
+
+        Kwargs:
+            stats (WriteStats): where the number of times a checklist had to
+                wait for room is recorded.
+
+        Returns:
+            ThreadedWriter: a writer for saving checklists.
+        """
+        self.writer = writer
+        self.stats = stats or WriteStats(None, None)
+        self.slots = defer.DeferredSemaphore(size)
+        self.pending = set()
+        self.closed = None
+        self.pool = ThreadPool(threads, threads, 'ThreadedWriter')
+        self.pool.start()
+        self.trigger = reactor.addSystemEventTrigger(
+            'during', 'shutdown', self.pool.stop)
+
+    def write(self, source, checklist):
+        """Write a checklist in one of the threads.
+
+        Args:
+            source (str): the name of the source used in the file name, e.g.
+                eBird.
+            checklist (dict): the checklist.
+
+        Returns:
+            Deferred: fires with the path returned by the wrapped writer or
+                fails with the error raised while writing the checklist.
+        """
+        if not self.slots.tokens:
+            self.stats.wait()
+        deferred = self.slots.run(deferToThreadPool, reactor, self.pool,
+                                  self.writer.write, source, checklist)
+        self.pending.add(deferred)
+        deferred.addBoth(self.finished, deferred)
+        return deferred
+
+    def finished(self, result, deferred):
+        """Forget a checklist once it has been written."""
+        self.pending.discard(deferred)
+        return result
+
+    def close(self):
+        """Wait for the checklists being written then close the writer.
+
+        Returns:
+            Deferred: fires once every checklist has been written, the wrapped
+                writer has been closed and the threads have stopped.
+        """
+        if self.closed is None:
+            self.closed = defer.DeferredList(list(self.pending))
+            self.closed.addCallback(
+                lambda _: deferToThreadPool(reactor, self.pool,
+                                            self.writer.close))
+            self.closed.addBoth(self.stop)
+        deferred = defer.Deferred()
+        self.closed.addBoth(self.notify, deferred)
+        return deferred
+
+    def stop(self, result):
+        """Stop the threads once the writer is closed."""
+        reactor.removeSystemEventTrigger(self.trigger)
+        self.pool.stop()
+        return result
+
+    def notify(self, result, deferred):
+        """Fire a Deferred returned by close()."""
+        deferred.callback(result)
+        return result
+
+
+def get_writer(settings, directory, prefix, stats=None, spider=None):
+    """Create the writer selected by the DOWNLOAD_OUTPUT setting.
+
+    Args:
+        settings (Settings): the crawler settings.
+        directory (str): the directory where the checklists are written.
+        prefix (str): the start of the name of each JSON Lines segment.
+
+    Kwargs:
+        stats (StatsCollector): the crawler stats where the throughput of
+            the writer is recorded.
+        spider (BaseSpider): the spider the stats are recorded for.
+
+    Returns:
+        FileWriter, SegmentWriter, DatabaseWriter or ThreadedWriter: the
+            writer for the checklists. If DOWNLOAD_WRITER_THREADS is greater
+            than zero then the checklists are written from a pool of
+            background threads. With 'sqlite' the database is written to
+            DOWNLOAD_DATABASE or, if it is not set, checklists.sqlite3 in
+            the directory.
+
+    Raises:
+        ValueError: if DOWNLOAD_OUTPUT is not 'files', 'segments' or 'sqlite',
+            DOWNLOAD_COMPRESSION is not '', 'gzip' or 'bz2' or DOWNLOAD_LAYOUT
+            is not 'flat', 'date' or 'hash'.
+    """
+    compression = settings['DOWNLOAD_COMPRESSION']
+    if compression not in COMPRESSION:
+        raise ValueError("Unknown value for DOWNLOAD_COMPRESSION: %s" %
+                         compression)
+
+    layout = settings['DOWNLOAD_LAYOUT']
+    if layout not in LAYOUTS:
+        raise ValueError("Unknown value for DOWNLOAD_LAYOUT: %s" % layout)
+
+    sync = SyncBatch(int(settings['DOWNLOAD_SYNC_FILES']),
+                     float(settings['DOWNLOAD_SYNC_SECONDS']))
+    write_stats = WriteStats(stats, spider)
+
+    output = settings['DOWNLOAD_OUTPUT']
+    if output == 'files':
+        writer = FileWriter(directory, compression, sync, write_stats,
+                            settings['DOWNLOAD_SKIP_UNCHANGED'], layout)
+    elif output == 'segments':
+        size = int(settings['DOWNLOAD_SEGMENT_SIZE']) * 1024 * 1024
+        writer = SegmentWriter(directory, prefix, size, compression, sync,
+                               write_stats)
+    elif output == 'sqlite':
+        path = settings['DOWNLOAD_DATABASE'] or \
+            os.path.join(directory, 'checklists.sqlite3')
+        writer = DatabaseWriter(path, int(settings['DOWNLOAD_DATABASE_BATCH']),
+                                write_stats)
+    else:
+        raise ValueError("Unknown value for DOWNLOAD_OUTPUT: %s" % output)
+
+    pool_size = int(settings['DOWNLOAD_WRITER_THREADS'])
+    if pool_size > 0:
+        writer = ThreadedWriter(writer, pool_size,
+                                int(settings['DOWNLOAD_WRITER_QUEUE']),
+                                write_stats)
+    return writer
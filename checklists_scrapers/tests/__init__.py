@@ -1,6 +1,6 @@
 """Project tests.
 
-Two categories of tests are available:
+Three categories of tests are available:
 
     spiders - unit test verifying the basic operation of the scrapers and the
     parsers they use to extract data,
@@ -9,4 +9,7 @@ Two categories of tests are available:
     directory to download and extract data from third-party sites to verify
     the correct behaviour of the scrapers. These tests are also useful to
     check for changes to the sites that require the scrapers to be updated.
+
+    benchmarks - scripts that time the parsers and spiders on synthetic data
+    so the effect of changes on performance can be measured.
 """
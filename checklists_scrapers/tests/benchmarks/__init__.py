@@ -0,0 +1,11 @@
+"""Benchmarks for the scrapers.
+
+Each module is a script that generates synthetic data, runs one of the
+parsers or spider methods over it and prints the timings. The scripts are
+run directly, for example:
+
+    python -m checklists_scrapers.tests.benchmarks.benchmark_json_parser
+
+The modules are not named test_* so nose does not collect them when the
+unit tests are run.
+"""
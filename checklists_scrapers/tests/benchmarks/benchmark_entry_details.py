@@ -0,0 +1,93 @@
+"""
+benchmark_entry_details.py
+
+This script measures the time taken by HTMLParser.get_entries() to extract
+the entries from an eBird checklist web page where every species has a full
+breakdown of the count by age and sex, as is often the case for counts of
+shorebirds. Synthetic pages are generated with up to 400 species so the
+scaling of the parser can be seen as the number of entries doubles.
+
+To run the benchmark:
+
+    python benchmark_entry_details.py [<species>]
+
+where,
+
+    <species> is the number of species on the largest page, the default
+    is 400.
+
+"""
+
+import sys
+import timeit
+
+from checklists_scrapers.spiders.ebird_spider import HTMLParser
+from checklists_scrapers.tests.utils import response_for_content
+
+
+AGES = ['Juvenile', 'Immature', 'Adult', 'Age Unknown']
+
+SEXES = ['Male', 'Female', 'Sex Unknown']
+
+
+def get_entry(index):
+    """Generate the row for a species with a full age and sex breakdown.
+
+    Args:
+        index (int): the position of the species on the page.
+
+    Returns:
+        str: the HTML for the row.
+    """
+    headings = ''.join(['<th>%s</th>' % age for age in AGES])
+    rows = ''.join([
+        '<tr><td>%s</td>%s</tr>' % (sex, ''.join(
+            ['<td class="num">%d</td>' % (index + col + 1)
+             for col in range(len(AGES))]))
+        for sex in SEXES])
+    count = (index + 1) * len(AGES) * len(SEXES)
+    return """
+    <tr class="spp-entry">
+        <th><h5 class="se-count">%d</h5></th>
+        <td>
+            <h5 class="se-name">Species %d</h5>
+            <div class="sd-data-age-sex">
+                <table><tr><th></th>%s</tr>%s</table>
+            </div>
+        </td>
+    </tr>
+    """ % (count, index, headings, rows)
+
+
+def get_content(species):
+    """Generate a checklist web page.
+
+    Args:
+        species (int): the number of species on the page.
+
+    Returns:
+        str: the HTML for the page.
+    """
+    entries = ''.join([get_entry(idx) for idx in range(species)])
+    return '<html><body><table>%s</table></body></html>' % entries
+
+
+def main(maximum):
+    print "%12s %12s %12s %16s" % ('species', 'details', 'seconds',
+                                   'usec/species')
+
+    count = maximum / 8
+    while count <= maximum:
+        url = "http://ebird.org/ebird/view/checklist?subID=S0000001"
+        response = response_for_content(get_content(count), 'utf-8', url=url)
+        parser = HTMLParser(response)
+        details = sum([len(entry['details'])
+                       for entry in parser.get_entries()])
+        elapsed = min(timeit.repeat(parser.get_entries, number=1, repeat=3))
+        print "%12d %12d %12.3f %16.2f" % (
+            count, details, elapsed, elapsed * 1000000 / count)
+        count *= 2
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 400)
@@ -0,0 +1,80 @@
+"""
+benchmark_fragment.py
+
+This script measures the time taken to parse an eBird checklist web page
+when only the section containing the checklist is parsed compared to when
+the whole page is parsed. A synthetic page is generated with the checklist
+surrounded by the scripts, navigation and map markup found on the pages
+from eBird.
+
+To run the benchmark:
+
+    python benchmark_fragment.py [<pages> [<species>]]
+
+where,
+
+    <pages> is the number of times the page is parsed, the default is 200.
+
+    <species> is the number of species on the page, the default is 50.
+
+"""
+
+import sys
+import timeit
+
+from checklists_scrapers.spiders.ebird_spider import HTMLParser
+from checklists_scrapers.tests.benchmarks.benchmark_parser_pool import \
+    get_content
+from checklists_scrapers.tests.utils import response_for_content
+
+
+class FullPageParser(HTMLParser):
+
+    """An HTMLParser which always parses the whole page."""
+
+    fragment_start = '<no-fragment>'
+
+
+def get_page(species):
+    """Generate a checklist web page.
+
+    Args:
+        species (int): the number of species on the page.
+
+    Returns:
+        str: the HTML for the page.
+    """
+    script = '<script>%s</script>' % ('var x = 0;\n' * 2000)
+    menu = '<ul>%s</ul>' % ''.join(
+        ['<li><a href="/page%d">Page %d</a></li>' % (idx, idx)
+         for idx in range(500)])
+    markers = '<div id="map">%s</div>' % ''.join(
+        ['<div class="marker" data-lat="%d" data-lng="%d"></div>' % (idx, idx)
+         for idx in range(1000)])
+    checklist = get_content(species)
+    checklist = checklist[checklist.index('<body>') + len('<body>'):
+                          checklist.index('</body>')]
+    return '<html><head>%s</head><body>%s' \
+           '<div class="report-section">%s</div>%s</body></html>' % (
+               script, menu, checklist, markers)
+
+
+def main(pages, species):
+    url = "http://ebird.org/ebird/view/checklist?subID=S0000001"
+    response = response_for_content(get_page(species), 'utf-8', url=url)
+
+    print "%-12s %10s %12s" % ('parser', 'seconds', 'usec/page')
+
+    for description, parser in [('full page', FullPageParser),
+                                ('fragment', HTMLParser)]:
+        elapsed = min(timeit.repeat(
+            lambda: parser(response).get_checklist(), number=pages, repeat=3))
+        print "%-12s %10.3f %12.1f" % (
+            description, elapsed, elapsed * 1000000 / pages)
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    pages = args[0] if len(args) > 0 else 200
+    species = args[1] if len(args) > 1 else 50
+    main(pages, species)
@@ -0,0 +1,70 @@
+"""
+benchmark_html_parser.py
+
+This script measures the time taken by HTMLParser.get_attributes() to
+extract the attributes, protocol, duration, observers, etc. from a checklist
+web page. Synthetic pages are generated with up to 1,000 definition lists so
+the scaling of the parser can be seen as the number of attributes on the
+page doubles.
+
+To run the benchmark:
+
+    python benchmark_html_parser.py [<attributes>]
+
+where,
+
+    <attributes> is the number of definition lists in the largest page,
+    the default is 1000.
+
+"""
+
+import sys
+import timeit
+
+from checklists_scrapers.spiders.ebird_spider import HTMLParser
+from checklists_scrapers.tests.utils import response_for_content
+
+
+def get_content(count):
+    """Generate a checklist web page.
+
+    Args:
+        count (int): the number of definition lists on the page.
+
+    Returns:
+        str: the HTML for the page. The standard eBird attributes are
+            followed by enough extra attributes to give the number of
+            definition lists requested.
+    """
+    items = [
+        ('Protocol:', 'Traveling'),
+        ('Party Size:', '2'),
+        ('Duration:', '2 hour(s) 35 minute(s)'),
+        ('Distance:', '2.0 kilometer(s)'),
+        ('Observers:', 'Observer One, <strong>Observer Two</strong>'),
+        ('Comments:', 'A comment.'),
+    ]
+    for idx in range(len(items), count):
+        items.append(('Attribute %d:' % idx, 'Value %d' % idx))
+    lists = ['<dl class="def-list"><dt>%s</dt><dd>%s</dd></dl>' % item
+             for item in items]
+    return '<html><body>%s</body></html>' % '\n'.join(lists)
+
+
+def main(maximum):
+    print "%12s %12s %16s" % ('attributes', 'seconds', 'usec/attribute')
+
+    count = maximum / 8
+    while count <= maximum:
+        url = "http://ebird.org/ebird/view/checklist?subID=S0000001"
+        response = response_for_content(get_content(count), 'utf-8', url=url)
+        parser = HTMLParser(response)
+        elapsed = min(timeit.repeat(
+            lambda: parser.get_attributes(parser.docroot), number=1, repeat=3))
+        print "%12d %12.3f %16.2f" % (
+            count, elapsed, elapsed * 1000000 / count)
+        count *= 2
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
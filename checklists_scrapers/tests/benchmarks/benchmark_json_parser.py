@@ -0,0 +1,76 @@
+"""
+benchmark_json_parser.py
+
+This script measures the time taken by JSONParser.get_checklists() to build
+the checklists from the observations for a location. Synthetic responses are
+generated containing up to 100,000 observations, spread over checklists with
+20 observations each, so the scaling of the parser can be seen as the size
+of the response doubles.
+
+To run the benchmark:
+
+    python benchmark_json_parser.py [<observations>]
+
+where,
+
+    <observations> is the number of observations in the largest response,
+    the default is 100000.
+
+"""
+
+import sys
+import timeit
+
+from checklists_scrapers.spiders.ebird_spider import JSONParser
+from checklists_scrapers.tests.utils import response_for_data
+
+
+def get_records(count, per_checklist=20):
+    """Generate the observations for a single location.
+
+    Args:
+        count (int): the number of observations to generate.
+
+    Kwargs:
+        per_checklist (int): the number of observations in each checklist.
+
+    Returns:
+        list(dict): the observations in the format returned by the eBird API.
+    """
+    records = []
+    for idx in range(count):
+        records.append({
+            'comName': 'Common Name %d' % (idx % per_checklist),
+            'countryName': 'Country',
+            'firstName': 'Name',
+            'howMany': idx % 10,
+            'lastName': 'Surname',
+            'lat': 45.0,
+            'lng': -45.0,
+            'locID': 'L0000001',
+            'locName': 'Location 1',
+            'obsDt': '2013-03-27 10:00',
+            'obsID': 'OBS%07d' % idx,
+            'sciName': 'Scientific Name %d' % (idx % per_checklist),
+            'subID': 'S%07d' % (idx / per_checklist),
+            'subnational1Name': 'Region',
+            'subnational2Name': 'County',
+        })
+    return records
+
+
+def main(maximum):
+    print "%12s %12s %12s %16s" % (
+        'observations', 'checklists', 'seconds', 'usec/observation')
+
+    count = maximum / 8
+    while count <= maximum:
+        parser = JSONParser(response_for_data(get_records(count)))
+        elapsed = min(timeit.repeat(parser.get_checklists, number=1, repeat=3))
+        print "%12d %12d %12.3f %16.2f" % (
+            count, count / 20, elapsed, elapsed * 1000000 / count)
+        count *= 2
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
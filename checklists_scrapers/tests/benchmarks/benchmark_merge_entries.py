@@ -0,0 +1,118 @@
+"""
+benchmark_merge_entries.py
+
+This script measures the time taken by EBirdSpider.merge_entries() to merge
+the entries from the eBird API with the entries from the checklist web page.
+The scenarios from the tests in test_merge_checklists.py are scaled up to
+checklists with 500 entries:
+
+    updated: each entry from the API is updated with the subspecies and the
+    breakdown of the count by age and sex from the web page.
+
+    duplicates: the API contains two entries for each species with the same
+    count so the entries from the web page cannot be matched.
+
+    added: none of the entries on the web page are in the API.
+
+To run the benchmark:
+
+    python benchmark_merge_entries.py [<entries> [<repeats>]]
+
+where,
+
+    <entries> is the number of entries in each checklist, the default is 500.
+
+    <repeats> is the number of times each scenario is run, the default is 100.
+
+"""
+
+import sys
+import timeit
+
+from scrapy.crawler import Crawler
+from scrapy.settings import CrawlerSettings
+
+from checklists_scrapers import settings
+from checklists_scrapers.spiders.ebird_spider import EBirdSpider
+
+
+def get_originals(count, duplicates=False):
+    """Generate the entries from the API.
+
+    Args:
+        count (int): the number of entries.
+
+    Kwargs:
+        duplicates (bool): generate two entries for each species.
+
+    Returns:
+        list(dict): the entries in the format returned by the JSONParser.
+    """
+    step = 2 if duplicates else 1
+    return [{
+        'identifier': 'OBS%07d' % idx,
+        'species': {
+            'name': 'Species %d' % (idx / step),
+            'scientific_name': 'Scientific name %d' % (idx / step),
+        },
+        'count': 10,
+    } for idx in range(count)]
+
+
+def get_updates(count, prefix='Species'):
+    """Generate the entries from the web page.
+
+    Args:
+        count (int): the number of entries.
+
+    Kwargs:
+        prefix (str): the start of the name for each species.
+
+    Returns:
+        list(dict): the entries in the format returned by the HTMLParser.
+    """
+    return [{
+        'species': {
+            'name': '%s %d (Subspecies)' % (prefix, idx),
+        },
+        'count': 10,
+        'comment': 'Comment %d' % idx,
+        'details': [
+            {'identifier': 'DET01', 'age': 'Adult', 'sex': 'Male',
+             'count': 4},
+            {'identifier': 'DET02', 'age': 'Adult', 'sex': 'Female',
+             'count': 6},
+        ],
+    } for idx in range(count)]
+
+
+def main(count, repeats):
+    crawler = Crawler(CrawlerSettings(settings))
+    crawler.configure()
+    spider = EBirdSpider('REG')
+    spider.set_crawler(crawler)
+    spider.log = lambda *args, **kwargs: None
+
+    scenarios = [
+        ('updated', get_originals(count), get_updates(count)),
+        ('duplicates', get_originals(count, duplicates=True),
+         get_updates(count / 2)),
+        ('added', get_originals(count), get_updates(count, prefix='Other')),
+    ]
+
+    print "%-12s %10s %12s %14s" % ('scenario', 'entries', 'seconds',
+                                    'usec/checklist')
+
+    for name, originals, updates in scenarios:
+        elapsed = min(timeit.repeat(
+            lambda: spider.merge_entries(originals, updates),
+            number=repeats, repeat=3))
+        print "%-12s %10d %12.3f %14.1f" % (
+            name, count, elapsed, elapsed * 1000000 / repeats)
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    count = args[0] if len(args) > 0 else 500
+    repeats = args[1] if len(args) > 1 else 100
+    main(count, repeats)
@@ -0,0 +1,118 @@
+"""
+benchmark_observations.py
+
+This script compares the memory used to hold the observations decoded from
+the eBird API as a list of dicts, as returned by json.loads(), with the list
+of compact Observation records created by JSONParser. A synthetic response
+for a large region is generated with all the fields returned by the API when
+the full details are requested.
+
+To run the benchmark:
+
+    python benchmark_observations.py [<observations>]
+
+where,
+
+    <observations> is the number of observations in the response, the
+    default is 100000.
+
+"""
+
+import json
+import sys
+
+from checklists_scrapers.spiders.ebird_spider import JSONParser, Observation
+from checklists_scrapers.tests.utils import response_for_data
+
+
+def get_records(count, per_checklist=20, per_location=10):
+    """Generate the observations for a region.
+
+    Args:
+        count (int): the number of observations to generate.
+
+    Kwargs:
+        per_checklist (int): the number of observations in each checklist.
+        per_location (int): the number of checklists for each location.
+
+    Returns:
+        list(dict): the observations in the format returned by the eBird API.
+    """
+    records = []
+    for idx in range(count):
+        checklist = idx / per_checklist
+        location = checklist / per_location
+        records.append({
+            'checklistID': 'CL%07d' % checklist,
+            'comName': 'Common Name %d' % (idx % per_checklist),
+            'countryCode': 'CC',
+            'countryName': 'Country',
+            'firstName': 'Name',
+            'howMany': idx % 10,
+            'lastName': 'Surname',
+            'lat': 45.0 + location / 1000.0,
+            'lng': -45.0 - location / 1000.0,
+            'locID': 'L%07d' % location,
+            'locName': 'Location %d' % location,
+            'locationPrivate': True,
+            'obsDt': '2013-03-27 10:00',
+            'obsID': 'OBS%07d' % idx,
+            'obsReviewed': False,
+            'obsValid': True,
+            'presenceNoted': False,
+            'sciName': 'Scientific Name %d' % (idx % per_checklist),
+            'subID': 'S%07d' % checklist,
+            'subnational1Code': 'SN-01',
+            'subnational1Name': 'Region',
+            'subnational2Code': 'SN-02',
+            'subnational2Name': 'County',
+        })
+    return records
+
+
+def get_size(obj, seen):
+    """Get the memory used by an object and the objects it references.
+
+    Args:
+        obj: the object to measure.
+        seen (set): the ids of the objects already counted so shared
+            objects, e.g. interned strings, are only counted once.
+
+    Returns:
+        int: the size of the object in bytes.
+    """
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += get_size(key, seen) + get_size(value, seen)
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            size += get_size(value, seen)
+    elif isinstance(obj, Observation):
+        for key in obj.fields:
+            size += get_size(obj.get(key), seen)
+    return size
+
+
+def main(count):
+    response = response_for_data(get_records(count))
+
+    records = json.loads(response.body_as_unicode())
+    dicts = get_size(records, set())
+    del records
+
+    records = JSONParser(response).records
+    observations = get_size(records, set())
+    del records
+
+    print "%12s %14s %12s" % ('records', 'bytes', 'bytes/record')
+    print "%12s %14d %12d" % ('dict', dicts, dicts / count)
+    print "%12s %14d %12d" % ('Observation', observations,
+                              observations / count)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
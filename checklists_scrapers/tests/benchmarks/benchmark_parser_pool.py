@@ -0,0 +1,135 @@
+"""
+benchmark_parser_pool.py
+
+This script measures the number of eBird checklist web pages parsed per
+second by the spider, on the reactor thread, and by a ParserPool with 1, 2,
+4 and 8 worker processes. A synthetic page is generated containing 300
+species, each with a breakdown of the count by age and sex, which is about
+as large as the checklists on eBird get.
+
+To run the benchmark:
+
+    python benchmark_parser_pool.py [<pages> [<species>]]
+
+where,
+
+    <pages> is the number of pages parsed for each configuration, the
+    default is 200.
+
+    <species> is the number of species on each page, the default is 300.
+
+"""
+
+import sys
+import time
+
+from twisted.internet import defer, reactor
+
+from checklists_scrapers.spiders.ebird_spider import HTMLParser
+from checklists_scrapers.spiders.pool import ParserPool
+from checklists_scrapers.tests.utils import response_for_content
+
+
+ENTRY = """
+<tr class="spp-entry">
+    <th><h5 class="se-count">%(count)d</h5></th>
+    <td>
+        <div class="se-hd">
+            <h5 class="se-name">Species %(index)d</h5>
+        </div>
+        <div class="se-detail">
+            <div class="sd-data-age-sex">
+                <table>
+                    <tr>
+                        <th></th>
+                        <th>Juvenile</th>
+                        <th>Immature</th>
+                        <th>Adult</th>
+                        <th>Age Unknown</th>
+                    </tr>
+                    <tr>
+                        <td>Male</td>
+                        <td class="num"></td>
+                        <td class="num"></td>
+                        <td class="num">%(count)d</td>
+                        <td class="num"></td>
+                    </tr>
+                    <tr>
+                        <td>Female</td>
+                        <td class="num"></td>
+                        <td class="num">%(count)d</td>
+                        <td class="num"></td>
+                        <td class="num"></td>
+                    </tr>
+                </table>
+            </div>
+        </div>
+        <p class="obs-comments">Comment for species %(index)d</p>
+    </td>
+</tr>
+"""
+
+
+def get_content(species):
+    """Generate a checklist web page.
+
+    Args:
+        species (int): the number of species on the page.
+
+    Returns:
+        str: the HTML for the page.
+    """
+    attributes = """
+    <dl><dt>Protocol:</dt><dd>Traveling</dd></dl>
+    <dl><dt>Party Size:</dt><dd>2</dd></dl>
+    <dl><dt>Duration:</dt><dd>2 hour(s) 35 minute(s)</dd></dl>
+    <dl><dt>Distance:</dt><dd>2.0 kilometer(s)</dd></dl>
+    <dl><dt>Observers:</dt>
+        <dd>Observer One <a>List</a>, Observer Two</dd></dl>
+    <dl><dt>Comments:</dt><dd>A comment.</dd></dl>
+    """
+    entries = [ENTRY % {'index': idx, 'count': idx % 20 + 1}
+               for idx in range(species)]
+    return '<html><body>%s<table>%s</table></body></html>' % (
+        attributes, ''.join(entries))
+
+
+def report(description, pages, elapsed):
+    print "%-12s %8d %10.2f %12.1f" % (
+        description, pages, elapsed, pages / elapsed)
+
+
+@defer.inlineCallbacks
+def run(pages, response):
+    print "%-12s %8s %10s %12s" % ('workers', 'pages', 'seconds', 'pages/sec')
+
+    try:
+        start = time.time()
+        for idx in range(pages):
+            HTMLParser(response).get_checklist()
+        report('none', pages, time.time() - start)
+
+        for workers in [1, 2, 4, 8]:
+            pool = ParserPool(workers)
+            start = time.time()
+            yield defer.DeferredList(
+                [pool.parse(HTMLParser, response) for idx in range(pages)],
+                fireOnOneErrback=True)
+            report(str(workers), pages, time.time() - start)
+            pool.close()
+    finally:
+        reactor.stop()
+
+
+def main(pages, species):
+    url = "http://ebird.org/ebird/view/checklist?subID=S0000001"
+    response = response_for_content(get_content(species), 'utf-8', url=url)
+    reactor.callWhenRunning(run, pages, response)
+    reactor.run()
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    pages = args[0] if len(args) > 0 else 200
+    species = args[1] if len(args) > 1 else 300
+    main(pages, species)
@@ -0,0 +1,116 @@
+"""
+benchmark_xpath.py
+
+This script measures the time saved by compiling the XPath expressions used
+by the parsers once rather than passing the expression to select() each time
+a page is parsed. The pages used in the tests for the eBird and WorldBirds
+parsers are each parsed 10,000 times, first with the compiled expressions
+then again with the compiled versions disabled so select() is called with
+the expression instead.
+
+To run the benchmark:
+
+    python benchmark_xpath.py [<repeats>]
+
+where,
+
+    <repeats> is the number of times each page is parsed, the default
+    is 10000.
+
+"""
+
+import sys
+import timeit
+
+from unittest import TestLoader
+
+from checklists_scrapers.spiders.ebird_spider import HTMLParser
+from checklists_scrapers.spiders.utils import XPATHS
+from checklists_scrapers.spiders.worldbirds_spider import VisitParser, \
+    ChecklistParser, LocationParser, ObserverParser
+from checklists_scrapers.tests.spiders.ebird.test_html_parser import \
+    ParseHTMLChecklistTestCase, ParseHTMLEntryTestCase
+from checklists_scrapers.tests.spiders.worldbirds.test_checklist_parser \
+    import ChecklistParserTestCase
+from checklists_scrapers.tests.spiders.worldbirds.test_location_parser \
+    import LocationParserTestCase
+from checklists_scrapers.tests.spiders.worldbirds.test_observer_parser \
+    import ObserverParserTestCase
+from checklists_scrapers.tests.spiders.worldbirds.test_visit_parser import \
+    VisitParserTestCase
+
+
+# For each page: a description, the test case where the response is created,
+# the attribute containing the response and the function that parses it.
+PAGES = [
+    ('eBird checklist', ParseHTMLChecklistTestCase, 'response',
+     lambda response: HTMLParser(response).get_checklist()),
+    ('eBird entries', ParseHTMLEntryTestCase, 'content',
+     lambda response: HTMLParser(response).get_entries()),
+    ('WorldBirds visits', VisitParserTestCase, 'response',
+     lambda response: VisitParser(response).get_visits()),
+    ('WorldBirds checklist', ChecklistParserTestCase, 'response',
+     lambda response: ChecklistParser(response).get_checklist()),
+    ('WorldBirds location', LocationParserTestCase, 'response',
+     lambda response: LocationParser(response).get_checklist()),
+    ('WorldBirds observer', ObserverParserTestCase, 'response',
+     lambda response: ObserverParser(response).get_checklist()),
+]
+
+
+def get_response(test_case, name):
+    """Get the response created when the test case is set up.
+
+    Args:
+        test_case (class): the TestCase class.
+        name (str): the attribute where the response is saved.
+
+    Returns:
+        TextResponse: the response containing the page used in the tests.
+    """
+    method = TestLoader().getTestCaseNames(test_case)[0]
+    case = test_case(method)
+    case.setUp()
+    return getattr(case, name)
+
+
+def set_compiled(compiled):
+    """Enable or disable the compiled XPath expressions.
+
+    Args:
+        compiled (dict): the compiled version of each expression. Pass an
+            empty dict to disable them so select() is used instead.
+    """
+    for xpath in XPATHS.values():
+        xpath.compiled = compiled.get(xpath.expression)
+
+
+def main(repeats):
+    compiled = dict([(xpath.expression, xpath.compiled)
+                     for xpath in XPATHS.values()])
+
+    print "%-24s %14s %14s %10s" % (
+        'page', 'compiled usec', 'select usec', 'saving')
+
+    for description, test_case, name, parse in PAGES:
+        response = get_response(test_case, name)
+
+        set_compiled(compiled)
+        with_compiled = min(timeit.repeat(
+            lambda: parse(response), number=repeats, repeat=3))
+
+        set_compiled({})
+        with_select = min(timeit.repeat(
+            lambda: parse(response), number=repeats, repeat=3))
+
+        print "%-24s %14.1f %14.1f %9.1f%%" % (
+            description,
+            with_compiled * 1000000 / repeats,
+            with_select * 1000000 / repeats,
+            (with_select - with_compiled) * 100 / with_select)
+
+    set_compiled(compiled)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
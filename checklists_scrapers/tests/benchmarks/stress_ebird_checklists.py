@@ -0,0 +1,240 @@
+"""
+stress_ebird_checklists.py
+
+This script checks that the eBird spider matches each checklist web page to
+the right checklist from the API when several requests are in progress at
+the same time. The spider is run against a local server which stands in for
+eBird. The server delays each response by a random amount so they arrive
+out of order and it redirects some of the requests for the checklist web
+pages through a shared URL, as eBird does for its security checks. The page
+returned after the redirect is for whichever checklist was requested last,
+which is what mixes up the checklists.
+
+Each web page contains the identifier of the checklist in the comment so
+the downloaded checklists can be checked once the spider has finished.
+
+To run the script:
+
+    python stress_ebird_checklists.py [<concurrent requests> [<locations>]]
+
+where,
+
+    <concurrent requests> is the value for the CONCURRENT_REQUESTS setting,
+    the default is 16.
+
+    <locations> is the number of locations in the region, each of which
+    has 5 checklists. The default is 20.
+
+"""
+
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from multiprocessing import Process
+
+from scrapy.settings import CrawlerSettings
+from twisted.internet import reactor
+from twisted.web.resource import Resource
+from twisted.web.server import NOT_DONE_YET, Site
+
+from checklists_scrapers import settings
+from checklists_scrapers.spiders.ebird_spider import EBirdSpider
+from checklists_scrapers.tests.utils import RunCrawler
+from checklists_scrapers.utils import load_checklists
+
+
+PORT = 8789
+
+CHECKLISTS_PER_LOCATION = 5
+
+
+def get_records(location):
+    """Generate the observations for a location."""
+    records = []
+    for checklist in range(CHECKLISTS_PER_LOCATION):
+        identifier = 'S%04d%03d' % (location, checklist)
+        for species in range(3):
+            records.append({
+                'comName': 'Common Name %d' % species,
+                'countryName': 'Country',
+                'firstName': 'Name',
+                'howMany': species + 1,
+                'lastName': 'Surname',
+                'lat': 45.0,
+                'lng': -45.0,
+                'locID': 'L%04d' % location,
+                'locName': 'Location %d' % location,
+                'obsDt': '2013-03-27 10:00',
+                'obsID': 'OBS%s%d' % (identifier, species),
+                'sciName': 'Scientific Name %d' % species,
+                'subID': identifier,
+                'subnational1Name': 'Region',
+                'subnational2Name': 'County',
+            })
+    return records
+
+
+class DelayedResource(Resource):
+
+    """A resource that sends each response after a random delay."""
+
+    isLeaf = True
+
+    def render_GET(self, request):
+        reactor.callLater(random.uniform(0.0, 0.2), self.respond, request)
+        return NOT_DONE_YET
+
+    def respond(self, request):
+        request.write(self.get_content(request))
+        request.finish()
+
+
+class RegionResource(DelayedResource):
+
+    def __init__(self, locations):
+        DelayedResource.__init__(self)
+        self.locations = locations
+
+    def get_content(self, request):
+        return json.dumps([{
+            'locID': 'L%04d' % location,
+            'locName': 'Location %d' % location,
+            'lat': 45.0,
+            'lng': -45.0,
+        } for location in range(self.locations)])
+
+
+class LocationResource(DelayedResource):
+
+    def get_content(self, request):
+        records = []
+        for identifier in request.args['r']:
+            records.extend(get_records(int(identifier[1:])))
+        return json.dumps(records)
+
+
+class ChecklistResource(DelayedResource):
+
+    """The checklist web page, redirected through a shared URL."""
+
+    def __init__(self, server):
+        DelayedResource.__init__(self)
+        self.server = server
+
+    def respond(self, request):
+        identifier = request.args['subID'][0]
+        if 'checked' not in request.args and random.random() < 0.3:
+            self.server.last = identifier
+            request.redirect('/ebird/security')
+            request.finish()
+        else:
+            DelayedResource.respond(self, request)
+
+    def get_content(self, request):
+        return """
+        <dl><dt>Protocol:</dt><dd>Traveling</dd></dl>
+        <dl><dt>Comments:</dt><dd>%s</dd></dl>
+        """ % request.args['subID'][0]
+
+
+class SecurityResource(DelayedResource):
+
+    """The shared URL which returns the page for the last checklist."""
+
+    def __init__(self, server):
+        DelayedResource.__init__(self)
+        self.server = server
+
+    def respond(self, request):
+        request.redirect(
+            '/ebird/view/checklist?subID=%s&checked=1' % self.server.last)
+        request.finish()
+
+
+def run_server(locations):
+    root = Resource()
+    root.last = None
+    api = Resource()
+    data = Resource()
+    obs = Resource()
+    root.putChild('ws1.1', api)
+    api.putChild('data', data)
+    data.putChild('obs', obs)
+    region = Resource()
+    location = Resource()
+    obs.putChild('region', region)
+    obs.putChild('loc', location)
+    region.putChild('recent', RegionResource(locations))
+    location.putChild('recent', LocationResource())
+    ebird = Resource()
+    view = Resource()
+    root.putChild('ebird', ebird)
+    ebird.putChild('view', view)
+    ebird.putChild('security', SecurityResource(root))
+    view.putChild('checklist', ChecklistResource(root))
+    reactor.listenTCP(PORT, Site(root))
+    reactor.run()
+
+
+class StressSpider(EBirdSpider):
+
+    allowed_domains = ['localhost']
+
+    region_url = "http://localhost:%d/ws1.1/data/obs/region/recent?" \
+                 "rtype=subnational1&r=%%s&back=%%d&fmt=json" % PORT
+    location_url = "http://localhost:%d/ws1.1/data/obs/loc/recent?" \
+                   "r=%%s&detail=full&back=%%d&includeProvisional=true" \
+                   "&fmt=json" % PORT
+    checklist_url = "http://localhost:%d/ebird/view/checklist?subID=%%s" \
+                    % PORT
+
+
+def main(concurrency, locations):
+    server = Process(target=run_server, args=(locations,))
+    server.start()
+    time.sleep(1)
+
+    settings.DOWNLOAD_DIR = tempfile.mkdtemp()
+    settings.REPORT_RECIPIENTS = ''
+    settings.CONCURRENT_REQUESTS = concurrency
+    settings.CONCURRENT_REQUESTS_PER_DOMAIN = concurrency
+
+    try:
+        start = time.time()
+        RunCrawler(CrawlerSettings(settings)).crawl(StressSpider('REG'))
+        elapsed = time.time() - start
+
+        saved = 0
+        incomplete = 0
+        mismatched = 0
+        for checklist in load_checklists(settings.DOWNLOAD_DIR):
+            saved += 1
+            if 'comment' not in checklist:
+                incomplete += 1
+            elif checklist['comment'] != checklist['identifier']:
+                mismatched += 1
+    finally:
+        server.terminate()
+        shutil.rmtree(settings.DOWNLOAD_DIR)
+
+    expected = locations * CHECKLISTS_PER_LOCATION
+    print "Concurrent requests: %d" % concurrency
+    print "Checklists expected: %d" % expected
+    print "Checklists saved: %d" % saved
+    print "Checklists without web page: %d" % incomplete
+    print "Checklists mismatched: %d" % mismatched
+    print "Elapsed: %.1f seconds, %.1f checklists/sec" % (
+        elapsed, saved / elapsed)
+
+    return saved == expected and mismatched == 0
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    concurrency = args[0] if len(args) > 0 else 16
+    locations = args[1] if len(args) > 1 else 20
+    sys.exit(0 if main(concurrency, locations) else 1)
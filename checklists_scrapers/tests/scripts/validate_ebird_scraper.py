@@ -17,7 +17,6 @@ where,
 
 """
 
-import json
 import nose
 import shutil
 import sys
@@ -28,7 +27,7 @@ from scrapy.settings import CrawlerSettings
 from checklists_scrapers import settings
 from checklists_scrapers.spiders.ebird_spider import EBirdSpider
 from checklists_scrapers.tests.utils import RunCrawler
-from checklists_scrapers.utils import list_files
+from checklists_scrapers.utils import load_checklists
 
 from checklists_scrapers.tests.validation import checklists
 
@@ -41,9 +40,7 @@ region = sys.argv[1]
 spider = EBirdSpider(region=region)
 RunCrawler(CrawlerSettings(settings)).crawl(spider)
 
-for path in list_files(settings.DOWNLOAD_DIR, 'json'):
-    with open(path, 'rb') as fp:
-        checklists.append(json.load(fp))
+checklists.extend(load_checklists(settings.DOWNLOAD_DIR))
 
 nose.run(argv=['checklists_scrapers.tests.validation'])
 
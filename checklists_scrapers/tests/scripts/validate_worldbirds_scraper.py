@@ -18,7 +18,6 @@ where,
     <country> is the country code that identifies the server to access.
 
 """
-import json
 import nose
 import shutil
 import sys
@@ -29,7 +28,7 @@ from scrapy.settings import CrawlerSettings
 from checklists_scrapers import settings
 from checklists_scrapers.spiders.worldbirds_spider import WorldBirdsSpider
 from checklists_scrapers.tests.utils import RunCrawler
-from checklists_scrapers.utils import list_files
+from checklists_scrapers.utils import load_checklists
 
 from checklists_scrapers.tests.validation import checklists
 
@@ -44,9 +43,7 @@ country = sys.argv[3]
 spider = WorldBirdsSpider(username=username, password=password, country=country)
 RunCrawler(CrawlerSettings(settings)).crawl(spider)
 
-for path in list_files(settings.DOWNLOAD_DIR, 'json'):
-    with open(path, 'rb') as fp:
-        checklists.append(json.load(fp))
+checklists.extend(load_checklists(settings.DOWNLOAD_DIR))
 
 nose.run(argv=['checklists_scrapers.tests.validation'])
 
@@ -240,3 +240,73 @@ class ParseHTMLEntryTestCase(TestCase):
         entry = self.parser.docroot.select('//tr[@class="spp-entry"]')
         actual = self.parser.get_entry_details(entry)
         self.assertEqual(expected, actual)
+
+
+class ParseHTMLFragmentTestCase(TestCase):
+    """Verify only the section of the page with the checklist is parsed."""
+
+    def setUp(self):
+        """Initialize the test."""
+        self.url = "http://ebird.org/ebird/view/checklist?subID=S0000001"
+        self.content = """
+        <html>
+        <head><script>var map = {};</script></head>
+        <body>
+        <div id="nav"><dl><dd>Menu</dd></dl></div>
+        <div class="report-section">
+            <dl class="def-list">
+                <dt>Protocol:</dt>
+                <dd>Traveling</dd>
+            </dl>
+            <table>
+                <tr class="spp-entry">
+                    <th><h5 class="se-count">2</h5></th>
+                    <td>
+                        <h5 class="se-name">Mallard</h5>
+                        <div class="sd-data-age-sex">
+                            <table>
+                                <tr><th></th><th>Adult</th></tr>
+                                <tr><td>Male</td><td>2</td></tr>
+                            </table>
+                        </div>
+                    </td>
+                </tr>
+            </table>
+        </div>
+        <div id="map"><table><tr><td>Map</td></tr></table></div>
+        </body>
+        </html>
+        """
+        self.response = response_for_content(self.content, 'utf-8',
+                                             url=self.url)
+        self.parser = HTMLParser(self.response)
+
+    def test_fragment(self):
+        """Verify the page is cut down to the checklist section."""
+        fragment = self.parser.get_fragment(self.content)
+        self.assertTrue(fragment.startswith('<div class="report-section"'))
+        self.assertTrue(fragment.endswith('</table>'))
+        self.assertFalse('Map' in fragment)
+        self.assertFalse('script' in fragment)
+
+    def test_no_start_marker(self):
+        """Verify the whole page is used if the section cannot be found."""
+        content = self.content.replace('report-section', 'other-section')
+        self.assertTrue(self.parser.get_fragment(content) is content)
+
+    def test_marker_outside_fragment(self):
+        """Verify the whole page is used if an attribute is outside."""
+        content = self.content.replace(
+            '<dd>Menu</dd>', '<dt>Comments:</dt><dd>Menu</dd>')
+        self.assertTrue(self.parser.get_fragment(content) is content)
+
+    def test_attributes(self):
+        """Verify the attributes are extracted from the fragment."""
+        self.assertEqual({'Protocol:': 'Traveling'}, self.parser.attributes)
+
+    def test_entries(self):
+        """Verify the entries are extracted from the fragment."""
+        entries = self.parser.get_entries()
+        self.assertEqual(1, len(entries))
+        self.assertEqual(2, entries[0]['count'])
+        self.assertEqual(1, len(entries[0]['details']))
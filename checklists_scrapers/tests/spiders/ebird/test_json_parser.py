@@ -3,7 +3,7 @@
 from unittest import TestCase
 
 from checklists_scrapers.spiders import DOWNLOAD_FORMAT, DOWNLOAD_LANGUAGE
-from checklists_scrapers.spiders.ebird_spider import JSONParser
+from checklists_scrapers.spiders.ebird_spider import JSONParser, Observation
 from checklists_scrapers.tests.utils import response_for_data
 
 
@@ -126,6 +126,15 @@ class JSONParserTestCase(TestCase):
         self.assertEqual('OBS0000003',
                          checklists[1]['entries'][1]['identifier'])
 
+    def test_interleaved_entries(self):
+        """Verify entries are grouped when checklists are interleaved."""
+        self.data.append(dict(self.data[0], obsID='OBS0000004'))
+        self.parser = JSONParser(response_for_data(self.data))
+        checklists = self.parser.get_checklists()
+        self.assertEqual(['OBS0000001', 'OBS0000004'],
+                         [entry['identifier']
+                          for entry in checklists[0]['entries']])
+
     def test_get_checklist(self):
         """Verify the complete checklist is extracted from the record.
 
@@ -216,3 +225,108 @@ class JSONParserTestCase(TestCase):
             'count': 1,
         }
         self.assertEqual(expected, actual)
+
+
+class IncrementalJSONParserTestCase(TestCase):
+    """Verify the checklists extracted when the records are decoded lazily."""
+
+    def setUp(self):
+        """Initialize the test."""
+        self.data = [{
+            'comName': 'Common Name',
+            'firstName': 'Name',
+            'howMany': 1,
+            'lastName': 'Surname',
+            'lat': 45.000001,
+            'lng': -45.000001,
+            'locID': 'L0000001',
+            'locName': 'Location 1',
+            'obsDt': '2013-03-27',
+            'obsID': 'OBS0000001',
+            'sciName': 'Scientific Name',
+            'subID': 'S0000001',
+        }, {
+            'comName': 'Common Name',
+            'firstName': 'Name',
+            'howMany': 1,
+            'lastName': 'Surname',
+            'lat': 50.000000,
+            'lng': -50.000000,
+            'locID': 'L0000002',
+            'locName': 'Location 2',
+            'obsDt': '2013-03-27 10:00',
+            'obsID': 'OBS0000002',
+            'sciName': 'Scientific Name',
+            'subID': 'S0000002',
+        }, {
+            'comName': 'Common Name',
+            'firstName': 'Name',
+            'howMany': 2,
+            'lastName': 'Surname',
+            'lat': 50.000000,
+            'lng': -50.000000,
+            'locID': 'L0000002',
+            'locName': 'Location 2',
+            'obsDt': '2013-03-27 10:00',
+            'obsID': 'OBS0000003',
+            'sciName': 'Scientific Name',
+            'subID': 'S0000002',
+        }]
+
+    def get_parser(self):
+        """Create an incremental parser for the test data."""
+        return JSONParser(response_for_data(self.data), incremental=True)
+
+    def test_checklists_match(self):
+        """Verify the checklists are the same as when decoded up front."""
+        expected = JSONParser(response_for_data(self.data)).get_checklists()
+        actual = list(self.get_parser().get_checklists())
+        self.assertEqual(expected, actual)
+
+    def test_locations_match(self):
+        """Verify the locations are the same as when decoded up front."""
+        expected = JSONParser(response_for_data(self.data)).get_locations()
+        actual = list(self.get_parser().get_locations())
+        self.assertEqual(expected, actual)
+
+    def test_empty_response(self):
+        """Verify no checklists are generated for an empty response."""
+        self.data = []
+        self.assertEqual([], list(self.get_parser().get_checklists()))
+
+    def test_checklist_split(self):
+        """Verify all the records are grouped if a checklist's are split."""
+        self.data.append(dict(self.data[0], obsID='OBS0000004'))
+        expected = JSONParser(response_for_data(self.data)).get_checklists()
+        actual = list(self.get_parser().get_checklists())
+        self.assertEqual(expected, actual)
+        self.assertEqual(2, len(actual[0]['entries']))
+
+
+class ObservationTestCase(TestCase):
+    """Verify the compact records used to hold the observations."""
+
+    def setUp(self):
+        """Initialize the test."""
+        self.observation = Observation({
+            'comName': 'Common Name',
+            'locID': 'L0000001',
+            'obsReviewed': False,
+        })
+
+    def test_get_item(self):
+        """Verify the value of a field can be read."""
+        self.assertEqual('L0000001', self.observation['locID'])
+
+    def test_missing_field(self):
+        """Verify a KeyError is raised if a field was not in the record."""
+        with self.assertRaises(KeyError):
+            self.observation['howMany']
+
+    def test_unused_field(self):
+        """Verify fields not used by the parser are discarded."""
+        self.assertFalse('obsReviewed' in self.observation)
+
+    def test_get_default(self):
+        """Verify get returns the default value for missing fields."""
+        self.assertEqual(0, self.observation.get('howMany', 0))
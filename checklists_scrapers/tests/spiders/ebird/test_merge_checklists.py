@@ -281,3 +281,92 @@ class MergeEntriesTestCase(TestCase):
         entries, warnings = self.spider.merge_entries(lista, listb)
         self.assertTrue('Web page contains record missing from API'
                         in warnings[0])
+
+    def test_single_warning_for_duplicates(self):
+        """Verify one warning is generated for each set of duplicates."""
+        lista = [{
+            'identifier': 'OBS%d' % idx,
+            'species': {
+                'name': 'Barn Swallow',
+            },
+            'count': 1
+        } for idx in range(2)]
+        listb = [{
+            'species': {
+                'name': 'Barn Swallow (%s)' % subspecies,
+            },
+            'count': 1,
+        } for subspecies in ['White-bellied', 'American']]
+        entries, warnings = self.spider.merge_entries(lista, listb)
+        self.assertEqual(1, len(warnings))
+
+    def test_unmatched_duplicates(self):
+        """Verify duplicates not on the web page do not generate warnings."""
+        lista = [{
+            'identifier': 'OBS%d' % idx,
+            'species': {
+                'name': 'Barn Swallow',
+            },
+            'count': 1
+        } for idx in range(2)]
+        entries, warnings = self.spider.merge_entries(lista, [])
+        self.assertEqual([], warnings)
+        self.assertEqual(2, len(entries))
+
+    def test_details_shared(self):
+        """Verify the details are used without being copied."""
+        lista = [{
+            'identifier': 'OBS1',
+            'species': {
+                'name': 'Barn Swallow',
+            },
+            'count': 1
+        }]
+        listb = [{
+            'species': {
+                'name': 'Barn Swallow',
+            },
+            'count': 1,
+            'details': [{'age': 'AD', 'sex': 'M', 'count': 1}],
+        }]
+        entries, warnings = self.spider.merge_entries(lista, listb)
+        self.assertTrue(entries[0]['details'] is listb[0]['details'])
+        self.assertFalse(entries[0] is lista[0])
+
+
+class MergeObserversTestCase(TestCase):
+    """Verify merging the observers from JSON and HTML checklists."""
+
+    def setUp(self):
+        """Initialize the test."""
+        crawler = Crawler(CrawlerSettings(settings))
+        crawler.configure()
+        self.spider = ebird_spider.EBirdSpider('REG')
+        self.spider.set_crawler(crawler)
+
+    def test_order(self):
+        """Verify the names from the API are followed by the web page."""
+        actual = self.spider.merge_observers(
+            {'names': ['Name Surname'], 'count': 1},
+            {'names': ['Other Name', 'Another Name'], 'count': 2})
+        self.assertEqual(['Name Surname', 'Other Name', 'Another Name'],
+                         actual['names'])
+
+    def test_normalized_names(self):
+        """Verify names differing in case and whitespace are merged."""
+        actual = self.spider.merge_observers(
+            {'names': ['Name Surname'], 'count': 1},
+            {'names': ['name  surname', 'Other Name'], 'count': 2})
+        self.assertEqual({'names': ['Name Surname', 'Other Name'],
+                          'count': 2}, actual)
+
+    def test_deterministic(self):
+        """Verify the same observers always give the same result."""
+        originals = {'names': ['C Name', 'A Name'], 'count': 2}
+        updates = {'names': ['B Name', 'A Name'], 'count': 2}
+        expected = self.spider.merge_observers(originals, updates)
+        for idx in range(10):
+            self.assertEqual(
+                expected, self.spider.merge_observers(originals, updates))
+        self.assertEqual(['C Name', 'A Name', 'B Name'], expected['names'])
+        self.assertEqual(3, expected['count'])
@@ -0,0 +1,143 @@
+"""Tests for matching the checklist web pages to the API checklists."""
+
+from unittest import TestCase
+
+from scrapy.crawler import Crawler
+from scrapy.settings import CrawlerSettings
+from twisted.internet import defer
+
+from checklists_scrapers import settings
+from checklists_scrapers.exceptions import ParserException
+from checklists_scrapers.spiders import ebird_spider
+from checklists_scrapers.tests.utils import response_for_content
+
+
+class InlinePool(object):
+    """A stand-in for ParserPool which parses the page immediately."""
+
+    def parse(self, parser_class, response):
+        """Parse the page and return a Deferred that has already fired."""
+        deferred = defer.Deferred()
+        deferred.callback(parser_class(response).get_checklist())
+        return deferred
+
+    def close(self):
+        """There are no worker processes to stop."""
+        pass
+
+
+class FailingPool(InlinePool):
+    """A stand-in for ParserPool where the page could not be parsed."""
+
+    def parse(self, parser_class, response):
+        """Return a Deferred that has already failed."""
+        return defer.fail(ParserException("No result after 60 seconds"))
+
+
+class ParseChecklistTestCase(TestCase):
+    """Verify the web pages are merged with the matching checklist."""
+
+    def setUp(self):
+        """Initialize the test."""
+        crawler = Crawler(CrawlerSettings(settings))
+        crawler.configure()
+        self.spider = ebird_spider.EBirdSpider('REG')
+        self.spider.set_crawler(crawler)
+        self.spider.start_requests()
+        self.spider.directory = None
+        self.content = """
+        <dl><dt>Protocol:</dt><dd>Traveling</dd></dl>
+        <dl><dt>Duration:</dt><dd>1 hour(s)</dd></dl>
+        <dl><dt>Comments:</dt><dd>A comment.</dd></dl>
+        """
+        for identifier in ['S0000001', 'S0000002']:
+            self.spider.pending[identifier] = {
+                'meta': {'version': 1, 'language': 'en'},
+                'identifier': identifier,
+                'date': '2013-03-27',
+                'source': {'name': 'eBird', 'submitted_by': 'Name Surname'},
+                'observers': {'names': ['Name Surname'], 'count': 1},
+                'location': {'identifier': 'L0000001', 'name': 'Location'},
+                'entries': [],
+            }
+            self.spider.attempts[identifier] = 1
+
+    def get_response(self, identifier, requested, redirects=None):
+        """Create the response for a checklist web page."""
+        metadata = {'identifier': requested}
+        if redirects:
+            metadata['redirect_urls'] = redirects
+        return response_for_content(
+            self.content, 'utf-8', url=self.spider.checklist_url % identifier,
+            metadata=metadata)
+
+    def test_identifier_from_url(self):
+        """Verify the identifier is taken from the page returned."""
+        response = self.get_response('S0000002', 'S0000001')
+        self.assertEqual('S0000002', self.spider.get_identifier(response))
+
+    def test_identifier_from_redirects(self):
+        """Verify the identifier is taken from the redirects."""
+        response = response_for_content(
+            self.content, 'utf-8', url='http://ebird.org/ebird/security',
+            metadata={
+                'identifier': 'S0000001',
+                'redirect_urls': [self.spider.checklist_url % 'S0000002'],
+            })
+        self.assertEqual('S0000002', self.spider.get_identifier(response))
+
+    def test_identifier_from_request(self):
+        """Verify the identifier from the request is used as a last resort."""
+        response = response_for_content(
+            self.content, 'utf-8', url='http://ebird.org/ebird/security',
+            metadata={'identifier': 'S0000001'})
+        self.assertEqual('S0000001', self.spider.get_identifier(response))
+
+    def test_matching_checklist(self):
+        """Verify the page is merged with the checklist it displays."""
+        self.spider.parse_checklist(self.get_response('S0000002', 'S0000001'))
+        self.assertEqual(['S0000001'], self.spider.pending.keys())
+
+    def test_source_url(self):
+        """Verify the web page URL for the checklist is recorded."""
+        original = self.spider.pending['S0000001']
+        self.spider.parse_checklist(self.get_response('S0000001', 'S0000001'))
+        self.assertEqual(self.spider.checklist_url % 'S0000001',
+                         original['source']['url'])
+
+    def test_duplicate_page(self):
+        """Verify a page for a checklist already processed is ignored."""
+        self.spider.parse_checklist(self.get_response('S0000001', 'S0000001'))
+        self.spider.parse_checklist(self.get_response('S0000001', 'S0000002'))
+        self.assertEqual(['S0000002'], self.spider.pending.keys())
+
+    def test_attempts_exceeded(self):
+        """Verify checklists are saved with a warning after the last try."""
+        for identifier in self.spider.attempts:
+            self.spider.attempts[identifier] = \
+                self.spider.max_checklist_requests
+        self.spider.spider_idle(self.spider)
+        self.assertFalse(self.spider.pending)
+        self.assertEqual(2, len(self.spider.warnings))
+
+    def test_parser_pool(self):
+        """Verify the checklist is saved when the page is parsed in a pool."""
+        self.spider.pool = InlinePool()
+        original = self.spider.pending['S0000001']
+        deferred = self.spider.parse_checklist(
+            self.get_response('S0000001', 'S0000001'))
+        self.assertTrue(isinstance(deferred, defer.Deferred))
+        self.assertEqual(['S0000002'], self.spider.pending.keys())
+        self.assertEqual(self.spider.checklist_url % 'S0000001',
+                         original['source']['url'])
+
+    def test_parser_pool_failed(self):
+        """Verify the checklist is still pending if the page was not parsed."""
+        self.spider.pool = FailingPool()
+        results = []
+        deferred = self.spider.parse_checklist(
+            self.get_response('S0000001', 'S0000001'))
+        deferred.addBoth(results.append)
+        self.assertEqual([None], results)
+        self.assertEqual(['S0000001', 'S0000002'],
+                         sorted(self.spider.pending.keys()))
@@ -1,12 +1,20 @@
 """Tests for parsing the observations for a location from the eBird API."""
 
+import os
+import shutil
+import tempfile
+
 from unittest import TestCase
 
+from twisted.trial import unittest
+
 from scrapy.crawler import Crawler
 from scrapy.settings import CrawlerSettings
 
 from checklists_scrapers import settings
 from checklists_scrapers.spiders import ebird_spider
+from checklists_scrapers.spiders.state import CrawlState
+from checklists_scrapers.spiders.writers import FileWriter, ThreadedWriter
 from checklists_scrapers.tests.utils import response_for_data
 
 
@@ -89,20 +97,35 @@ class ParseLocationsTestCase(TestCase):
         response = response_for_data([self.records[0]])
         results = self.spider.parse_locations(response)
         expected = self.spider.checklist_url % 'S00000001'
-        self.assertTrue(results.next().url, expected)
+        self.assertTrue(results[0].url, expected)
 
     def test_request_callbacks(self):
         """Verify the callbacks for parsing the HTML pages."""
         response = response_for_data([self.records[0]])
         results = self.spider.parse_locations(response)
         expected = self.spider.parse_checklist
-        self.assertEqual(results.next().callback, expected)
+        self.assertEqual(results[0].callback, expected)
+
+    def test_source_api(self):
+        """Verify the API URL for the checklist is for its location."""
+        response = response_for_data(self.records)
+        results = self.spider.parse_locations(response)
+        expected = self.spider.location_url % ('L0000002', 7)
+        list(results)
+        self.assertEqual(expected,
+                         self.spider.pending['S0000002']['source']['api'])
 
-    def test_request_checklist(self):
-        """Verify the metadata for the request contains the checklist."""
+    def test_request_identifier(self):
+        """Verify the metadata for the request contains the identifier."""
         response = response_for_data([self.records[0]])
         results = self.spider.parse_locations(response)
-        self.assertTrue(results.next().meta['checklist'])
+        self.assertEqual('S0000001', results[0].meta['identifier'])
+
+    def test_checklist_pending(self):
+        """Verify the checklist is held until the web page is parsed."""
+        response = response_for_data([self.records[0]])
+        self.spider.parse_locations(response)
+        self.assertTrue('S0000001' in self.spider.pending)
 
 
 class IncludeHTMLTestCase(TestCase):
@@ -172,3 +195,147 @@ class IncludeHTMLTestCase(TestCase):
         response = response_for_data(self.records)
         results = spider.parse_locations(response)
         self.assertEqual(0, sum(1 for _ in results))
+
+
+class ThreadedWriterTestCase(unittest.TestCase):
+    """Verify checklists written in background threads are reported.
+
+    The checklists are saved using the reactor so this is a trial test case.
+    """
+
+    def setUp(self):
+        """Initialize the test."""
+        crawler = Crawler(CrawlerSettings(settings))
+        crawler.configure()
+        self.spider = ebird_spider.EBirdSpider('REG')
+        self.spider.set_crawler(crawler)
+        self.spider.start_requests()
+        self.spider.include_html = False
+        self.directory = tempfile.mkdtemp()
+        self.spider.directory = self.directory
+        self.writer = FileWriter(self.directory)
+        self.spider.writer = ThreadedWriter(self.writer, 2, 5)
+        self.response = response_for_data([{
+            'comName': 'Common Name',
+            'firstName': 'Name',
+            'howMany': 1,
+            'lastName': 'Surname',
+            'lat': 45.000000,
+            'lng': -45.000000,
+            'locID': 'L0000001',
+            'locName': 'Location 1',
+            'obsDt': '2013-03-27 09:00',
+            'obsID': 'OBS0000001',
+            'sciName': 'Scientific Name',
+            'subID': 'S0000001',
+        }])
+
+    def tearDown(self):
+        """Stop the threads and remove the files written."""
+        deferred = self.spider.writer.close()
+        deferred.addCallback(lambda _: shutil.rmtree(self.directory))
+        return deferred
+
+    def test_saved(self):
+        """Verify the checklist is reported once it is written."""
+        deferred = self.spider.parse_locations(self.response)
+
+        def check(requests):
+            self.assertEqual([], requests)
+            self.assertEqual(1, len(self.spider.checklists))
+            self.assertEqual([], self.spider.errors)
+
+        return deferred.addCallback(check)
+
+    def test_failed(self):
+        """Verify a checklist is not reported if it could not be written."""
+        def fail(source, checklist):
+            raise IOError("No space left on device")
+
+        self.writer.write = fail
+        self.spider.state = CrawlState(
+            os.path.join(self.directory, 'state.sqlite3'))
+        self.addCleanup(self.spider.state.close)
+        deferred = self.spider.parse_locations(self.response)
+
+        def check(requests):
+            self.assertEqual([], requests)
+            self.assertEqual([], self.spider.checklists)
+            self.assertEqual(1, len(self.spider.errors))
+            self.assertEqual([], self.spider.state.connection.execute(
+                "SELECT * FROM checklists").fetchall())
+
+        return deferred.addCallback(check)
+
+
+class SkipUnchangedTestCase(TestCase):
+    """Verify checklists processed in a previous run are skipped."""
+
+    def setUp(self):
+        """Initialize the test."""
+        crawler = Crawler(CrawlerSettings(settings))
+        crawler.configure()
+        self.spider = ebird_spider.EBirdSpider('REG')
+        self.spider.set_crawler(crawler)
+        self.spider.start_requests()
+        self.directory = tempfile.mkdtemp()
+        self.spider.state = CrawlState(
+            os.path.join(self.directory, 'state.sqlite3'))
+        self.response = response_for_data([{
+            'comName': 'Common Name',
+            'firstName': 'Name',
+            'howMany': 1,
+            'lastName': 'Surname',
+            'lat': 45.000000,
+            'lng': -45.000000,
+            'locID': 'L0000001',
+            'locName': 'Location 1',
+            'obsDt': '2013-03-27 09:00',
+            'obsID': 'OBS0000001',
+            'sciName': 'Scientific Name',
+            'subID': 'S0000001',
+        }])
+
+    def tearDown(self):
+        """Remove the database."""
+        self.spider.state.close()
+        shutil.rmtree(self.directory)
+
+    def test_web_page_pending(self):
+        """Verify the web page is requested again if it was not merged."""
+        list(self.spider.parse_locations(self.response))
+        results = self.spider.parse_locations(self.response)
+        self.assertEqual(1, sum(1 for _ in results))
+
+    def test_unchanged_skipped(self):
+        """Verify no request is made once the web page was merged."""
+        list(self.spider.parse_locations(self.response))
+        self.spider.state.set_merged('S0000001')
+        results = self.spider.parse_locations(self.response)
+        self.assertEqual(0, sum(1 for _ in results))
+        self.assertEqual(1, self.spider.unchanged)
+
+    def test_saved_skipped(self):
+        """Verify a checklist saved without its web page is skipped."""
+        self.spider.include_html = False
+        self.spider.directory = self.directory
+        self.spider.parse_locations(self.response)
+        self.spider.parse_locations(self.response)
+        self.assertEqual(1, len(self.spider.checklists))
+        self.assertEqual(1, self.spider.unchanged)
+
+    def test_failed_not_recorded(self):
+        """Verify a checklist that could not be saved is not skipped."""
+        self.spider.include_html = False
+        self.spider.directory = self.directory
+        self.spider.writer = FileWriter(self.directory)
+
+        def fail(source, checklist):
+            raise IOError("No space left on device")
+
+        self.spider.writer.write = fail
+        self.assertRaises(IOError, self.spider.parse_locations, self.response)
+        self.spider.writer = FileWriter(self.directory)
+        self.spider.parse_locations(self.response)
+        self.assertEqual(1, len(self.spider.checklists))
+        self.assertEqual(0, self.spider.unchanged)
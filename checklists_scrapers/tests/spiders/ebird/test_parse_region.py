@@ -20,6 +20,7 @@ class ParseRegionTestCase(TestCase):
         self.spider = ebird_spider.EBirdSpider('REG')
         self.spider.set_crawler(crawler)
         self.spider.start_requests()
+        self.spider.locations_per_request = 1
 
     def test_request_count(self):
         """Verify one request is generated for each location."""
@@ -85,3 +86,60 @@ class ParseRegionTestCase(TestCase):
         ])
         results = self.spider.parse_region(response)
         self.assertEqual(1, sum(1 for _ in results))
+
+    def test_shared_locations(self):
+        """Verify locations already requested for a region are skipped."""
+        response = response_for_data([
+            {
+                'locID': 'L0000001',
+                'locName': 'Location1',
+                'lat': '',
+                'lng': '',
+            },
+        ])
+        list(self.spider.parse_region(response))
+        results = self.spider.parse_region(response)
+        self.assertEqual(0, sum(1 for _ in results))
+
+
+class BatchLocationsTestCase(TestCase):
+    """Verify the requests when several locations are fetched together."""
+
+    def setUp(self):
+        """Initialize the test."""
+        crawler = Crawler(CrawlerSettings(settings))
+        crawler.configure()
+        self.spider = ebird_spider.EBirdSpider('REG')
+        self.spider.set_crawler(crawler)
+        self.spider.start_requests()
+        self.spider.locations_per_request = 2
+        self.response = response_for_data([
+            {
+                'locID': 'L%07d' % idx,
+                'locName': 'Location%d' % idx,
+                'lat': '',
+                'lng': '',
+            } for idx in range(1, 6)
+        ])
+
+    def test_request_count(self):
+        """Verify the locations are split into batches."""
+        results = self.spider.parse_region(self.response)
+        self.assertEqual(3, sum(1 for _ in results))
+
+    def test_request_url(self):
+        """Verify the URL contains the ID for each location in the batch."""
+        results = self.spider.parse_region(self.response)
+        expected = self.spider.location_url % ('L0000001&r=L0000002', 7)
+        self.assertEqual(expected, results.next().url)
+
+    def test_locations_per_request(self):
+        """Verify the number of locations per request is limited."""
+        crawler = Crawler(CrawlerSettings(settings))
+        crawler.configure()
+        crawler.settings.overrides['EBIRD_LOCATIONS_PER_REQUEST'] = 100
+        spider = ebird_spider.EBirdSpider('REG')
+        spider.set_crawler(crawler)
+        spider.start_requests()
+        self.assertEqual(spider.max_locations_per_request,
+                         spider.locations_per_request)
@@ -1,5 +1,8 @@
 """Tests for initializing and starting the EBirdSpider."""
 
+import os
+import tempfile
+
 from unittest import TestCase
 
 from scrapy.crawler import Crawler
@@ -46,3 +49,46 @@ class StartRequestsTestCase(TestCase):
     def test_include_html(self):
         """Verify the include_html flag is set."""
         self.assertEqual(settings.EBIRD_INCLUDE_HTML, self.spider.include_html)
+
+    def test_incremental(self):
+        """Verify the incremental flag is set."""
+        self.assertEqual(settings.EBIRD_INCREMENTAL_PARSING,
+                         self.spider.incremental)
+
+
+class RegionsTestCase(TestCase):
+    """Verify the spider can fetch the observations for several regions."""
+
+    def setUp(self):
+        """Initialize the test."""
+        self.crawler = Crawler(CrawlerSettings(settings))
+        self.crawler.configure()
+
+    def get_spider(self, *args, **kwargs):
+        """Create the spider and get the initial requests."""
+        spider = ebird_spider.EBirdSpider(*args, **kwargs)
+        spider.set_crawler(self.crawler)
+        return spider, spider.start_requests()
+
+    def test_missing_region(self):
+        """Verify an error is raised if no region is given."""
+        with self.assertRaises(ValueError):
+            ebird_spider.EBirdSpider()
+
+    def test_region_list(self):
+        """Verify a request is generated for each region in the list."""
+        spider, requests = self.get_spider('REG1, REG2,REG1')
+        expected = [spider.region_url % (region, 7)
+                    for region in ['REG1', 'REG2']]
+        self.assertEqual(expected, [request.url for request in requests])
+
+    def test_region_file(self):
+        """Verify the regions can be read from a file."""
+        fd, path = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write('# Portugal\nREG1\n\nREG2\n')
+        try:
+            spider, requests = self.get_spider(region_file=path)
+        finally:
+            os.remove(path)
+        self.assertEqual(['REG1', 'REG2'], spider.regions)
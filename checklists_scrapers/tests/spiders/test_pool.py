@@ -0,0 +1,182 @@
+"""Tests for parsing web pages in worker processes."""
+
+import cPickle as pickle
+import threading
+import time
+
+from unittest import TestCase
+
+from twisted.internet import defer
+from twisted.trial import unittest
+
+from checklists_scrapers.exceptions import ParserException
+from checklists_scrapers.spiders.pool import ParserPool, parse_page
+from checklists_scrapers.tests.utils import response_for_content
+
+
+class EchoParser(object):
+    """A parser which returns the URL and metadata from the response."""
+
+    def __init__(self, response):
+        self.response = response
+
+    def get_checklist(self):
+        return {'url': self.response.url, 'meta': self.response.meta}
+
+
+class FailingParser(EchoParser):
+    """A parser which raises an error."""
+
+    def get_checklist(self):
+        raise ValueError("Cannot parse page")
+
+
+class UnpicklableParser(EchoParser):
+    """A parser which returns a checklist that cannot be pickled."""
+
+    def get_checklist(self):
+        return {'lock': threading.Lock()}
+
+
+class SlowParser(EchoParser):
+    """A parser which takes longer than the timeout."""
+
+    def get_checklist(self):
+        time.sleep(1)
+        return {}
+
+
+class HungParser(EchoParser):
+    """A parser which never finishes within the test."""
+
+    def get_checklist(self):
+        time.sleep(60)
+        return {}
+
+
+class ParsePageTestCase(TestCase):
+    """Verify pages are parsed in the worker processes."""
+
+    def setUp(self):
+        """Initialize the test."""
+        self.response = response_for_content(
+            '<html></html>', 'utf-8', url='http://example.com/checklist',
+            metadata={'identifier': 'S0000001'})
+        self.args = (self.response.__class__, self.response.url,
+                     self.response.body, self.response.encoding,
+                     self.response.meta)
+
+    def test_checklist(self):
+        """Verify the checklist returned by the parser is returned."""
+        succeeded, checklist = parse_page(EchoParser, *self.args)
+        self.assertTrue(succeeded)
+        self.assertEqual('http://example.com/checklist', checklist['url'])
+
+    def test_metadata(self):
+        """Verify the parser has access to the request metadata."""
+        succeeded, checklist = parse_page(EchoParser, *self.args)
+        self.assertEqual('S0000001', checklist['meta']['identifier'])
+
+    def test_error(self):
+        """Verify the traceback is returned if the parser fails."""
+        succeeded, value = parse_page(FailingParser, *self.args)
+        self.assertFalse(succeeded)
+        self.assertTrue('Cannot parse page' in value)
+
+
+class DeliverTestCase(TestCase):
+    """Verify the results from the worker processes are delivered."""
+
+    def setUp(self):
+        """Initialize the test."""
+        self.pool = ParserPool(1)
+        self.deferred = defer.Deferred()
+        self.results = []
+        self.deferred.addCallbacks(self.results.append, self.results.append)
+
+    def tearDown(self):
+        """Stop the worker process."""
+        self.pool.close()
+
+    def test_checklist(self):
+        """Verify the Deferred fires with the checklist."""
+        self.pool.deliver(self.deferred,
+                          pickle.dumps((True, {'identifier': 'S0000001'})))
+        self.assertEqual([{'identifier': 'S0000001'}], self.results)
+
+    def test_error(self):
+        """Verify the Deferred fails with ParserException."""
+        self.pool.deliver(self.deferred, pickle.dumps((False, 'Traceback')))
+        self.assertTrue(self.results[0].check(ParserException))
+
+    def test_late(self):
+        """Verify a result received after the Deferred fired is ignored."""
+        self.deferred.callback(None)
+        self.pool.deliver(self.deferred, pickle.dumps((True, {})))
+        self.assertEqual([None], self.results)
+
+
+class ParserPoolTestCase(unittest.TestCase):
+    """Verify the Deferred for each page always fires.
+
+    The results are delivered using the reactor so this is a trial test
+    case.
+    """
+
+    def setUp(self):
+        """Initialize the test."""
+        self.pool = ParserPool(1, timeout=0.2)
+        self.response = response_for_content(
+            '<html></html>', 'utf-8', url='http://example.com/checklist',
+            metadata={'identifier': 'S0000001'})
+
+    def tearDown(self):
+        """Stop the worker process."""
+        self.pool.close()
+
+    @defer.inlineCallbacks
+    def test_checklist(self):
+        """Verify the checklist is returned from the worker process."""
+        checklist = yield self.pool.parse(EchoParser, self.response)
+        self.assertEqual('S0000001', checklist['meta']['identifier'])
+
+    def test_error(self):
+        """Verify an error raised by the parser fails the Deferred."""
+        return self.assertFailure(
+            self.pool.parse(FailingParser, self.response), ParserException)
+
+    def test_unpicklable_result(self):
+        """Verify a checklist which cannot be pickled fails the Deferred."""
+        return self.assertFailure(
+            self.pool.parse(UnpicklableParser, self.response),
+            ParserException)
+
+    def test_unpicklable_arguments(self):
+        """Verify a response which cannot be pickled fails the Deferred."""
+        self.response.meta['callback'] = lambda: None
+        return self.assertFailure(
+            self.pool.parse(EchoParser, self.response), ParserException)
+
+    def test_timeout(self):
+        """Verify the Deferred fails if no result is received in time."""
+        return self.assertFailure(
+            self.pool.parse(SlowParser, self.response), ParserException)
+
+    def test_close_hung(self):
+        """Verify the pool closes even if a parser has hung."""
+        deferred = self.assertFailure(
+            self.pool.parse(HungParser, self.response), ParserException)
+
+        def close(_):
+            started = time.time()
+            self.pool.close()
+            self.assertTrue(time.time() - started < 5)
+            self.assertEqual(set(), self.pool.outstanding)
+
+        return deferred.addCallback(close)
+
+    def test_close_outstanding(self):
+        """Verify a page still being parsed fails when the pool closes."""
+        deferred = self.pool.parse(HungParser, self.response)
+        self.pool.close()
+        return self.assertFailure(deferred, ParserException)
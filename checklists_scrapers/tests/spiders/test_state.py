@@ -0,0 +1,67 @@
+"""Tests for recording the checklists processed by the spiders."""
+
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from checklists_scrapers.spiders.state import CrawlState, get_fingerprint
+
+
+class CrawlStateTestCase(TestCase):
+    """Verify the fingerprints for checklists are recorded."""
+
+    def setUp(self):
+        """Initialize the test."""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'state.sqlite3')
+        self.state = CrawlState(self.path)
+        self.fingerprint = get_fingerprint({'identifier': 'S0000001'})
+
+    def tearDown(self):
+        """Remove the database."""
+        self.state.close()
+        shutil.rmtree(self.directory)
+
+    def test_fingerprint(self):
+        """Verify the fingerprint does not depend on the order of the keys."""
+        self.assertEqual(get_fingerprint({'a': 1, 'b': 2}),
+                         get_fingerprint({'b': 2, 'a': 1}))
+
+    def test_new_checklist(self):
+        """Verify a checklist not recorded is not current."""
+        self.assertFalse(
+            self.state.is_current('S0000001', self.fingerprint, False))
+
+    def test_unchanged(self):
+        """Verify a checklist with the same fingerprint is current."""
+        self.state.update('S0000001', self.fingerprint)
+        self.assertTrue(
+            self.state.is_current('S0000001', self.fingerprint, False))
+
+    def test_changed(self):
+        """Verify a checklist with a different fingerprint is not current."""
+        self.state.update('S0000001', self.fingerprint)
+        self.assertFalse(self.state.is_current('S0000001', 'other', False))
+
+    def test_not_merged(self):
+        """Verify a checklist is not current if the web page is missing."""
+        self.state.update('S0000001', self.fingerprint)
+        self.assertFalse(
+            self.state.is_current('S0000001', self.fingerprint, True))
+
+    def test_merged(self):
+        """Verify a checklist is current once the web page is merged."""
+        self.state.update('S0000001', self.fingerprint)
+        self.state.set_merged('S0000001')
+        self.assertTrue(
+            self.state.is_current('S0000001', self.fingerprint, True))
+
+    def test_persistent(self):
+        """Verify the state is kept between runs."""
+        self.state.update('S0000001', self.fingerprint)
+        self.state.close()
+        self.state = CrawlState(self.path)
+        self.assertTrue(
+            self.state.is_current('S0000001', self.fingerprint, False))
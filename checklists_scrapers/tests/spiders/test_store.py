@@ -0,0 +1,81 @@
+"""Tests for holding the checklists waiting to be completed by a spider."""
+
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from checklists_scrapers.spiders.store import ChecklistStore
+
+
+class ChecklistStoreTestCase(TestCase):
+    """Verify checklists are held in memory and spilled to disk."""
+
+    def setUp(self):
+        """Initialize the test."""
+        self.directory = tempfile.mkdtemp()
+        self.store = ChecklistStore(limit=1, directory=self.directory)
+
+    def tearDown(self):
+        """Remove the temporary database."""
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_memory(self):
+        """Verify checklists within the limit are held in memory."""
+        self.store['S0000001'] = {'identifier': 'S0000001'}
+        self.assertEqual(['S0000001'], self.store.memory.keys())
+        self.assertEqual([], os.listdir(self.directory))
+
+    def test_spill(self):
+        """Verify checklists beyond the limit are saved to disk."""
+        self.store['S0000001'] = {'identifier': 'S0000001'}
+        self.store['S0000002'] = {'identifier': 'S0000002'}
+        self.assertEqual(set(['S0000002']), self.store.spilled)
+        self.assertEqual(1, len(os.listdir(self.directory)))
+
+    def test_get(self):
+        """Verify spilled checklists are read back from disk."""
+        self.store['S0000001'] = {'identifier': 'S0000001'}
+        self.store['S0000002'] = {'identifier': 'S0000002'}
+        self.assertEqual({'identifier': 'S0000002'}, self.store['S0000002'])
+
+    def test_contains(self):
+        """Verify checklists in memory and on disk are in the store."""
+        self.store['S0000001'] = {'identifier': 'S0000001'}
+        self.store['S0000002'] = {'identifier': 'S0000002'}
+        self.assertTrue('S0000001' in self.store)
+        self.assertTrue('S0000002' in self.store)
+        self.assertFalse('S0000003' in self.store)
+        self.assertEqual(2, len(self.store))
+
+    def test_pop(self):
+        """Verify popping a spilled checklist removes it from disk."""
+        self.store['S0000001'] = {'identifier': 'S0000001'}
+        self.store['S0000002'] = {'identifier': 'S0000002'}
+        self.assertEqual({'identifier': 'S0000002'},
+                         self.store.pop('S0000002'))
+        self.assertEqual(['S0000001'], self.store.keys())
+        self.assertRaises(KeyError, self.store.__getitem__, 'S0000002')
+
+    def test_pop_default(self):
+        """Verify the default is returned for an unknown checklist."""
+        self.assertEqual(None, self.store.pop('S0000001', None))
+        self.assertRaises(KeyError, self.store.pop, 'S0000001')
+
+    def test_close(self):
+        """Verify closing the store deletes the temporary database."""
+        self.store['S0000001'] = {'identifier': 'S0000001'}
+        self.store['S0000002'] = {'identifier': 'S0000002'}
+        self.store.close()
+        self.assertEqual([], os.listdir(self.directory))
+        self.assertEqual(0, len(self.store))
+
+    def test_no_limit(self):
+        """Verify all checklists are held in memory if there is no limit."""
+        store = ChecklistStore()
+        for index in range(10):
+            store['S%07d' % index] = {}
+        self.assertEqual(10, len(store.memory))
+        self.assertEqual(None, store.connection)
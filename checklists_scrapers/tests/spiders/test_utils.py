@@ -0,0 +1,112 @@
+"""Tests for the utility functions used by the scrapers."""
+
+from unittest import TestCase
+
+from scrapy.selector import HtmlXPathSelector
+
+from checklists_scrapers.spiders.utils import select_unique, \
+    iter_json_array, compile_xpath, extract_cells
+from checklists_scrapers.tests.utils import response_for_content
+
+
+class SelectUniqueTestCase(TestCase):
+    """Verify selecting records with unique values for a set of keys."""
+
+    def setUp(self):
+        """Initialize the test."""
+        self.records = [
+            {'id': 1, 'name': 'a', 'count': 1},
+            {'id': 2, 'name': 'b', 'count': 2},
+            {'id': 1, 'name': 'a', 'count': 3},
+            {'id': 3, 'name': 'a'},
+        ]
+
+    def test_duplicates_removed(self):
+        """Verify only the first record for a set of values is kept."""
+        actual = list(select_unique(self.records, ['id', 'name']))
+        self.assertEqual([self.records[0], self.records[1],
+                          self.records[3]], actual)
+
+    def test_order(self):
+        """Verify the records are returned in the order they were seen."""
+        actual = list(select_unique(self.records, ['name']))
+        self.assertEqual([self.records[0], self.records[1]], actual)
+
+    def test_missing_key(self):
+        """Verify a missing key is not treated the same as None."""
+        records = [{'id': 1}, {'id': 1, 'name': None}]
+        actual = list(select_unique(records, ['id', 'name']))
+        self.assertEqual(records, actual)
+
+
+class IterJSONArrayTestCase(TestCase):
+    """Verify decoding the items in a JSON array one at a time."""
+
+    def test_items(self):
+        """Verify all the items in the array are decoded."""
+        actual = list(iter_json_array(' [ {"a": 1} , {"b": [2, 3]} ] '))
+        self.assertEqual([{'a': 1}, {'b': [2, 3]}], actual)
+
+    def test_empty(self):
+        """Verify nothing is returned for an empty array."""
+        self.assertEqual([], list(iter_json_array('[ ]')))
+
+    def test_not_array(self):
+        """Verify an error is raised if the content is not an array."""
+        with self.assertRaises(ValueError):
+            list(iter_json_array('{"a": 1}'))
+
+    def test_missing_separator(self):
+        """Verify an error is raised if the items are not separated."""
+        with self.assertRaises(ValueError):
+            list(iter_json_array('[{"a": 1} {"b": 2}]'))
+
+
+class CompileXPathTestCase(TestCase):
+    """Verify the compiled XPath expressions select the same nodes."""
+
+    def setUp(self):
+        """Initialize the test."""
+        response = response_for_content(
+            '<html><body><p>One</p><p>Two <b>Three</b></p></body></html>',
+            'utf-8')
+        self.docroot = HtmlXPathSelector(response)
+
+    def test_shared(self):
+        """Verify an expression is only compiled once."""
+        self.assertTrue(compile_xpath('//p') is compile_xpath('//p'))
+
+    def test_select(self):
+        """Verify the nodes selected are the same as for select()."""
+        xpath = compile_xpath('//p/text()')
+        self.assertEqual(self.docroot.select('//p/text()').extract(),
+                         xpath.extract(self.docroot))
+
+    def test_select_list(self):
+        """Verify an expression can be evaluated on a list of nodes."""
+        nodes = compile_xpath('//p').select(self.docroot)
+        self.assertEqual(nodes.select('b/text()').extract(),
+                         compile_xpath('b/text()').extract(nodes))
+
+
+class ExtractCellsTestCase(TestCase):
+    """Verify the cells in a table are extracted as a grid."""
+
+    def setUp(self):
+        """Initialize the test."""
+        response = response_for_content(
+            '<table><tr><th></th><th>Adult</th><th>Juvenile</th></tr>'
+            '<tr><td>Male</td><td>1</td><td></td></tr>'
+            '<tr><td>Female</td><td></td><td>2</td></tr></table>',
+            'utf-8')
+        self.rows = HtmlXPathSelector(response).select('//tr')
+
+    def test_headings(self):
+        """Verify the headings are extracted."""
+        expected = [[None, 'Adult', 'Juvenile'], [], []]
+        self.assertEqual(expected, extract_cells(self.rows, 'th'))
+
+    def test_cells(self):
+        """Verify the cells are extracted with None for empty cells."""
+        expected = [[], ['Male', '1', None], ['Female', None, '2']]
+        self.assertEqual(expected, extract_cells(self.rows, 'td'))
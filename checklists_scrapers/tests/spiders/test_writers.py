@@ -0,0 +1,568 @@
+"""Tests for the writers used to save the checklists."""
+
+import bz2
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+
+from unittest import TestCase
+
+from twisted.internet import defer, reactor, task
+from twisted.trial import unittest
+
+from scrapy.crawler import Crawler
+from scrapy.settings import CrawlerSettings
+
+from checklists_scrapers import settings
+from checklists_scrapers.spiders import utils
+from checklists_scrapers.spiders.writers import DatabaseWriter, \
+    FileWriter, SegmentWriter, SyncBatch, ThreadedWriter, WriteStats, \
+    get_writer
+from checklists_scrapers.utils import load_checklists
+
+
+def get_stats():
+    """Get the stats collector for a crawler using the project settings."""
+    crawler = Crawler(CrawlerSettings(settings))
+    crawler.configure()
+    return crawler.stats
+
+
+class FileWriterTestCase(TestCase):
+    """Verify each checklist is written to a separate file."""
+
+    def setUp(self):
+        """Initialize the test."""
+        self.directory = tempfile.mkdtemp()
+        self.writer = FileWriter(self.directory)
+        self.checklist = {'identifier': 'S0000001', 'date': '2013-03-27'}
+
+    def tearDown(self):
+        """Remove the files written."""
+        shutil.rmtree(self.directory)
+
+    def test_write(self):
+        """Verify the checklist is written to the named file."""
+        path = self.writer.write('eBird', self.checklist)
+        self.assertEqual(os.path.join(self.directory, 'eBird-S0000001.json'),
+                         path)
+        with open(path, 'rb') as fp:
+            self.assertEqual(self.checklist, json.load(fp))
+
+    def test_atomic(self):
+        """Verify no temporary files are left once a checklist is written."""
+        self.writer.write('eBird', self.checklist)
+        self.assertEqual(['eBird-S0000001.json'], os.listdir(self.directory))
+
+    def test_sync(self):
+        """Verify the file is flushed before it is renamed."""
+        flushed = []
+
+        def fsync(path):
+            flushed.append((os.path.basename(path), os.path.exists(path)))
+
+        self.writer.sync = SyncBatch(10, 60)
+        self.writer.sync.flush = lambda paths: None
+        original = utils.fsync
+        utils.fsync = fsync
+        try:
+            self.writer.write('eBird', self.checklist)
+        finally:
+            utils.fsync = original
+        self.assertEqual(1, len(flushed))
+        name, existed = flushed[0]
+        self.assertTrue(name.startswith('.'))
+        self.assertTrue(name.endswith('eBird-S0000001.json'))
+        self.assertTrue(existed)
+
+    def test_stats(self):
+        """Verify the throughput is recorded in the crawler stats."""
+        stats = get_stats()
+        self.writer.stats = WriteStats(stats, None)
+        path = self.writer.write('eBird', self.checklist)
+        self.assertEqual(1, stats.get_value('checklists/writer/checklists'))
+        self.assertEqual(os.path.getsize(path),
+                         stats.get_value('checklists/writer/bytes'))
+
+    def test_skip_unchanged(self):
+        """Verify a file containing the same checklist is not written."""
+        stats = get_stats()
+        self.writer.stats = WriteStats(stats, None)
+        self.writer.skip_unchanged = True
+        path = self.writer.write('eBird', self.checklist)
+        os.utime(path, (0, 0))
+        self.writer.write('eBird', self.checklist)
+        self.assertEqual(0, os.path.getmtime(path))
+        self.assertEqual(1, stats.get_value('checklists/writer/checklists'))
+        self.assertEqual(1, stats.get_value('checklists/writer/skipped'))
+
+    def test_skip_changed(self):
+        """Verify a file is written if the checklist has changed."""
+        self.writer.skip_unchanged = True
+        path = self.writer.write('eBird', self.checklist)
+        self.checklist['comment'] = 'Updated'
+        self.writer.write('eBird', self.checklist)
+        with open(path, 'rb') as fp:
+            self.assertEqual('Updated', json.load(fp)['comment'])
+
+    def test_gzip(self):
+        """Verify the checklist is compressed with gzip."""
+        self.writer.compression = 'gzip'
+        path = self.writer.write('eBird', self.checklist)
+        self.assertTrue(path.endswith('eBird-S0000001.json.gz'))
+        with gzip.open(path, 'rb') as fp:
+            self.assertEqual(self.checklist, json.load(fp))
+
+    def test_bz2(self):
+        """Verify the checklist is compressed with bz2."""
+        self.writer.compression = 'bz2'
+        path = self.writer.write('eBird', self.checklist)
+        self.assertTrue(path.endswith('eBird-S0000001.json.bz2'))
+        fp = bz2.BZ2File(path, 'rb')
+        try:
+            self.assertEqual(self.checklist, json.load(fp))
+        finally:
+            fp.close()
+
+    def test_unchanged(self):
+        """Verify the same checklist always gives the same gzip file."""
+        self.writer.compression = 'gzip'
+        contents = []
+        for idx in range(2):
+            path = self.writer.write('eBird', self.checklist)
+            with open(path, 'rb') as fp:
+                contents.append(fp.read())
+        self.assertEqual(contents[0], contents[1])
+
+    def test_date_layout(self):
+        """Verify the file is written to a directory for the date."""
+        self.writer.layout = 'date'
+        path = self.writer.write('eBird', self.checklist)
+        self.assertEqual(os.path.join(self.directory, 'eBird', '2013', '03',
+                                      '27', 'eBird-S0000001.json'), path)
+
+    def test_hash_layout(self):
+        """Verify the file is written to a directory for the hash."""
+        self.writer.layout = 'hash'
+        path = self.writer.write('eBird', self.checklist)
+        digest = hashlib.md5('S0000001').hexdigest()
+        self.assertEqual(os.path.join(self.directory, 'eBird', digest[:2],
+                                      digest[2:4], 'eBird-S0000001.json'),
+                         path)
+
+
+class SegmentWriterTestCase(TestCase):
+    """Verify checklists are appended to rotating JSON Lines files."""
+
+    def setUp(self):
+        """Initialize the test."""
+        self.directory = tempfile.mkdtemp()
+        self.checklists = [{'identifier': 'S%07d' % idx, 'entries': []}
+                           for idx in range(5)]
+
+    def tearDown(self):
+        """Remove the segments written."""
+        shutil.rmtree(self.directory)
+
+    def write(self, size, compression=''):
+        """Write the checklists and return the names of the segments."""
+        writer = SegmentWriter(self.directory, 'ebird', size, compression)
+        for checklist in self.checklists:
+            writer.write('eBird', checklist)
+        writer.close()
+        return sorted(os.listdir(self.directory))
+
+    def test_compact(self):
+        """Verify each checklist is written on a single line."""
+        self.write(1024 * 1024)
+        path = os.path.join(self.directory, os.listdir(self.directory)[0])
+        with open(path, 'rb') as fp:
+            lines = fp.readlines()
+        self.assertEqual(5, len(lines))
+        self.assertEqual('{"entries":[],"identifier":"S0000000"}\n', lines[0])
+
+    def test_rotate(self):
+        """Verify a new segment is started when the size is reached."""
+        names = self.write(70)
+        self.assertEqual(3, len(names))
+        self.assertTrue(names[0].startswith('ebird-'))
+        self.assertTrue(names[0].endswith('-0001.jsonl'))
+
+    def test_hidden(self):
+        """Verify the segment is hidden until it is closed."""
+        writer = SegmentWriter(self.directory, 'ebird', 1024 * 1024)
+        writer.write('eBird', self.checklists[0])
+        self.assertEqual([], list(load_checklists(self.directory)))
+        writer.close()
+        self.assertEqual([self.checklists[0]],
+                         list(load_checklists(self.directory)))
+
+    def test_load(self):
+        """Verify the checklists are read back from the segments in order."""
+        self.write(70)
+        self.assertEqual(self.checklists,
+                         list(load_checklists(self.directory)))
+
+    def test_load_compressed(self):
+        """Verify the checklists are read back from compressed segments."""
+        self.write(70, 'gzip')
+        self.assertEqual(self.checklists,
+                         list(load_checklists(self.directory)))
+
+    def test_load_bz2(self):
+        """Verify the checklists are read back from bz2 segments."""
+        self.write(70, 'bz2')
+        self.assertEqual(self.checklists,
+                         list(load_checklists(self.directory)))
+
+
+class SyncBatchTestCase(TestCase):
+    """Verify files are flushed to disk in batches."""
+
+    def setUp(self):
+        """Initialize the test."""
+        self.batch = SyncBatch(2, 60)
+        self.synced = []
+        self.batch.flush = lambda paths: self.synced.append(paths)
+
+    def test_files(self):
+        """Verify the batch is flushed when it is full."""
+        self.batch.add('file1')
+        self.assertEqual([], self.synced)
+        self.batch.add('file2')
+        self.assertEqual([['file1', 'file2']], self.synced)
+
+    def test_seconds(self):
+        """Verify the batch is flushed when the first file has waited."""
+        self.batch.seconds = 0
+        self.batch.add('file1')
+        self.assertEqual([['file1']], self.synced)
+
+    def test_disabled(self):
+        """Verify files are not flushed if the batch size is 0."""
+        self.batch.files = 0
+        self.batch.add('file1')
+        self.batch.add('file2')
+        self.assertEqual([], self.batch.paths)
+
+
+class SyncBatchTimerTestCase(unittest.TestCase):
+    """Verify a batch is flushed on time when no more files are added.
+
+    The timer is only scheduled while the reactor is running so this is a
+    trial test case and the files are added from calls made by the reactor.
+    """
+
+    def setUp(self):
+        """Initialize the test."""
+        self.batch = SyncBatch(10, 0.1)
+        self.synced = []
+        self.batch.flush = lambda paths: self.synced.append(paths)
+
+    def tearDown(self):
+        """Cancel any timer still running."""
+        self.batch.sync()
+
+    def test_timer(self):
+        """Verify the batch is flushed once the first file has waited."""
+        deferred = task.deferLater(reactor, 0, self.batch.add, 'file1')
+        deferred.addCallback(
+            lambda _: self.assertEqual([], self.synced))
+        deferred.addCallback(
+            lambda _: task.deferLater(reactor, 0.2, lambda: None))
+        deferred.addCallback(
+            lambda _: self.assertEqual([['file1']], self.synced))
+        return deferred
+
+    def test_cancelled(self):
+        """Verify the timer is cancelled when the batch is flushed."""
+        def add_then_sync():
+            self.batch.add('file1')
+            self.assertTrue(self.batch.timer.active())
+            self.batch.sync()
+            self.assertEqual(None, self.batch.timer)
+
+        return task.deferLater(reactor, 0, add_then_sync)
+
+
+class DatabaseWriterTestCase(unittest.TestCase):
+    """Verify checklists are written to tables in a SQLite database.
+
+    The database is also written from a ThreadedWriter which needs the
+    reactor so this is a trial test case.
+    """
+
+    def setUp(self):
+        """Initialize the test."""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'checklists.sqlite3')
+        self.writer = DatabaseWriter(self.path, 2)
+        self.checklist = {
+            'meta': {'version': 1, 'language': 'en'},
+            'identifier': 'S0000001',
+            'date': '2013-03-27',
+            'source': {'name': 'eBird', 'submitted_by': 'Name Surname'},
+            'observers': {'names': ['Name Surname'], 'count': 1},
+            'location': {'identifier': 'L0000001', 'name': 'Location',
+                         'lat': 45.0, 'lon': -9.5},
+            'protocol': {'name': 'Traveling', 'time': '07:00'},
+            'entries': [{
+                'identifier': 'OBS0000001',
+                'species': {'name': 'Gannet'},
+                'count': 45,
+                'details': [{'age': 'Adult', 'count': 26},
+                            {'age': 'Immature', 'count': 19}],
+            }, {
+                'identifier': 'OBS0000002',
+                'species': {'name': 'Manx Shearwater'},
+                'count': 22,
+            }],
+        }
+
+    def tearDown(self):
+        """Close and remove the database."""
+        self.writer.close()
+        shutil.rmtree(self.directory)
+
+    def query(self, sql, *args):
+        """Read rows using a separate connection."""
+        connection = sqlite3.connect(self.path)
+        try:
+            return connection.execute(sql, args).fetchall()
+        finally:
+            connection.close()
+
+    def test_write(self):
+        """Verify the rows for a checklist are written to each table."""
+        self.writer.write('eBird', self.checklist)
+        self.writer.close()
+        self.assertEqual(
+            [('S0000001', 'eBird', '2013-03-27', '07:00', 'L0000001')],
+            self.query("SELECT identifier, source, date, time, location"
+                       " FROM checklists"))
+        self.assertEqual([('Location', 45.0, -9.5)],
+                         self.query("SELECT name, lat, lon FROM locations"))
+        self.assertEqual([('S0000001', 'Name Surname')],
+                         self.query("SELECT * FROM observers"))
+        self.assertEqual([('OBS0000001', 'Gannet', 45),
+                          ('OBS0000002', 'Manx Shearwater', 22)],
+                         self.query("SELECT identifier, species, count"
+                                    " FROM entries ORDER BY identifier"))
+        self.assertEqual([('Adult', 26), ('Immature', 19)],
+                         self.query("SELECT age, count FROM details"
+                                    " WHERE entry = 'OBS0000001'"
+                                    " ORDER BY age"))
+
+    def test_batch(self):
+        """Verify the checklists are committed in batches."""
+        self.writer.write('eBird', self.checklist)
+        self.assertEqual([], self.query("SELECT * FROM checklists"))
+        self.checklist['identifier'] = 'S0000002'
+        self.writer.write('eBird', self.checklist)
+        self.assertEqual(2, len(self.query("SELECT * FROM checklists")))
+
+    def test_replace(self):
+        """Verify a checklist downloaded again replaces the earlier rows."""
+        self.writer.write('eBird', self.checklist)
+        self.checklist['entries'][0]['count'] = 50
+        del self.checklist['entries'][0]['details'][1]
+        del self.checklist['entries'][1]
+        self.writer.write('eBird', self.checklist)
+        self.writer.close()
+        self.assertEqual(1, len(self.query("SELECT * FROM checklists")))
+        self.assertEqual([('OBS0000001', 50)],
+                         self.query("SELECT identifier, count FROM entries"))
+        self.assertEqual(1, len(self.query("SELECT * FROM details")))
+
+    def test_entry_identifier(self):
+        """Verify entries without an identifier are given one."""
+        for entry in self.checklist['entries']:
+            del entry['identifier']
+        self.writer.write('eBird', self.checklist)
+        self.writer.close()
+        self.assertEqual([('S0000001-000',), ('S0000001-001',)],
+                         self.query("SELECT identifier FROM entries"
+                                    " ORDER BY identifier"))
+
+    @defer.inlineCallbacks
+    def test_threads(self):
+        """Verify the database can be written from background threads."""
+        writer = ThreadedWriter(self.writer, 3, 5)
+        for idx in range(10):
+            checklist = dict(self.checklist, identifier='S%07d' % idx,
+                             entries=[])
+            writer.write('eBird', checklist)
+        yield writer.close()
+        self.assertEqual(10, len(self.query("SELECT * FROM checklists")))
+
+
+class ThreadedWriterTestCase(unittest.TestCase):
+    """Verify checklists are written from a pool of background threads.
+
+    The Deferreds returned by the writer fire on the reactor thread so this
+    is a trial test case.
+    """
+
+    def setUp(self):
+        """Initialize the test."""
+        self.directory = tempfile.mkdtemp()
+        self.stats = get_stats()
+        self.checklists = [{'identifier': 'S%07d' % idx, 'date': '2013-03-27'}
+                           for idx in range(20)]
+
+    def tearDown(self):
+        """Remove the files written."""
+        shutil.rmtree(self.directory)
+
+    @defer.inlineCallbacks
+    def test_flush(self):
+        """Verify every checklist is written once the writer is closed."""
+        writer = ThreadedWriter(FileWriter(self.directory), 3, 5)
+        for checklist in self.checklists:
+            writer.write('eBird', checklist)
+        yield writer.close()
+        self.assertEqual(20, len(os.listdir(self.directory)))
+        self.assertEqual([], writer.pool.threads)
+
+    @defer.inlineCallbacks
+    def test_write(self):
+        """Verify the Deferred fires with the path once it is written."""
+        writer = ThreadedWriter(FileWriter(self.directory), 2, 5)
+        path = yield writer.write('eBird', self.checklists[0])
+        yield writer.close()
+        self.assertEqual(os.path.join(self.directory, 'eBird-S0000000.json'),
+                         path)
+
+    @defer.inlineCallbacks
+    def test_back_pressure(self):
+        """Verify write() does not block when the writer is full."""
+        blocked = threading.Event()
+        writer = FileWriter(self.directory)
+        write = writer.write
+
+        def wait_then_write(source, checklist):
+            blocked.wait()
+            return write(source, checklist)
+
+        writer.write = wait_then_write
+        writer = ThreadedWriter(writer, 1, 2, WriteStats(self.stats, None))
+        self.addCleanup(blocked.set)
+        written = []
+        deferreds = [writer.write('eBird', checklist).addCallback(
+            written.append) for checklist in self.checklists[:5]]
+        self.assertEqual([], written)
+        self.assertEqual(3, self.stats.get_value('checklists/writer/waits'))
+        blocked.set()
+        yield defer.DeferredList(deferreds)
+        self.assertEqual(5, len(written))
+        yield writer.close()
+        self.assertEqual(5, len(os.listdir(self.directory)))
+
+    def test_errors(self):
+        """Verify errors raised while writing fail the Deferred."""
+        writer = ThreadedWriter(FileWriter(self.directory), 2, 5)
+        deferred = writer.write('eBird', {'source': {}})
+        deferred.addBoth(lambda result: writer.close().addCallback(
+            lambda _: result))
+        return self.assertFailure(deferred, KeyError)
+
+    @defer.inlineCallbacks
+    def test_stats(self):
+        """Verify the stats are complete once the writer is closed."""
+        writer = ThreadedWriter(
+            FileWriter(self.directory, stats=WriteStats(self.stats, None)),
+            3, 5)
+        for checklist in self.checklists:
+            writer.write('eBird', checklist)
+        yield writer.close()
+        self.assertEqual(20,
+                         self.stats.get_value('checklists/writer/checklists'))
+
+class GetWriterTestCase(TestCase):
+    """Verify the writer is selected by the DOWNLOAD_OUTPUT setting."""
+
+    def setUp(self):
+        """Initialize the test."""
+        self.settings = {
+            'DOWNLOAD_OUTPUT': 'files',
+            'DOWNLOAD_COMPRESSION': '',
+            'DOWNLOAD_SEGMENT_SIZE': 2,
+            'DOWNLOAD_SYNC_FILES': 0,
+            'DOWNLOAD_SYNC_SECONDS': 0,
+            'DOWNLOAD_SKIP_UNCHANGED': False,
+            'DOWNLOAD_LAYOUT': 'flat',
+            'DOWNLOAD_WRITER_THREADS': 0,
+            'DOWNLOAD_WRITER_QUEUE': 10,
+            'DOWNLOAD_DATABASE': '',
+            'DOWNLOAD_DATABASE_BATCH': 50,
+        }
+
+    def test_files(self):
+        """Verify files are written by default."""
+        writer = get_writer(self.settings, '.', 'ebird')
+        self.assertTrue(isinstance(writer, FileWriter))
+
+    def test_segments(self):
+        """Verify the segment size is set in MB."""
+        self.settings['DOWNLOAD_OUTPUT'] = 'segments'
+        writer = get_writer(self.settings, '.', 'ebird')
+        self.assertEqual(2 * 1024 * 1024, writer.size)
+
+    def test_compression(self):
+        """Verify the writer is created with the codec."""
+        self.settings['DOWNLOAD_COMPRESSION'] = 'gzip'
+        writer = get_writer(self.settings, '.', 'ebird')
+        self.assertEqual('gzip', writer.compression)
+
+    def test_skip_unchanged(self):
+        """Verify the writer is created to skip unchanged files."""
+        self.settings['DOWNLOAD_SKIP_UNCHANGED'] = True
+        writer = get_writer(self.settings, '.', 'ebird')
+        self.assertTrue(writer.skip_unchanged)
+
+    def test_layout(self):
+        """Verify the writer is created with the directory layout."""
+        self.settings['DOWNLOAD_LAYOUT'] = 'hash'
+        writer = get_writer(self.settings, '.', 'ebird')
+        self.assertEqual('hash', writer.layout)
+
+    def test_threads(self):
+        """Verify the writer is wrapped to write from background threads."""
+        self.settings['DOWNLOAD_WRITER_THREADS'] = 2
+        writer = get_writer(self.settings, '.', 'ebird')
+        self.assertTrue(isinstance(writer, ThreadedWriter))
+        self.assertTrue(isinstance(writer.writer, FileWriter))
+        self.assertEqual(2, writer.pool.max)
+        self.assertEqual(10, writer.slots.limit)
+        writer.close()
+
+    def test_sqlite(self):
+        """Verify the database is created in the directory by default."""
+        directory = tempfile.mkdtemp()
+        self.settings['DOWNLOAD_OUTPUT'] = 'sqlite'
+        writer = get_writer(self.settings, directory, 'ebird')
+        writer.close()
+        self.assertEqual(os.path.join(directory, 'checklists.sqlite3'),
+                         writer.path)
+        self.assertEqual(50, writer.batch)
+        shutil.rmtree(directory)
+
+    def test_unknown_layout(self):
+        """Verify an unknown directory layout is rejected."""
+        self.settings['DOWNLOAD_LAYOUT'] = 'tree'
+        self.assertRaises(ValueError, get_writer, self.settings, '.', 'ebird')
+
+    def test_unknown(self):
+        """Verify an unknown type of output is rejected."""
+        self.settings['DOWNLOAD_OUTPUT'] = 'xml'
+        self.assertRaises(ValueError, get_writer, self.settings, '.', 'ebird')
+
+    def test_unknown_compression(self):
+        """Verify an unknown codec is rejected."""
+        self.settings['DOWNLOAD_COMPRESSION'] = 'zip'
+        self.assertRaises(ValueError, get_writer, self.settings, '.', 'ebird')
@@ -0,0 +1,95 @@
+"""Tests for merging the checklists from the API with saved web pages."""
+
+import json
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from checklists_scrapers import merge
+
+
+class MergeChecklistsTestCase(TestCase):
+    """Verify the checklists are merged with the saved web pages."""
+
+    def setUp(self):
+        """Initialize the test."""
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, 'api')
+        self.pages = os.path.join(self.directory, 'pages')
+        self.output = os.path.join(self.directory, 'output')
+        for path in [self.source, self.pages, self.output]:
+            os.makedirs(path)
+
+        self.checklists = [{
+            'meta': {'version': 1, 'language': 'en'},
+            'identifier': identifier,
+            'date': '2013-03-27',
+            'source': {'name': 'eBird', 'submitted_by': 'Name Surname'},
+            'observers': {'names': ['Name Surname'], 'count': 1},
+            'location': {'identifier': 'L0000001', 'name': 'Location'},
+            'entries': [],
+        } for identifier in ['S0000001', 'S0000002']]
+
+        for checklist in self.checklists:
+            path = os.path.join(self.source,
+                                '%s.json' % checklist['identifier'])
+            with open(path, 'wb') as fp:
+                json.dump(checklist, fp)
+
+        with open(os.path.join(self.pages, 'S0000001.html'), 'wb') as fp:
+            fp.write("""
+            <html><body>
+            <dl><dt>Protocol:</dt><dd>Traveling</dd></dl>
+            <dl><dt>Duration:</dt><dd>1 hour(s)</dd></dl>
+            <dl><dt>Comments:</dt><dd>A comment.</dd></dl>
+            </body></html>
+            """)
+
+    def tearDown(self):
+        """Remove the checklists and web pages."""
+        shutil.rmtree(self.directory)
+
+    def load(self, identifier):
+        """Load a merged checklist."""
+        path = os.path.join(self.output, 'eBird-%s.json' % identifier)
+        with open(path, 'rb') as fp:
+            return json.load(fp)
+
+    def test_read_directory(self):
+        """Verify the checklists are read from a directory."""
+        self.assertEqual(self.checklists,
+                         list(merge.read_checklists(self.source)))
+
+    def test_read_json_lines(self):
+        """Verify the checklists are read from a JSON Lines file."""
+        path = os.path.join(self.directory, 'checklists.jsonl')
+        with open(path, 'wb') as fp:
+            for checklist in self.checklists:
+                fp.write(json.dumps(checklist) + '\n\n')
+        self.assertEqual(self.checklists, list(merge.read_checklists(path)))
+
+    def test_merged(self):
+        """Verify the checklist is merged with the web page."""
+        merge.merge_checklists(self.source, self.pages, self.output, 1)
+        checklist = self.load('S0000001')
+        self.assertEqual('A comment.', checklist['comment'])
+        self.assertEqual(merge.EBirdSpider.checklist_url % 'S0000001',
+                         checklist['source']['url'])
+
+    def test_missing_page(self):
+        """Verify a checklist without a web page is saved with a warning."""
+        warnings = merge.merge_checklists(
+            self.source, self.pages, self.output, 1)
+        self.assertEqual(['S0000002'],
+                         [checklist['identifier'] for checklist, messages
+                          in warnings])
+        self.assertEqual(self.checklists[1]['entries'],
+                         self.load('S0000002')['entries'])
+
+    def test_worker_processes(self):
+        """Verify the checklists are merged in worker processes."""
+        merge.merge_checklists(self.source, self.pages, self.output, 2)
+        self.assertEqual(['eBird-S0000001.json', 'eBird-S0000002.json'],
+                         sorted(os.listdir(self.output)))
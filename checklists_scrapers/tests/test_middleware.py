@@ -0,0 +1,148 @@
+"""Tests for the downloader middleware."""
+
+import gzip
+import os
+import shutil
+import tempfile
+
+from StringIO import StringIO
+from unittest import TestCase
+
+from twisted.internet import defer
+from twisted.trial import unittest
+from scrapy.core.downloader.middleware import DownloaderMiddlewareManager
+from scrapy.crawler import Crawler
+from scrapy.http import Request, Response
+from scrapy.settings import CrawlerSettings
+from scrapy.spider import BaseSpider
+
+from checklists_scrapers import settings
+from checklists_scrapers.middleware import APICacheMiddleware
+from checklists_scrapers.tests.utils import response_for_content
+
+
+class APICacheMiddlewareTestCase(TestCase):
+    """Verify responses from the API are cached."""
+
+    def setUp(self):
+        """Initialize the test."""
+        self.directory = tempfile.mkdtemp()
+        self.spider = BaseSpider('test')
+        crawler = Crawler(CrawlerSettings(settings))
+        crawler.configure()
+        self.stats = crawler.stats
+        self.stats.open_spider(self.spider)
+        self.middleware = APICacheMiddleware(
+            os.path.join(self.directory, 'cache'), 3600, 1024, self.stats)
+        self.middleware.spider_opened(self.spider)
+        self.url = 'http://example.com/api?r=L0000001'
+        self.request = Request(self.url, meta={'cache': True})
+
+    def tearDown(self):
+        """Remove the cache."""
+        shutil.rmtree(self.directory)
+
+    def download(self, request, content='[]'):
+        """Pass a request and the response through the middleware."""
+        response = self.middleware.process_request(request, self.spider)
+        if response is None:
+            response = response_for_content(content, 'utf-8', url=request.url)
+            response = self.middleware.process_response(
+                request, response, self.spider)
+        return response
+
+    def get_stat(self, name):
+        """Get the value of a stat recorded by the middleware."""
+        return self.stats.get_value('checklists/cache/' + name, 0,
+                                    spider=self.spider)
+
+    def test_cache_hit(self):
+        """Verify a cached response is returned for the same URL."""
+        self.download(self.request, '[{"locID": "L0000001"}]')
+        response = self.download(self.request, '[]')
+        self.assertEqual('[{"locID": "L0000001"}]', response.body)
+        self.assertEqual(1, self.get_stat('hits'))
+        self.assertEqual(1, self.get_stat('misses'))
+
+    def test_not_cached(self):
+        """Verify requests not marked for caching are ignored."""
+        request = Request(self.url)
+        self.download(request)
+        self.assertIsNone(
+            self.middleware.process_request(request, self.spider))
+        self.assertFalse(os.listdir(self.middleware.directory))
+
+    def test_expired(self):
+        """Verify a response is downloaded again once it has expired."""
+        self.download(self.request, '[1]')
+        self.middleware.expiration = 0
+        self.assertIsNone(
+            self.middleware.process_request(self.request, self.spider))
+
+    def test_eviction(self):
+        """Verify the least recently used responses are removed."""
+        content = '[%s]' % ('0,' * 300)[:-1]
+        for idx in range(5):
+            request = Request(self.url + str(idx), meta={'cache': True})
+            self.download(request, content)
+        self.assertTrue(self.middleware.total <= self.middleware.size)
+        self.assertIsNone(self.middleware.process_request(
+            Request(self.url + '0', meta={'cache': True}), self.spider))
+
+
+class MiddlewareChainTestCase(unittest.TestCase):
+    """Verify the cache works with the other downloader middleware.
+
+    The responses are passed through the middleware enabled in the project
+    settings, as they are when the spiders run, using the reactor so this
+    is a trial test case.
+    """
+
+    def setUp(self):
+        """Initialize the test."""
+        self.directory = tempfile.mkdtemp()
+        self.spider = BaseSpider('test')
+        crawler = Crawler(CrawlerSettings(settings))
+        crawler.settings.overrides['API_CACHE_ENABLED'] = True
+        crawler.settings.overrides['API_CACHE_DIR'] = self.directory
+        crawler.configure()
+        crawler.stats.open_spider(self.spider)
+        self.manager = DownloaderMiddlewareManager.from_crawler(crawler)
+        for middleware in self.manager.middlewares:
+            if isinstance(middleware, APICacheMiddleware):
+                middleware.spider_opened(self.spider)
+        self.request = Request('http://example.com/api?r=L0000001',
+                               meta={'cache': True})
+        self.content = '[{"locID": "L0000001"}]'
+
+    def tearDown(self):
+        """Remove the cache."""
+        shutil.rmtree(self.directory)
+
+    def compress(self, request, spider):
+        """Return the content as a gzip-encoded response."""
+        buf = StringIO()
+        with gzip.GzipFile(fileobj=buf, mode='wb') as fp:
+            fp.write(self.content)
+        return Response(url=request.url, body=buf.getvalue(), headers={
+            'Content-Type': 'application/json',
+            'Content-Encoding': 'gzip',
+        })
+
+    def not_downloaded(self, request, spider):
+        """Fail if the response was not read from the cache."""
+        self.fail("Response was not read from the cache")
+
+    def download(self, download_func):
+        """Pass a request through the chain of middleware."""
+        return self.manager.download(download_func, self.request.copy(),
+                                     self.spider)
+
+    @defer.inlineCallbacks
+    def test_compressed(self):
+        """Verify the decompressed body is cached."""
+        response = yield self.download(self.compress)
+        self.assertEqual(self.content, response.body)
+        response = yield self.download(self.not_downloaded)
+        self.assertTrue('cached' in response.flags)
+        self.assertEqual(self.content, response.body)
@@ -0,0 +1,102 @@
+"""Tests for moving the downloaded checklists to a different layout."""
+
+import json
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from checklists_scrapers.migrate import migrate
+from checklists_scrapers.utils import list_files
+
+
+class MigrateTestCase(TestCase):
+    """Verify the checklist files are moved to the new layout."""
+
+    def setUp(self):
+        """Initialize the test."""
+        self.directory = tempfile.mkdtemp()
+        for source, identifier in [('eBird', 'S0000001'),
+                                   ('worldbirds', '1001')]:
+            path = os.path.join(self.directory, '%s-%s.json' % (
+                source, identifier))
+            with open(path, 'wb') as fp:
+                json.dump({'identifier': identifier, 'date': '2013-03-27'},
+                          fp)
+
+    def tearDown(self):
+        """Remove the files."""
+        shutil.rmtree(self.directory)
+
+    def get_paths(self):
+        """Get the paths of the files relative to the directory."""
+        return sorted(os.path.relpath(path, self.directory)
+                      for path in list_files(self.directory, '.json'))
+
+    def test_date(self):
+        """Verify the files are moved to a directory for each date."""
+        self.assertEqual(2, migrate(self.directory, 'date'))
+        self.assertEqual(
+            [os.path.join('eBird', '2013', '03', '27', 'eBird-S0000001.json'),
+             os.path.join('worldbirds', '2013', '03', '27',
+                          'worldbirds-1001.json')],
+            self.get_paths())
+
+    def test_flat(self):
+        """Verify the files are moved back and empty directories removed."""
+        migrate(self.directory, 'hash')
+        self.assertEqual(2, migrate(self.directory, 'flat'))
+        self.assertEqual(['eBird-S0000001.json', 'worldbirds-1001.json'],
+                         sorted(os.listdir(self.directory)))
+
+    def test_unchanged(self):
+        """Verify files already in the layout are not moved."""
+        migrate(self.directory, 'hash')
+        self.assertEqual(0, migrate(self.directory, 'hash'))
+
+    def test_list_source(self):
+        """Verify only the files for a source are listed."""
+        migrate(self.directory, 'date')
+        self.assertEqual(
+            ['eBird-S0000001.json'],
+            [os.path.basename(path) for path in
+             list_files(self.directory, '.json', source='eBird')])
+
+    def write(self, path, comment, mtime):
+        """Write a checklist with a comment and set its modification time."""
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(path, 'wb') as fp:
+            json.dump({'identifier': 'S0000001', 'date': '2013-03-27',
+                       'comment': comment}, fp)
+        os.utime(path, (mtime, mtime))
+
+    def read_comment(self, path):
+        """Read the comment from a checklist."""
+        with open(os.path.join(self.directory, path), 'rb') as fp:
+            return json.load(fp)['comment']
+
+    def test_newer_target_kept(self):
+        """Verify a newer file in the new layout is not overwritten."""
+        flat = os.path.join(self.directory, 'eBird-S0000001.json')
+        target = os.path.join(self.directory, 'eBird', '2013', '03', '27',
+                              'eBird-S0000001.json')
+        self.write(flat, 'Stale', 1000000000)
+        self.write(target, 'Fresh', 1100000000)
+        duplicates = []
+        self.assertEqual(1, migrate(self.directory, 'date', duplicates))
+        self.assertEqual([flat], duplicates)
+        self.assertEqual('Fresh', self.read_comment(target))
+        self.assertFalse(os.path.exists(flat))
+
+    def test_newer_file_moved(self):
+        """Verify a file newer than the one in the new layout replaces it."""
+        flat = os.path.join(self.directory, 'eBird-S0000001.json')
+        target = os.path.join(self.directory, 'eBird', '2013', '03', '27',
+                              'eBird-S0000001.json')
+        self.write(flat, 'Fresh', 1100000000)
+        self.write(target, 'Stale', 1000000000)
+        self.assertEqual(2, migrate(self.directory, 'date'))
+        self.assertEqual('Fresh', self.read_comment(target))
@@ -0,0 +1,45 @@
+"""Tests for the item pipelines."""
+
+import os
+import shutil
+import tempfile
+
+from twisted.trial import unittest
+
+from scrapy.spider import BaseSpider
+
+from checklists_scrapers.pipelines import WriterPipeline
+from checklists_scrapers.spiders.writers import FileWriter, ThreadedWriter
+
+
+class WriterPipelineTestCase(unittest.TestCase):
+    """Verify the spider's writer is closed with the pipeline.
+
+    The ThreadedWriter returns a Deferred when it is closed so this is a
+    trial test case.
+    """
+
+    def setUp(self):
+        """Initialize the test."""
+        self.directory = tempfile.mkdtemp()
+        self.spider = BaseSpider('test')
+        self.pipeline = WriterPipeline()
+
+    def tearDown(self):
+        """Remove the files written."""
+        shutil.rmtree(self.directory)
+
+    def test_close(self):
+        """Verify the queued checklists are written when the spider closes."""
+        self.spider.writer = ThreadedWriter(FileWriter(self.directory), 2, 10)
+        for idx in range(5):
+            self.spider.writer.write('eBird', {'identifier': 'S%07d' % idx,
+                                               'date': '2013-03-27'})
+        deferred = self.pipeline.close_spider(self.spider)
+        deferred.addCallback(lambda _: self.assertEqual(
+            5, len(os.listdir(self.directory))))
+        return deferred
+
+    def test_no_writer(self):
+        """Verify spiders which have not saved any checklists are ignored."""
+        self.assertEqual(None, self.pipeline.close_spider(self.spider))
@@ -1,22 +1,151 @@
 """Utility functions used across the application."""
 
+import bz2
+import gzip
+import hashlib
+import json
 import os
 
 
-def list_files(root_dir, ext):
+# The extension added to the name of the files written with each of the
+# values for the DOWNLOAD_COMPRESSION setting.
+COMPRESSION = {
+    '': '',
+    'gzip': '.gz',
+    'bz2': '.bz2',
+}
+
+# The values for the DOWNLOAD_LAYOUT setting which controls where in
+# DOWNLOAD_DIR the file for each checklist is written.
+LAYOUTS = ('flat', 'date', 'hash')
+
+
+def open_file(path, mode='rb'):
+    """Open a file, compressing or decompressing it based on the extension.
+
+    Args:
+        path (str): the path to the file. Files ending in .gz are opened with
+            gzip and files ending in .bz2 are opened with bz2.
+
+    Kwargs:
+        mode (str): the mode used to open the file.
+
+    Returns:
+        file: a file-like object.
+
+    The name and modification time are not recorded when writing gzip files
+    so the same data always gives the same file, whatever name it was first
+    written to.
+    """
+    if path.endswith(COMPRESSION['gzip']):
+        fp = open(path, mode)
+        gz = gzip.GzipFile('', mode, 9, fp, mtime=0)
+        # Close the underlying file along with the GzipFile.
+        gz.myfileobj = fp
+        return gz
+    elif path.endswith(COMPRESSION['bz2']):
+        return bz2.BZ2File(path, mode)
+    return open(path, mode)
+
+
+def get_shard(layout, source, identifier, date):
+    """Get the directory where the file for a checklist is written.
+
+    Args:
+        layout (str): the layout of the directory tree. With 'flat' all the
+            files are written to the root directory. With 'date' the files
+            are written to <source>/<yyyy>/<mm>/<dd> using the date of the
+            checklist. With 'hash' the files are written to <source>/<xx>/<yy>
+            using the first four hex digits of the MD5 digest of the
+            identifier, giving 65,536 directories for each source.
+        source (str): the name of the source, as used in the file names.
+        identifier (str): the identifier for the checklist.
+        date (str): the date of the checklist in the format YYYY-MM-DD. It
+            is only used by the 'date' layout. Checklists without a date are
+            written to the directory for the source.
+
+    Returns:
+        str: the path to the directory relative to the root directory.
+
+    Raises:
+        ValueError: if the layout is not one of LAYOUTS.
+    """
+    if layout == 'flat':
+        return ''
+    elif layout == 'date':
+        return os.path.join(source, *date.split('-')) if date else source
+    elif layout == 'hash':
+        digest = hashlib.md5(identifier.encode('utf-8')).hexdigest()
+        return os.path.join(source, digest[:2], digest[2:4])
+    raise ValueError("Unknown directory layout: %s" % layout)
+
+
+def list_files(root_dir, ext, source=None):
     """Return the list of files in a directory tree with a given extension.
 
     Args:
         root_dir (str): the path to the root directory.
         ext (str): the file extension
 
+    Kwargs:
+        source (str): only list the files for this source, e.g. eBird. The
+            walk skips the directories for the other sources so only the
+            files in the root directory and the source's own directory tree
+            are read.
+
     Returns:
         list(str): a list of paths to the files in the directory tree with
-        the matching file extension.
+        the matching file extension. Compressed files, e.g. with the extension
+        .json.gz when ext is .json, are also included. Hidden files, such as
+        the temporary files used while a checklist is being written, are
+        skipped.
     """
+    extensions = tuple(ext + suffix for suffix in COMPRESSION.values())
+    prefix = source + '-' if source else ''
     paths = []
     for path, dirs, files in os.walk(root_dir):
+        if source and path == root_dir:
+            dirs[:] = [name for name in dirs if name == source]
         for filename in files:
-            if filename.endswith(ext):
+            if filename.endswith(extensions) and \
+                    filename.startswith(prefix) and \
+                    not filename.startswith('.'):
                 paths.append(os.path.join(path, filename))
     return paths
+
+
+def read_json_lines(fp):
+    """Read the records from a file in JSON Lines format.
+
+    Args:
+        fp (file): the open file, e.g. a segment written by the spiders.
+
+    Returns:
+        generator: the records, decoded one line at a time so the file can
+            be streamed. Blank lines are skipped.
+    """
+    for line in fp:
+        if line.strip():
+            yield json.loads(line)
+
+
+def load_checklists(root_dir):
+    """Load the checklists written to a directory tree by the spiders.
+
+    Args:
+        root_dir (str): the path to the root directory.
+
+    Returns:
+        generator: the checklists from each JSON file followed by the
+            checklists from each JSON Lines segment, in the order the
+            segments were written. Compressed files are decompressed as
+            they are read.
+    """
+    for path in sorted(list_files(root_dir, '.json')):
+        with open_file(path) as fp:
+            yield json.load(fp)
+
+    for path in sorted(list_files(root_dir, '.jsonl')):
+        with open_file(path) as fp:
+            for checklist in read_json_lines(fp):
+                yield checklist